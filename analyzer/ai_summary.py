@@ -1,13 +1,29 @@
+import argparse
+import json
 import os
 import pandas as pd
 from glob import glob
 from datetime import datetime
 
+from report_registry import default_registry
+from rollups import default_rollups
+from sketches import merge_files
+from report_store import default_store
+
 REPORTS_DIR = "reports"
-OUTPUT_FILE = os.path.join(REPORTS_DIR, f"ai_summary_{datetime.now():%Y%m%d_%H%M%S}.txt")
+SUMMARY_COLUMNS = ["source_ip", "attack_type", "country", "command"]
+AGGREGATES_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               "reports", "state", "incremental_state.json")
 
 def load_latest_report():
-    """Load the most recent CSV report."""
+    """Load the threat report from the store (only the summarized columns).
+
+    Falls back to the most recent CSV dump for trees without a store yet.
+    """
+    store = default_store()
+    if store.parts("threat"):
+        print(f"[+] Loaded threat report from store: {store.root}")
+        return store.read("threat", columns=SUMMARY_COLUMNS)
     files = glob(os.path.join(REPORTS_DIR, "*.csv"))
     if not files:
         print("[!] No reports found to analyze.")
@@ -16,67 +32,135 @@ def load_latest_report():
     print(f"[+] Loaded latest report: {latest}")
     return pd.read_csv(latest)
 
+def load_aggregates():
+    """Load the persisted aggregates kept by incremental.py, if any."""
+    try:
+        with open(AGGREGATES_FILE, "r", encoding="utf-8") as f:
+            aggregates = json.load(f)["aggregates"]
+    except (FileNotFoundError, KeyError, json.JSONDecodeError):
+        return None
+    print(f"[+] Loaded incremental aggregates: {AGGREGATES_FILE}")
+    return aggregates
+
+def load_rollups():
+    """The pipeline's rollup tables, if they hold any events."""
+    store = default_rollups()
+    if store.is_empty():
+        return None
+    print(f"[+] Loaded rollups: {store.path}")
+    return store
+
+def top(counts, n=None):
+    return sorted(counts.items(), key=lambda kv: kv[1], reverse=True)[:n]
+
 def summarize_attacks(df):
     """Generate a human-readable summary of attack patterns."""
+    counts = {}
+    for key in ("source_ip", "attack_type", "country", "command"):
+        if key in df.columns:
+            counts[key] = df[key].value_counts().to_dict()
+    return summarize_counts(len(df), counts)
+
+def summarize_aggregates(aggregates):
+    """Same summary, built from incremental aggregates instead of a report."""
+    counts = {key: aggregates[key] for key in ("source_ip", "attack_type", "country", "command")
+              if key in aggregates}
+    return summarize_counts(aggregates.get("events", 0), counts)
+
+def summarize_rollups(store, stats=None):
+    """Same summary from the all-time rollups; cost doesn't grow with the number of events."""
+    limits = {"source_ip": 5, "attack_type": None, "country": 5, "command": 5}
+    counts = {key: store.counts(key, limit=n) for key, n in limits.items()}
+    return summarize_counts(store.totals(), counts, stats)
+
+def summarize_sketches(stats):
+    """Same summary from streaming sketches (approximate counts, e.g. merged from several nodes)."""
+    counts = {key: stats.top(key) for key in ("source_ip", "country", "command") if key in stats.heavy}
+    return summarize_counts(stats.events, counts, stats)
+
+def summarize_counts(total_attacks, counts, stats=None):
+    """Format the summary from per-column value counts (plus sketch estimates, if given)."""
     summary = []
-    total_attacks = len(df)
 
     summary.append(f"📅 Report Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     summary.append(f"⚔️ Total Attack Attempts: {total_attacks}")
+    if stats is not None and stats.events:
+        summary.append(f"👥 Distinct Attacker IPs: ~{stats.distinct_ips():,}")
+        if stats.durations.n:
+            summary.append(f"⏳ Session Length: median {stats.durations.quantile(0.5):.0f}s, "
+                           f"p95 {stats.durations.quantile(0.95):.0f}s; "
+                           f"median {stats.commands.quantile(0.5):.0f} commands per session")
 
-    if 'source_ip' in df.columns:
-        top_ips = df['source_ip'].value_counts().head(5)
+    if 'source_ip' in counts:
         summary.append("\n🌍 Top Attacker IPs:")
-        for ip, count in top_ips.items():
+        for ip, count in top(counts['source_ip'], 5):
             summary.append(f"  - {ip} ➜ {count} attempts")
 
-    if 'attack_type' in df.columns:
-        top_attacks = df['attack_type'].value_counts()
+    if 'attack_type' in counts:
         summary.append("\n🧠 Attack Type Breakdown:")
-        for atype, count in top_attacks.items():
+        for atype, count in top(counts['attack_type']):
             pct = (count / total_attacks) * 100
             summary.append(f"  - {atype}: {count} ({pct:.1f}%)")
 
-    if 'country' in df.columns:
-        top_countries = df['country'].value_counts().head(5)
+    if 'country' in counts:
         summary.append("\n🌎 Top Source Countries:")
-        for c, count in top_countries.items():
+        for c, count in top(counts['country'], 5):
             summary.append(f"  - {c}: {count} attacks")
 
-    if 'command' in df.columns:
-        common_cmds = df['command'].value_counts().head(5)
+    if 'command' in counts:
         summary.append("\n💻 Most Common Commands:")
-        for cmd, count in common_cmds.items():
+        for cmd, count in top(counts['command'], 5):
             summary.append(f"  - {cmd} ➜ {count} times")
 
     # Simple intelligence logic
     summary.append("\n🧩 AI Threat Intelligence Summary:")
-    if 'attack_type' in df.columns:
-        if (df['attack_type'] == 'Brute Force Attempt').sum() > (0.3 * total_attacks):
+    if 'attack_type' in counts:
+        attack_types = counts['attack_type']
+        if attack_types.get('Brute Force Attempt', 0) > (0.3 * total_attacks):
             summary.append("  ⚠️ High number of brute-force attempts detected — consider blocking suspicious IPs.")
-        if (df['attack_type'] == 'Malware Download Attempt').sum() > 0:
+        if attack_types.get('Malware Download Attempt', 0) > 0:
             summary.append("  🚨 Potential malware distribution attempt detected — inspect payloads carefully.")
-        if (df['attack_type'] == 'Reconnaissance').sum() > (0.2 * total_attacks):
+        if attack_types.get('Reconnaissance', 0) > (0.2 * total_attacks):
             summary.append("  🕵️ Numerous reconnaissance commands — possible scanning activity.")
         else:
             summary.append("  ✅ No major anomalies detected; system appears stable.")
 
     return "\n".join(summary)
 
-def main():
-    df = load_latest_report()
-    if df is None:
-        return
-
-    summary_text = summarize_attacks(df)
-
-    # Save to text file
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+def save_summary(summary_text):
+    """Save to a timestamped text file; returns its path."""
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    output_file = os.path.join(REPORTS_DIR, f"ai_summary_{datetime.now():%Y%m%d_%H%M%S}.txt")
+    with open(output_file, "w", encoding="utf-8") as f:
         f.write(summary_text)
+    default_registry().register("summary", path=output_file)
+    print(f"\n[+] AI Threat Summary saved to: {output_file}")
+    return output_file
+
+def main(from_report=False, sketch_files=None):
+    store = None if from_report or sketch_files else load_rollups()
+    aggregates = None if from_report or sketch_files or store else load_aggregates()
+    if sketch_files:
+        summary_text = summarize_sketches(merge_files(sketch_files))
+    elif store is not None:
+        summary_text = summarize_rollups(store)
+    elif aggregates is not None:
+        summary_text = summarize_aggregates(aggregates)
+    else:
+        df = load_latest_report()
+        if df is None:
+            return
+        summary_text = summarize_attacks(df)
 
-    print(f"\n[+] AI Threat Summary saved to: {OUTPUT_FILE}")
+    save_summary(summary_text)
     print("\n===== AI SUMMARY PREVIEW =====\n")
     print(summary_text)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Generate the AI threat summary")
+    parser.add_argument("--from-report", action="store_true",
+                        help="summarize the stored threat report instead of rollups/incremental aggregates")
+    parser.add_argument("--sketches", nargs="+", metavar="FILE",
+                        help="summarize sketch files (e.g. one per honeypot node), merged")
+    args = parser.parse_args()
+    main(from_report=args.from_report, sketch_files=args.sketches)
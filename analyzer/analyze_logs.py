@@ -1,56 +1,58 @@
-import json
-import pandas as pd
 from datetime import datetime
 import os
 
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-LOG_FILE = os.path.join(BASE_DIR, "logs", "attacks.log")
+from log_loader import LOG_FILE, LogCursor, iter_log_range
+from report_registry import default_registry
+from report_store import EXPORT_CSV, default_store, stored_until
+from sketches import StreamStats
 
 REPORTS_DIR = "reports"
 
 os.makedirs(REPORTS_DIR, exist_ok=True)
 
-def load_logs():
-    data = []
-    try:
-        with open(LOG_FILE, "r") as f:
-            for line in f:
-                line = line.strip()
-                if line:
-                    try:
-                        data.append(json.loads(line))
-                    except json.JSONDecodeError as e:
-                        print(f"[!] Skipping bad JSON: {e}")
-        return data
-    except FileNotFoundError:
-        print(f"[!] Log file not found: {LOG_FILE}")
-        return []
-
-def analyze_logs():
-    logs = load_logs()
-    if not logs:
+def store_new_events(path=LOG_FILE):
+    """Append the records logged since the last run to the attack report.
+
+    The log position is saved in the store together with each chunk, so a
+    crash between the two can't store a chunk twice.
+    """
+    store = default_store()
+    rows = 0
+    for chunk, position in LogCursor(dict(stored_until("attack", store)), path):
+        rows += store.append("attack", chunk, checkpoint={"until": position})
+    print(f"[+] attack report: {rows} new rows stored in {store.root}")
+    return rows
+
+def analyze_logs(path=LOG_FILE):
+    """Summarize the log one chunk at a time; memory stays bounded however long the history."""
+    if not LogCursor({}, path).exists():
+        print(f"[!] Log file not found: {path}")
+        return
+    stats = StreamStats()
+    for chunk in iter_log_range(path=path):
+        stats.update(chunk)
+    store_new_events(path)
+    if not stats.events:
         print("[!] No logs found.")
         return
 
-    df = pd.DataFrame(logs)
-
-    if 'timestamp' in df.columns:
-        df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-
     print("\n===== ATTACK SUMMARY =====")
-    print(f"Total attack attempts: {len(df)}")
+    print(f"Total attack attempts: {stats.events}")
+    print(f"Distinct attacker IPs: ~{stats.distinct_ips()}")
 
-    if 'ip' in df.columns:
-        print("\nTop Attacker IPs:")
-        print(df['ip'].value_counts().head(10))
+    print("\nTop Attacker IPs:")
+    for ip, count in stats.top("source_ip", 10).items():
+        print(f"  {ip:<20}{count}")
 
-    if 'command' in df.columns:
-        print("\nMost Common Commands:")
-        print(df['command'].value_counts().head(10))
+    print("\nMost Common Commands:")
+    for command, count in stats.top("command", 10).items():
+        print(f"  {command:<20}{count}")
 
-    csv_path = os.path.join(REPORTS_DIR, f"attack_report_{datetime.now():%Y%m%d_%H%M%S}.csv")
-    df.to_csv(csv_path, index=False)
-    print(f"\n[+] Report saved to: {csv_path}")
+    if EXPORT_CSV:
+        csv_path = os.path.join(REPORTS_DIR, f"attack_report_{datetime.now():%Y%m%d_%H%M%S}.csv")
+        default_store().export_csv("attack", csv_path)
+        default_registry().register("attack", csv=csv_path)
+        print(f"[+] CSV copy saved to: {csv_path}")
 
 if __name__ == "__main__":
-    analyze_logs()
\ No newline at end of file
+    analyze_logs()
@@ -0,0 +1,316 @@
+import argparse
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import StandardScaler
+
+from log_loader import BASE_DIR, LOG_FILE, LogCursor
+from report_store import default_store
+from session_analyzer import FEATURE_COLUMNS, run_sessions
+
+MODEL_FILE = os.path.join(BASE_DIR, "reports", "state", "anomaly_model.pkl")
+
+# Command text is hashed into a fixed-width sparse vector: no vocabulary to
+# fit, so a command never seen before still gets features (its character
+# n-grams). Changing these invalidates a saved model.
+HASH_FEATURES = 2 ** 14
+NGRAMS = (3, 5)
+# Per-event behaviour next to the command vector, scaled and down-weighted
+# so the command text still dominates which cluster an event falls in
+CONTEXT_COLUMNS = ["command_length", "ip_events", "ip_distinct_ratio", "session_commands", "session_gap"]
+CONTEXT_WEIGHT = 0.25
+CONTEXT_CLIP = 3.0
+EVENT_CLUSTERS = 32
+SESSION_CLUSTERS = 8
+# anomaly_score is the distance to the nearest cluster centre in standard
+# deviations above the mean distance seen so far; this many flags a row
+# (distances are heavy-tailed, so 3 would flag ordinary traffic too)
+ANOMALY_THRESHOLD = 5.0
+
+_vectorizer = HashingVectorizer(analyzer="char_wb", ngram_range=NGRAMS, n_features=HASH_FEATURES,
+                                alternate_sign=False, lowercase=True)
+
+
+class OnlineScorer:
+    """Clusters with MiniBatchKMeans.partial_fit and scores rows by distance to the nearest centre.
+
+    ``score_and_learn`` scores a batch against the model as it was *before*
+    the batch, then trains on it, so each run only trains on new rows and
+    anything unlike the history scores high. Dense columns are
+    standardized by an incrementally fitted scaler (and optionally capped at
+    ``dense_clip`` deviations, so they can shift a score but not make one
+    on their own). Until there are enough
+    rows to seed the clusters they are held back and scored NaN.
+    """
+
+    def __init__(self, n_clusters, dense_weight=1.0, dense_clip=None, seed=0):
+        self.kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=seed, n_init=1)
+        self.scaler = StandardScaler()
+        self.dense_weight = dense_weight
+        self.dense_clip = dense_clip
+        self.fitted = False
+        self.pending = None
+        self.trained = 0
+        # Running mean/variance of nearest-centre distances
+        self.count, self.mean, self.m2 = 0, 0.0, 0.0
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, d):
+        scorer = cls.__new__(cls)
+        scorer.__dict__.update(d)
+        return scorer
+
+    def _matrix(self, dense, sparse=None):
+        self.scaler.partial_fit(dense)
+        scaled = np.nan_to_num(self.scaler.transform(dense))
+        if self.dense_clip is not None:
+            scaled = scaled.clip(-self.dense_clip, self.dense_clip)
+        scaled *= self.dense_weight
+        return scaled if sparse is None else sp.hstack([sparse, sp.csr_matrix(scaled)], format="csr")
+
+    def _observe(self, distances):
+        """Fold a batch of distances into the running mean/variance (Chan et al. parallel update)."""
+        n, batch_mean = len(distances), distances.mean()
+        delta = batch_mean - self.mean
+        total = self.count + n
+        self.m2 += ((distances - batch_mean) ** 2).sum() + delta ** 2 * self.count * n / total
+        self.mean += delta * n / total
+        self.count = total
+
+    def std(self):
+        return (self.m2 / self.count) ** 0.5 if self.count > 1 else 0.0
+
+    def _learn(self, X, timings):
+        start = time.perf_counter()
+        self.kmeans.partial_fit(X)
+        self.trained += X.shape[0]
+        timings["train"] = timings.get("train", 0.0) + time.perf_counter() - start
+
+    def score_and_learn(self, dense, sparse=None, timings=None):
+        """Anomaly scores for the rows (NaN while warming up); the model learns them afterwards."""
+        timings = {} if timings is None else timings
+        X = self._matrix(dense, sparse)
+        learn = X
+        if not self.fitted:
+            if self.pending is not None:
+                learn = sp.vstack([self.pending, X], format="csr") if sp.issparse(X) else np.vstack([self.pending, X])
+            if learn.shape[0] < self.kmeans.n_clusters:
+                self.pending = learn
+                return np.full(X.shape[0], np.nan)
+            # Seed the clusters first; this first batch is scored against itself
+            self._learn(learn, timings)
+            self.fitted, self.pending, learn = True, None, None
+
+        start = time.perf_counter()
+        distances = self.kmeans.transform(X).min(axis=1)
+        first = not self.count
+        if first:
+            self._observe(distances)
+        scores = (distances - self.mean) / (self.std() or 1.0)
+        if not first:
+            self._observe(distances)
+        timings["score"] = timings.get("score", 0.0) + time.perf_counter() - start
+
+        if learn is not None:
+            self._learn(learn, timings)
+        return scores
+
+
+def event_features(df):
+    """(dense context features, hashed command matrix) for a chunk of log events.
+
+    Context is measured within the chunk: how busy the source IP is and how
+    varied its commands are, and how long and how fast its session runs
+    (the session id, or the IP for logs without one).
+    """
+    command = df["command"]
+    if not isinstance(command.dtype, pd.CategoricalDtype):
+        command = command.astype("category")
+    # Hash each distinct command once; events share their command's row
+    used, inverse = np.unique(command.cat.codes.to_numpy(), return_inverse=True)
+    categories = command.cat.categories
+    texts = ["" if code < 0 else str(categories[code]) for code in used]
+    hashed = _vectorizer.transform(texts)[inverse]
+    lengths = np.array([len(t) for t in texts], dtype=float)[inverse]
+
+    ip = df["source_ip"].astype(str)
+    session = df["session_id"].astype(object).where(df["session_id"].notna(), ip) \
+        if "session_id" in df.columns else ip
+    seconds = (df["timestamp"] - pd.Timestamp(0)).dt.total_seconds()
+    frame = pd.DataFrame({"ip": ip.to_numpy(), "session": session.to_numpy(), "code": inverse,
+                          "seconds": seconds.to_numpy()})
+    by_ip = frame.groupby("ip", sort=False)
+    ip_events = by_ip["code"].transform("size")
+    by_session = frame.groupby("session", sort=False)["seconds"]
+    session_commands = by_session.transform("size")
+    span = by_session.transform("max") - by_session.transform("min")
+    dense = np.column_stack([
+        np.log1p(lengths),
+        np.log1p(ip_events),
+        by_ip["code"].transform("nunique") / ip_events,
+        np.log1p(session_commands),
+        np.log1p((span / (session_commands - 1).clip(lower=1)).fillna(0)),
+    ])
+    return dense, hashed
+
+
+def session_features(sessions):
+    return np.log1p(sessions[FEATURE_COLUMNS].astype(float).clip(lower=0).fillna(0).to_numpy())
+
+
+def empty_state():
+    return {
+        "checkpoint": {"inode": None, "offset": 0, "rotations": 0},
+        "hash_features": HASH_FEATURES, "ngrams": NGRAMS,
+        "events": OnlineScorer(EVENT_CLUSTERS, dense_weight=CONTEXT_WEIGHT / len(CONTEXT_COLUMNS) ** 0.5,
+                               dense_clip=CONTEXT_CLIP),
+        "sessions": OnlineScorer(SESSION_CLUSTERS),
+    }
+
+def load_state(path=MODEL_FILE):
+    try:
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        for key in ("events", "sessions"):
+            state[key] = OnlineScorer.from_dict(state[key])
+    except FileNotFoundError:
+        return empty_state()
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, KeyError, ValueError) as e:
+        print(f"[!] Can't load anomaly model ({e}) — retraining from the start of the log.")
+        return empty_state()
+    if state.get("hash_features") != HASH_FEATURES or tuple(state.get("ngrams", ())) != NGRAMS:
+        print("[*] Command hashing changed — retraining the anomaly model from the start of the log.")
+        return empty_state()
+    return state
+
+def save_state(state, path=MODEL_FILE):
+    """Models and log checkpoint are pickled together so they never disagree."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Scorers are saved as plain dicts of sklearn objects, so the file loads whichever way this module was run
+    state = {**state, "events": state["events"].to_dict(), "sessions": state["sessions"].to_dict()}
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def pending_path(model_file=MODEL_FILE):
+    return os.path.splitext(model_file)[0] + "_pending.pkl"
+
+def load_pending(path, checkpoint):
+    """Sessions handed to a run that died before saving the models, if it started at ``checkpoint``."""
+    try:
+        with open(path, "rb") as f:
+            pending = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, KeyError, ValueError) as e:
+        print(f"[!] Can't load pending anomaly sessions ({e}) — they won't be relearned.")
+        return None
+    return pending["sessions"] if pending.get("from") == checkpoint else None
+
+def save_pending(path, checkpoint, sessions):
+    """Keep this run's sessions until save_state, so a crash doesn't lose them (run_sessions won't resend them)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump({"from": checkpoint, "sessions": sessions}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def _flagged(rows, scope, scores, command=False):
+    hits = scores >= ANOMALY_THRESHOLD
+    if not hits.any():
+        return None
+    rows = rows[hits]
+    return pd.DataFrame({
+        "timestamp": rows["timestamp"].to_numpy(),
+        "scope": scope,
+        "source_ip": rows["source_ip"].astype(str).to_numpy(),
+        "session_id": rows["session_id"].astype(object).to_numpy() if "session_id" in rows.columns else None,
+        "command": rows["command"].astype(object).to_numpy() if command else None,
+        "anomaly_score": scores[hits].round(2),
+    })
+
+def run_anomaly(full=False, log_file=LOG_FILE, model_file=MODEL_FILE, sessions=None, store=None):
+    """Score newly appended events (and newly finished ``sessions``), then train on them.
+
+    Events and sessions scoring at least ANOMALY_THRESHOLD go to the
+    ``anomaly`` report; returns them as a DataFrame.
+    """
+    store = store or default_store()
+    state = empty_state() if full else load_state(model_file)
+    if not LogCursor(state["checkpoint"], log_file).exists():
+        print(f"[!] Log file not found: {log_file}")
+        return pd.DataFrame()
+
+    pending_file = pending_path(model_file)
+    pending = None if full else load_pending(pending_file, state["checkpoint"])
+    batch = None if full else store.checkpoint("anomaly")
+    if batch and batch["from"] == state["checkpoint"]:
+        # The last run stored its anomalies but died before saving the models: relearn its events
+        # and sessions without storing them
+        replay = LogCursor(dict(state["checkpoint"]), log_file, until=batch["until"])
+        for chunk, _ in replay:
+            state["events"].score_and_learn(*event_features(chunk))
+        if pending is not None and len(pending):
+            state["sessions"].score_and_learn(session_features(pending))
+        state["checkpoint"].update(replay.position)
+    elif pending is not None and len(pending):
+        # It died before storing anything: its sessions are scored again with this run's
+        sessions = pending if sessions is None else pd.concat([pending, sessions], ignore_index=True)
+    since = dict(state["checkpoint"])
+    if sessions is not None and len(sessions):
+        save_pending(pending_file, since, sessions)
+    cursor = LogCursor(state["checkpoint"], log_file)
+    timings, flagged, events = {}, [], 0
+    for chunk, _ in cursor:
+        start = time.perf_counter()
+        dense, hashed = event_features(chunk)
+        timings["score"] = timings.get("score", 0.0) + time.perf_counter() - start
+        scores = state["events"].score_and_learn(dense, hashed, timings)
+        flagged.append(_flagged(chunk, "command", scores, command=True))
+        events += len(chunk)
+    session_count = 0 if sessions is None else len(sessions)
+    if session_count:
+        scores = state["sessions"].score_and_learn(session_features(sessions), timings=timings)
+        flagged.append(_flagged(sessions, "session", scores))
+
+    state["checkpoint"].update(cursor.position)
+    flagged = [f for f in flagged if f is not None]
+    report = pd.concat(flagged, ignore_index=True) if flagged else pd.DataFrame()
+    if not report.empty:
+        # Stored with the log range they came from, so a crash before save_state can't store them twice
+        store.append("anomaly", report,
+                     checkpoint={"from": since, "until": dict(cursor.position)})
+    save_state(state, model_file)
+    if os.path.exists(pending_file):
+        os.remove(pending_file)
+
+    rows = events + session_count
+    score_rate = rows / timings["score"] if timings.get("score") else 0
+    train_rate = rows / timings["train"] if timings.get("train") else 0
+    print(f"[+] Anomaly: {events} events, {session_count} sessions scored ({score_rate:,.0f}/s), "
+          f"trained ({train_rate:,.0f}/s); {len(report)} flagged "
+          f"(model has seen {state['events'].trained} events, {state['sessions'].trained} sessions)")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score new events and sessions against online-trained clusters")
+    parser.add_argument("--full", action="store_true", help="discard the models and retrain from the oldest segment")
+    args = parser.parse_args()
+
+    report = run_anomaly(full=args.full, sessions=run_sessions(full=args.full))
+    if not report.empty:
+        top = report.sort_values("anomaly_score", ascending=False).head(10)
+        print(top[["timestamp", "scope", "source_ip", "command", "anomaly_score"]].to_string(index=False))
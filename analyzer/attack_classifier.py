@@ -0,0 +1,93 @@
+import json
+import os
+import re
+
+import pandas as pd
+
+RULES_FILE = os.environ.get("ATTACK_RULES_FILE",
+                            os.path.join(os.path.dirname(os.path.abspath(__file__)), "attack_rules.json"))
+
+# Keywords only match as whole tokens: "ls" hits "ls -la" and "/bin/ls" but not "else"
+KEYWORD_TEMPLATE = r"(?<![a-z]){}(?![a-z])"
+
+MEMO_SIZE = 100_000
+
+
+def load_rules(path=RULES_FILE):
+    """Load classification rules from JSON (or YAML when PyYAML is installed)."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+class AttackClassifier:
+    """Rule-based command classifier backed by one combined regex.
+
+    Rules are tried in file order: the first rule (lowest index) with any
+    matching keyword or pattern decides the attack type. All rules are
+    compiled into a single alternation of zero-width lookaheads, so one
+    scan finds every rule that matches at any position. Results are
+    memoized per distinct command.
+    """
+
+    def __init__(self, rules):
+        self.default = rules.get("default", "General Probe")
+        self.empty = rules.get("empty", "Unknown")
+        self.labels = []
+        alternatives = []
+        for i, rule in enumerate(rules["rules"]):
+            parts = [KEYWORD_TEMPLATE.format(re.escape(k.lower())) for k in rule.get("keywords", [])]
+            parts += rule.get("patterns", [])
+            if parts:
+                alternatives.append(f"(?P<r{i}>{'|'.join(parts)})")
+            self.labels.append(rule["attack_type"])
+        self.pattern = re.compile(f"(?=(?:{'|'.join(alternatives)}))") if alternatives else None
+        self._memo = {}
+
+    def _match(self, cmd):
+        best = None
+        for m in self.pattern.finditer(cmd):
+            i = int(m.lastgroup[1:])
+            if best is None or i < best:
+                best = i
+                if best == 0:
+                    break
+        return self.default if best is None else self.labels[best]
+
+    def classify(self, command):
+        if not isinstance(command, str) or not command:
+            return self.empty
+        label = self._memo.get(command)
+        if label is None:
+            label = self._match(command.lower()) if self.pattern else self.default
+            if len(self._memo) >= MEMO_SIZE:
+                self._memo.clear()
+            self._memo[command] = label
+        return label
+
+    def classify_series(self, series):
+        """Classify each distinct command once and broadcast back to the rows."""
+        codes, uniques = pd.factorize(series)
+        labels = [self.classify(c) for c in uniques] + [self.empty]
+        categories = list(dict.fromkeys(labels))
+        lookup = pd.Series(range(len(categories)), index=categories)
+        label_codes = lookup[labels].to_numpy()
+        codes = codes.copy()
+        codes[codes < 0] = len(uniques)
+        return pd.Series(pd.Categorical.from_codes(label_codes[codes], categories),
+                         index=series.index, name="attack_type")
+
+
+_default = None
+
+def default_classifier():
+    global _default
+    if _default is None:
+        _default = AttackClassifier(load_rules())
+    return _default
+
+def classify_command(command):
+    """Attack type for a single command (used for live tagging in the honeypot)."""
+    return default_classifier().classify(command)
@@ -1,88 +1,143 @@
-import json
-import pandas as pd
-import requests
+import argparse
+import hashlib
 import os
 from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import plotly
 import plotly.express as px
+from plotly.offline import get_plotlyjs
+
+from geoip import GEO_FIELDS, resolve_locations
+from log_loader import BASE_DIR
+from report_registry import default_registry
+from report_store import default_store, save_report, unstored_events
 
 # Base paths
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-LOG_FILE = os.path.join(BASE_DIR, "logs", "attacks.log")
 REPORTS_DIR = os.path.join(BASE_DIR, "reports")
 
 # Make sure reports folder exists
 os.makedirs(REPORTS_DIR, exist_ok=True)
 
-def load_logs():
-    data = []
-    try:
-        with open(LOG_FILE, "r") as f:
-            for line in f:
-                try:
-                    data.append(json.loads(line.strip()))
-                except:
-                    continue
-    except FileNotFoundError:
-        print(f"[!] Log file not found at {LOG_FILE}")
-        return pd.DataFrame()
-    return pd.DataFrame(data)
+MAP_FILE = os.path.join(REPORTS_DIR, "attack_map.html")
+# plotly.js is written once next to the map (versioned name) instead of inlined in every map
+PLOTLY_JS = f"plotly-{plotly.__version__}.min.js"
+# Points are binned on a GRID_DEGREES lat/lon grid; only the MAX_BINS busiest bins are drawn
+GRID_DEGREES = float(os.environ.get("GEO_MAP_GRID", 1.0))
+MAX_BINS = 5000
 
 def get_location(ip):
     """Fetch location data for a given IP address."""
-    try:
-        # Skip private or localhost IPs
-        if ip.startswith("192.") or ip.startswith("10.") or ip.startswith("172.") or ip == "127.0.0.1":
-            return None
-        response = requests.get(f"http://ip-api.com/json/{ip}?fields=country,regionName,city,lat,lon,status")
-        info = response.json()
-        if info.get("status") == "success":
-            return info
-        else:
-            return None
-    except Exception as e:
-        print(f"[!] Geo lookup failed for {ip}: {e}")
-        return None
-
-def analyze_geo():
-    df = load_logs()
-    if df.empty or "source_ip" not in df.columns:
-        print("[!] No IPs found in logs.")
-        return
-
-    # Fetch and attach location info
-    df["location"] = df["source_ip"].apply(get_location)
-    df = df.dropna(subset=["location"])
+    return resolve_locations([ip]).get(ip)
 
-    # Extract fields
-    df["country"] = df["location"].apply(lambda x: x["country"])
-    df["region"] = df["location"].apply(lambda x: x["regionName"])
-    df["city"] = df["location"].apply(lambda x: x["city"])
-    df["lat"] = df["location"].apply(lambda x: x["lat"])
-    df["lon"] = df["location"].apply(lambda x: x["lon"])
+def enrich_geo(df):
+    """Attach location columns; rows whose IP cannot be located are dropped."""
+    # One lookup per distinct IP (cached on disk); the fields are tabulated per
+    # IP and broadcast back to the rows through the category codes
+    ips = df["source_ip"].astype("category")
+    locations = resolve_locations(ips.cat.categories)
+    fields = pd.DataFrame.from_dict({ip: info for ip, info in locations.items() if info},
+                                    orient="index", columns=GEO_FIELDS)
+    table = fields.reindex(ips.cat.categories.astype(object))
+    codes = ips.cat.codes.to_numpy()
+    located = (codes >= 0) & ips.cat.categories.isin(fields.index)[codes]
+    df = df[located].copy(deep=False)
+    codes = codes[located]
+    for field, column in zip(GEO_FIELDS, ["country", "region", "city", "lat", "lon"]):
+        df[column] = table[field].to_numpy()[codes]
+    return df
 
-    # Save updated report
+def save_geo_report(df, checkpoint=None):
     csv_path = os.path.join(REPORTS_DIR, f"geo_report_{datetime.now():%Y%m%d_%H%M%S}.csv")
-    df.to_csv(csv_path, index=False)
-    print(f"[+] Geo Report saved to: {csv_path}")
+    return save_report("geo", df, csv_path, checkpoint)
+
+def stored_locations():
+    """The columns the attack map needs, for every event in the geo report."""
+    return default_store().read("geo", columns=["source_ip", "country", "lat", "lon"])
 
-    # 🌍 Create map visualization
+def aggregate_locations(df, grid=GRID_DEGREES, max_bins=MAX_BINS):
+    """One row per lat/lon grid cell: event and IP counts, mean position, busiest country and IP."""
+    df = df.dropna(subset=["lat", "lon"])
+    # A single integer key per cell groups much faster than a (lat, lon) pair
+    columns = int(np.ceil(360 / grid)) + 1
+    lat, lon = df["lat"].to_numpy(), df["lon"].to_numpy()
+    cell = (np.floor(lat / grid) * columns + np.floor(lon / grid)).astype(np.int64)
+    ips = df["source_ip"].astype("category")
+    frame = pd.DataFrame({"cell": cell, "lat": lat, "lon": lon,
+                          "ip": ips.cat.codes.to_numpy(), "country": df["country"].astype(str).to_numpy()})
+    groups = frame.groupby("cell")
+    bins = groups.agg(lat=("lat", "mean"), lon=("lon", "mean"), events=("ip", "size"), unique_ips=("ip", "nunique"))
+    bins = bins.nlargest(max_bins, "events")
+    frame = frame[frame["cell"].isin(bins.index)]
+    for column, name in (("country", "top_country"), ("ip", "top_ip")):
+        counts = frame.groupby(["cell", column]).size().sort_values(ascending=False).reset_index()
+        bins[name] = counts.drop_duplicates("cell").set_index("cell")[column]
+    bins["top_ip"] = ips.cat.categories.astype(str)[bins["top_ip"].to_numpy()]
+    return bins.sort_values(["lat", "lon"], ignore_index=True)
+
+def map_hash(bins):
+    """Fingerprint of what the map shows; unchanged bins mean an unchanged map."""
+    digest = hashlib.sha256(f"{GRID_DEGREES}|{plotly.__version__}|".encode())
+    digest.update(bins.round(4).to_csv(index=False).encode())
+    return digest.hexdigest()
+
+def build_attack_map(df, map_path=MAP_FILE, show=False):
+    """Write the binned attacker map used by the dashboard; returns its path.
+
+    The HTML holds at most MAX_BINS markers and loads plotly.js from a
+    shared file next to it, so its size doesn't grow with the number of
+    events. It is only rewritten when the binned data changed.
+    """
+    bins = aggregate_locations(df)
+    data_hash = map_hash(bins)
+    registry = default_registry()
+    previous = registry.latest("map") or {}
+    unchanged = previous.get("data_hash") == data_hash and os.path.exists(map_path)
+    if unchanged and not show:
+        print(f"[*] Attack map unchanged ({len(bins)} bins) — not regenerated.")
+        return map_path
+
+    # 🌍 Create map visualization (marker area ~ events per cell)
     fig = px.scatter_geo(
-        df,
+        bins,
         lat="lat",
         lon="lon",
-        hover_name="source_ip",
-        hover_data=["country", "city", "command"],
-        title="🌍 Attacker Locations Map",
+        size="events",
+        size_max=40,
+        hover_name="top_country",
+        hover_data={"events": True, "unique_ips": True, "top_ip": True, "lat": False, "lon": False},
+        title=f"🌍 Attacker Locations Map ({int(bins['events'].sum())} events, {GRID_DEGREES:g}° grid)",
         projection="natural earth"
     )
 
-    # 💾 Save interactive map HTML for dashboard
-    map_path = os.path.join(REPORTS_DIR, "attack_map.html")
-    fig.write_html(map_path)
-    print(f"[+] Attack map saved to: {map_path}")
+    if not unchanged:
+        # 💾 Save interactive map HTML for dashboard
+        asset = os.path.join(os.path.dirname(map_path), PLOTLY_JS)
+        if not os.path.exists(asset):
+            with open(asset, "w", encoding="utf-8") as f:
+                f.write(get_plotlyjs())
+        fig.write_html(map_path, include_plotlyjs=PLOTLY_JS)
+        registry.register("map", path=map_path, data_hash=data_hash, bins=len(bins))
+        print(f"[+] Attack map saved to: {map_path} ({len(bins)} bins)")
 
-    # Also show map live for local viewing
-    fig.show()
+    if show:
+        fig.show()
+    return map_path
+
+def analyze_geo(show=True):
+    # Only events the geo report doesn't hold yet are located and appended
+    events, checkpoint = unstored_events("geo")
+    save_geo_report(enrich_geo(events), checkpoint)
+
+    df = stored_locations()
+    if df.empty:
+        print("[!] No located IPs in the geo report.")
+        return
+    # Also show map live for local viewing, unless running headless
+    build_attack_map(df, show=show)
 
 if __name__ == "__main__":
-    analyze_geo()
+    parser = argparse.ArgumentParser(description="Geo-locate attackers and build the attack map")
+    parser.add_argument("--no-show", action="store_true", help="don't open the map (headless servers)")
+    analyze_geo(show=not parser.parse_args().no_show)
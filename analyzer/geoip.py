@@ -0,0 +1,239 @@
+import csv
+import ipaddress
+import os
+import time
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from ip_filter import GLOBAL_LABELS, default_classifier
+from log_loader import BASE_DIR
+from reputation import TokenBucket
+from ttl_cache import SqliteTTLCache
+
+GEO_FIELDS = ["country", "regionName", "city", "lat", "lon"]
+
+# Offline range database (CSV or .mmdb); used before the HTTP service when set
+GEOIP_DB = os.environ.get("GEOIP_DB", "")
+# HTTP fallback; point at a stub server in tests
+GEOIP_URL = os.environ.get("GEOIP_URL", "http://ip-api.com")
+# ip-api.com allows 15 batch requests a minute per client address
+GEOIP_RATE_PER_MIN = float(os.environ.get("GEOIP_RATE_PER_MIN", 15))
+
+CACHE_FILE = os.path.join(BASE_DIR, "reports", "state", "geo_cache.sqlite")
+CACHE_TTL = 30 * 24 * 3600
+# Addresses no backend answered (timeouts, HTTP errors) are retried after this long
+FAILURE_TTL = 15 * 60
+CACHE_MAX_ENTRIES = 500_000
+
+
+class OfflineGeoBackend:
+    """IP range file loaded into sorted arrays and searched with bisect.
+
+    The CSV needs ``start``/``end`` columns (dotted addresses or integers)
+    plus any of country, regionName, city, lat, lon.
+    """
+
+    def __init__(self, path):
+        rows = []
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                start, end = _to_int(row["start"]), _to_int(row["end"])
+                info = {k: row.get(k, "") for k in GEO_FIELDS}
+                info["lat"] = float(info["lat"] or 0)
+                info["lon"] = float(info["lon"] or 0)
+                rows.append((start, end, info))
+        rows.sort(key=lambda r: r[0])
+        self.starts = [r[0] for r in rows]
+        self.ends = [r[1] for r in rows]
+        self.infos = [r[2] for r in rows]
+
+    def lookup(self, ip):
+        try:
+            value = int(ipaddress.ip_address(ip))
+        except ValueError:
+            return None
+        i = bisect_right(self.starts, value) - 1
+        if i >= 0 and value <= self.ends[i]:
+            return dict(self.infos[i])
+        return None
+
+    def lookup_many(self, ips):
+        return {ip: self.lookup(ip) for ip in ips}
+
+
+class MmdbGeoBackend:
+    """MaxMind .mmdb database (needs the optional ``maxminddb`` package)."""
+
+    def __init__(self, path):
+        import maxminddb
+        self.reader = maxminddb.open_database(path)
+
+    def lookup(self, ip):
+        try:
+            rec = self.reader.get(ip)
+        except ValueError:
+            return None
+        if not rec or "location" not in rec:
+            return None
+        return {
+            "country": rec.get("country", {}).get("names", {}).get("en", ""),
+            "regionName": (rec.get("subdivisions") or [{}])[0].get("names", {}).get("en", ""),
+            "city": rec.get("city", {}).get("names", {}).get("en", ""),
+            "lat": rec["location"].get("latitude"),
+            "lon": rec["location"].get("longitude"),
+        }
+
+    def lookup_many(self, ips):
+        return {ip: self.lookup(ip) for ip in ips}
+
+
+class HttpGeoBackend:
+    """ip-api.com style batch endpoint, queried with a few concurrent requests.
+
+    Requests go through a token bucket at the service's published rate; the
+    X-Rl (requests left) / X-Ttl (seconds to reset) headers and 429s pause
+    the bucket for every worker until the window resets.
+    """
+
+    def __init__(self, base_url=GEOIP_URL, batch_size=100, max_workers=4, timeout=10,
+                 rate_per_min=GEOIP_RATE_PER_MIN, max_retries=3):
+        self.base_url = base_url.rstrip("/")
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate_per_min / 60, capacity=rate_per_min)
+        self.session = requests.Session()
+
+    def _respect_quota(self, res):
+        remaining, ttl = res.headers.get("X-Rl"), res.headers.get("X-Ttl")
+        try:
+            if ttl is not None and (res.status_code == 429 or (remaining is not None and int(remaining) <= 0)):
+                self.bucket.pause_until(time.monotonic() + float(ttl))
+        except ValueError:
+            pass
+
+    def _batch(self, ips):
+        payload = [{"query": ip, "fields": "status,query," + ",".join(GEO_FIELDS)} for ip in ips]
+        for _ in range(self.max_retries):
+            self.bucket.acquire()
+            try:
+                res = self.session.post(f"{self.base_url}/batch", json=payload, timeout=self.timeout)
+                self._respect_quota(res)
+                if res.status_code == 429:
+                    continue
+                res.raise_for_status()
+                answers = res.json()
+            except (requests.RequestException, ValueError) as e:
+                print(f"[!] Geo lookup failed for {len(ips)} IPs: {e}")
+                return {}
+            break
+        else:
+            print(f"[!] Geo lookup rate-limited for {len(ips)} IPs")
+            return {}
+        return {a.get("query"): ({k: a.get(k) for k in GEO_FIELDS} if a.get("status") == "success" else None)
+                for a in answers}
+
+    def lookup_many(self, ips):
+        ips = list(ips)
+        batches = [ips[i:i + self.batch_size] for i in range(0, len(ips), self.batch_size)]
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for answer in pool.map(self._batch, batches):
+                results.update(answer)
+        return results
+
+
+class ChainBackend:
+    """Ask each backend in turn for the addresses the previous ones missed."""
+
+    def __init__(self, backends):
+        self.backends = backends
+
+    def lookup_many(self, ips):
+        results = {}
+        remaining = list(ips)
+        found = {}
+        for backend in self.backends:
+            if not remaining:
+                break
+            found = backend.lookup_many(remaining)
+            results.update({ip: info for ip, info in found.items() if info})
+            remaining = [ip for ip in remaining if not found.get(ip)]
+        # A "not found" from the last backend is a definite answer; addresses it
+        # never answered (errors) stay out of the results so they aren't cached.
+        results.update({ip: None for ip in remaining if ip in found})
+        return results
+
+
+def _to_int(value):
+    value = value.strip()
+    return int(value) if value.isdigit() else int(ipaddress.ip_address(value))
+
+
+def default_backend():
+    backends = []
+    if GEOIP_DB:
+        backends.append(MmdbGeoBackend(GEOIP_DB) if GEOIP_DB.endswith(".mmdb") else OfflineGeoBackend(GEOIP_DB))
+    backends.append(HttpGeoBackend())
+    return ChainBackend(backends)
+
+
+_cache = None
+
+def default_cache():
+    global _cache
+    if _cache is None:
+        _cache = SqliteTTLCache(CACHE_FILE, table="geo", ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+    return _cache
+
+
+def resolve_locations(ips, backend=None, cache=None):
+    """Map each distinct IP to its location dict (or None).
+
+    Non-global addresses (private, reserved, denied, ...) are skipped,
+    cached answers reused, and only the misses are sent to the backend;
+    fresh answers are written back.
+    """
+    cache = cache or default_cache()
+    unique = sorted({str(ip) for ip in ips if isinstance(ip, str) and ip})
+    labels = default_classifier().classify_many(unique)
+    lookup = [ip for ip, label in zip(unique, labels) if label in GLOBAL_LABELS]
+
+    results = {ip: None for ip in unique}
+    cached = cache.get_many(lookup)
+    results.update(cached)
+
+    misses = [ip for ip in lookup if ip not in cached]
+    answers, failed = {}, []
+    if misses:
+        answers = (backend or default_backend()).lookup_many(misses)
+        # Negative answers are cached too so unknown addresses aren't re-queried every run
+        cache.set_many(answers)
+        results.update(answers)
+        # Failures only briefly, so a down service isn't hammered on every run but recovers soon
+        failed = [ip for ip in misses if ip not in answers]
+        cache.set_many(dict.fromkeys(failed), ttl=FAILURE_TTL)
+
+    s = cache.stats()
+    resolved = sum(1 for info in answers.values() if info)
+    print(f"[*] Geo lookup: {len(lookup)} public IPs, {len(cached)} cached, {resolved} resolved, "
+          f"{len(answers) - resolved} unknown, {len(failed)} failed (cache hit rate {s['hit_rate']:.0%})")
+    return results
+
+
+def located_countries(ips, geo=None):
+    """{ip: country} for the given IPs that could be located.
+
+    ``geo`` is a frame the geo stage already enriched (``source_ip`` and
+    ``country`` columns); its countries are used instead of looking the
+    addresses up again, and IPs it doesn't hold are left out.
+    """
+    if geo is None:
+        return {ip: loc["country"] for ip, loc in resolve_locations(ips).items() if loc}
+    if geo.empty or "country" not in geo.columns:
+        return {}
+    located = geo[["source_ip", "country"]].drop_duplicates("source_ip")
+    return dict(zip(located["source_ip"].astype(object), located["country"]))
@@ -0,0 +1,102 @@
+import argparse
+import json
+import os
+from collections import Counter
+from datetime import datetime
+
+from log_loader import BASE_DIR, LOG_FILE, LogCursor
+from smart_analyzer import classify_logs
+from threat_intel_correlater import enrich_threats
+
+STATE_DIR = os.path.join(BASE_DIR, "reports", "state")
+STATE_FILE = os.path.join(STATE_DIR, "incremental_state.json")
+
+AGGREGATE_KEYS = ["source_ip", "command", "attack_type", "risk_level"]
+
+def empty_state():
+    return {
+        "checkpoint": {"path": LOG_FILE, "inode": None, "offset": 0, "rotations": 0},
+        "aggregates": {"events": 0, **{key: {} for key in AGGREGATE_KEYS}},
+    }
+
+def load_state(path=STATE_FILE):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return empty_state()
+
+def save_state(state, path=STATE_FILE):
+    """Write checkpoint and aggregates together so they never disagree."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+def chunk_counts(df):
+    """Per-key value counts for one chunk of new events."""
+    df = enrich_threats(classify_logs(df))
+    counts = {}
+    for key in AGGREGATE_KEYS:
+        vc = df[key].value_counts()
+        counts[key] = {str(k): int(v) for k, v in vc.items() if v > 0}
+    return counts
+
+def merge_counts(aggregates, counts, events):
+    aggregates["events"] += events
+    for key, values in counts.items():
+        merged = Counter(aggregates.get(key, {}))
+        merged.update(values)
+        aggregates[key] = dict(merged)
+
+def run_incremental(full=False, log_file=LOG_FILE, state_file=STATE_FILE):
+    """Fold newly appended log records into the persisted aggregates."""
+    state = empty_state() if full else load_state(state_file)
+    cursor = LogCursor(state["checkpoint"], log_file)
+    if not cursor.exists():
+        print(f"[!] Log file not found: {log_file}")
+        return state
+
+    new_events = 0
+    offset = state["checkpoint"]["offset"]
+    for chunk, _ in cursor:
+        merge_counts(state["aggregates"], chunk_counts(chunk), len(chunk))
+        new_events += len(chunk)
+
+    state["checkpoint"].update({"path": log_file, **cursor.position})
+    state["aggregates"]["updated"] = datetime.now().isoformat()
+    save_state(state, state_file)
+    print(f"[+] Processed {new_events} new events (offset {offset} -> {cursor.position['offset']}); "
+          f"{state['aggregates']['events']} total.")
+    return state
+
+def verify(log_file=LOG_FILE, state_file=STATE_FILE):
+    """Recompute aggregates up to the checkpoint and compare them with the persisted ones.
+
+    Only meaningful with deterministic reputation (the mock scorer); live
+    AbuseIPDB scores can change between the two passes.
+    """
+    persisted = load_state(state_file)
+    if persisted["checkpoint"].get("rotations"):
+        print("[!] Aggregates include logs that were rotated away; use --full to rebuild them.")
+        return False
+    rescan = empty_state()["aggregates"]
+    for chunk, _ in LogCursor({}, log_file, until=persisted["checkpoint"]):
+        merge_counts(rescan, chunk_counts(chunk), len(chunk))
+
+    ok = all(rescan[key] == persisted["aggregates"].get(key) for key in ["events", *AGGREGATE_KEYS])
+    print("[+] Incremental aggregates match a full rescan." if ok
+          else "[!] Incremental aggregates differ from a full rescan!")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental attack log aggregation")
+    parser.add_argument("--full", action="store_true", help="discard state and rescan from the oldest segment")
+    parser.add_argument("--verify", action="store_true", help="compare persisted aggregates to a full rescan")
+    args = parser.parse_args()
+
+    if args.verify:
+        verify()
+    else:
+        run_incremental(full=args.full)
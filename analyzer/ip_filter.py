@@ -0,0 +1,183 @@
+import heapq
+import ipaddress
+import os
+from bisect import bisect_right
+
+import numpy as np
+import pandas as pd
+
+# IANA IPv4/IPv6 special-purpose address registries (RFC 6890 and successors)
+SPECIAL_PURPOSE = [
+    ("0.0.0.0/8", "unspecified"),
+    ("10.0.0.0/8", "private"),
+    ("100.64.0.0/10", "shared"),
+    ("127.0.0.0/8", "loopback"),
+    ("169.254.0.0/16", "link-local"),
+    ("172.16.0.0/12", "private"),
+    ("192.0.0.0/24", "reserved"),
+    ("192.0.2.0/24", "documentation"),
+    ("192.31.196.0/24", "reserved"),
+    ("192.52.193.0/24", "reserved"),
+    ("192.88.99.0/24", "reserved"),
+    ("192.168.0.0/16", "private"),
+    ("192.175.48.0/24", "reserved"),
+    ("198.18.0.0/15", "benchmarking"),
+    ("198.51.100.0/24", "documentation"),
+    ("203.0.113.0/24", "documentation"),
+    ("224.0.0.0/4", "multicast"),
+    ("240.0.0.0/4", "reserved"),
+    ("255.255.255.255/32", "broadcast"),
+    ("::/128", "unspecified"),
+    ("::1/128", "loopback"),
+    ("64:ff9b:1::/48", "private"),
+    ("100::/64", "reserved"),
+    ("2001::/23", "reserved"),
+    ("2001:db8::/32", "documentation"),
+    ("3fff::/20", "documentation"),
+    ("fc00::/7", "private"),
+    ("fe80::/10", "link-local"),
+    ("ff00::/8", "multicast"),
+]
+
+PUBLIC = "public"
+INVALID = "invalid"
+# Labels whose addresses are worth geolocating / reputation-checking
+GLOBAL_LABELS = {PUBLIC, "allow"}
+
+# Optional files with one CIDR per line (# comments allowed)
+IP_ALLOW_LIST = os.environ.get("IP_ALLOW_LIST", "")
+IP_DENY_LIST = os.environ.get("IP_DENY_LIST", "")
+
+
+def load_cidr_file(path):
+    """Read CIDRs from a file, ignoring blank lines and # comments."""
+    cidrs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                cidrs.append(line)
+    return cidrs
+
+
+class _RangeIndex:
+    """Non-overlapping [start, end] -> label intervals for one address family.
+
+    Ranges are painted in the order given, so later (or, within the IANA
+    table, narrower) ranges override what they overlap.
+    """
+
+    def __init__(self, ranges):
+        # One sweep over the sorted boundaries; of the ranges covering a
+        # stretch (a heap of their positions, closed ones dropped lazily) the last given wins
+        opens = sorted((start, i) for i, (start, _, _) in enumerate(ranges))
+        closes = sorted((end + 1, i) for i, (_, end, _) in enumerate(ranges))
+        bounds = sorted({b for start, end, _ in ranges for b in (start, end + 1)})
+        active, closed = [], set()
+        o = c = 0
+        self.starts, self.labels = [], []
+        for b in bounds:
+            while c < len(closes) and closes[c][0] == b:
+                closed.add(closes[c][1])
+                c += 1
+            while o < len(opens) and opens[o][0] == b:
+                heapq.heappush(active, -opens[o][1])
+                o += 1
+            while active and -active[0] in closed:
+                heapq.heappop(active)
+            label = ranges[-active[0]][2] if active else None
+            # Neighbours with the same label are merged to keep the index small
+            if not self.labels or self.labels[-1] != label:
+                self.starts.append(b)
+                self.labels.append(label)
+
+    def lookup(self, value):
+        i = bisect_right(self.starts, value) - 1
+        return self.labels[i] if i >= 0 else None
+
+
+class IpClassifier:
+    """Classifies addresses against the IANA special-purpose registries.
+
+    ``custom`` maps extra labels (e.g. "allow", "deny", "drop") to CIDR
+    lists; those take precedence over the built-in ranges, later labels
+    over earlier ones. Everything not covered is "public".
+    """
+
+    def __init__(self, custom=None):
+        v4, v6 = [], []
+        builtin = sorted(SPECIAL_PURPOSE, key=lambda r: ipaddress.ip_network(r[0]).num_addresses, reverse=True)
+        for label, cidrs in [*((lbl, [c]) for c, lbl in builtin), *(custom or {}).items()]:
+            for cidr in cidrs:
+                net = ipaddress.ip_network(cidr, strict=False)
+                (v4 if net.version == 4 else v6).append(
+                    (int(net.network_address), int(net.broadcast_address), label))
+        self.v4 = _RangeIndex(v4)
+        self.v6 = _RangeIndex(v6)
+        # Dense arrays for vectorized IPv4 lookups
+        self._v4_starts = np.array(self.v4.starts, dtype=np.int64)
+        self._v4_labels = np.array([label or PUBLIC for label in self.v4.labels] + [PUBLIC], dtype=object)
+
+    def classify(self, ip):
+        try:
+            addr = ipaddress.ip_address(str(ip).strip())
+        except ValueError:
+            return INVALID
+        if addr.version == 6 and addr.ipv4_mapped:
+            addr = addr.ipv4_mapped
+        index = self.v4 if addr.version == 4 else self.v6
+        return index.lookup(int(addr)) or PUBLIC
+
+    def is_global(self, ip):
+        return self.classify(ip) in GLOBAL_LABELS
+
+    def classify_many(self, ips):
+        """Labels for a list of addresses; IPv4 goes through numpy searchsorted."""
+        ips = [str(ip) for ip in ips]
+        values = np.full(len(ips), -1, dtype=np.int64)
+        others = []
+        for i, ip in enumerate(ips):
+            parts = ip.split(".")
+            if len(parts) == 4 and all(p.isdigit() and len(p) <= 3 for p in parts):
+                a, b, c, d = (int(p) for p in parts)
+                if a < 256 and b < 256 and c < 256 and d < 256:
+                    values[i] = (a << 24) | (b << 16) | (c << 8) | d
+                    continue
+            others.append(i)
+        pos = np.searchsorted(self._v4_starts, values, side="right") - 1
+        pos[pos < 0] = len(self._v4_labels) - 1
+        labels = self._v4_labels[pos]
+        for i in others:
+            labels[i] = self.classify(ips[i])
+        return labels
+
+    def classify_series(self, series):
+        """Vectorized labels for a source_ip column (classifies each distinct value once)."""
+        codes, uniques = pd.factorize(series.astype(object))
+        labels = self.classify_many(uniques) if len(uniques) else np.array([], dtype=object)
+        out = np.where(codes >= 0, labels[codes] if len(labels) else INVALID, INVALID)
+        return pd.Series(pd.Categorical(out), index=series.index, name="ip_class")
+
+    def global_mask(self, series):
+        return self.classify_series(series).isin(GLOBAL_LABELS)
+
+
+_default = None
+
+def default_classifier():
+    """Shared classifier honouring the IP_ALLOW_LIST / IP_DENY_LIST files."""
+    global _default
+    if _default is None:
+        custom = {}
+        if IP_ALLOW_LIST:
+            custom["allow"] = load_cidr_file(IP_ALLOW_LIST)
+        if IP_DENY_LIST:
+            custom["deny"] = load_cidr_file(IP_DENY_LIST)
+        _default = IpClassifier(custom)
+    return _default
+
+def classify_ip(ip):
+    return default_classifier().classify(ip)
+
+def is_global(ip):
+    return default_classifier().is_global(ip)
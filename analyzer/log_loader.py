@@ -0,0 +1,382 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # orjson is optional; fall back to the stdlib parser
+    _loads = json.loads
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOG_FILE = os.path.join(BASE_DIR, "logs", "attacks.log")
+
+LOG_COLUMNS = ["timestamp", "source_ip", "port", "command", "status"]
+CATEGORICAL_COLUMNS = ["source_ip", "command", "status"]
+CHUNK_LINES = 200_000
+# Session start/end records from the honeypot; they carry no command, so
+# command-level analyzers never see them unless they ask (lifecycle=True)
+LIFECYCLE_EVENTS = {"session_start", "session_end"}
+
+# Sealed segments of a log live in a "segments" directory next to it:
+# <stem>.<number>.jsonl.gz holds independent gzip members (blocks), and
+# <stem>.<number>.idx.json indexes them (see log_segments.py). A segment
+# that was rolled but not yet compressed is still a plain <stem>.<number>.jsonl.
+SEGMENT_DIRNAME = "segments"
+_SEGMENT_NAME = re.compile(r"^(?P<stem>.+)\.(?P<number>\d{6})\.(?P<ext>jsonl|jsonl\.gz|idx\.json)$")
+# A file is identified by inode plus a hash of its first line ("head"):
+# inodes of sealed and deleted segments get reused by later live logs
+HEAD_BYTES = 4096
+
+# path -> (stat signature, DataFrame); lets every analyzer in one process share a parse
+_cache = {}
+# index path -> (mtime, index)
+_index_cache = {}
+
+def _typed(records):
+    """Build a DataFrame from parsed records with compact, typed columns."""
+    df = pd.DataFrame.from_records(records)
+    for col in LOG_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce", format="ISO8601")
+    port = pd.to_numeric(df["port"], errors="coerce")
+    df["port"] = port.where((port >= 0) & (port <= 65535), 0).fillna(0).astype("uint16")
+    for col in CATEGORICAL_COLUMNS:
+        df[col] = df[col].astype("category")
+    return df
+
+def _concat(chunks):
+    """Concatenate typed chunks, merging categories instead of falling back to object."""
+    if len(chunks) == 1:
+        return chunks[0]
+    df = pd.concat(chunks, ignore_index=True)
+    for col in CATEGORICAL_COLUMNS:
+        values = [c[col] for c in chunks]
+        # An all-null column (e.g. a chunk of lifecycle records without commands) has
+        # no categories and so an object category dtype; give it the others' dtype
+        dtype = next((v.cat.categories.dtype for v in values if len(v.cat.categories)), None)
+        if dtype is not None:
+            values = [v if len(v.cat.categories) else v.cat.set_categories(pd.Index([], dtype=dtype))
+                      for v in values]
+        df[col] = union_categoricals(values)
+    return df
+
+def empty_logs():
+    return _typed([])
+
+def _read_chunks(lines, position, chunk_lines=CHUNK_LINES, end=None, lifecycle=False):
+    """Parse JSONL ``lines`` starting at byte ``position``; yields (DataFrame, end position)."""
+    records = []
+    for line in lines:
+        if not line.endswith(b"\n") or (end is not None and position + len(line) > end):
+            break
+        position += len(line)
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = _loads(line)
+        except ValueError:
+            continue
+        if not isinstance(record, dict):  # valid JSON but not an event (e.g. a bare number)
+            continue
+        if not lifecycle and record.get("event") in LIFECYCLE_EVENTS:
+            continue
+        records.append(record)
+        if len(records) >= chunk_lines:
+            yield _typed(records), position
+            records = []
+    if records:
+        yield _typed(records), position
+
+def iter_log_chunks(path=LOG_FILE, offset=0, chunk_lines=CHUNK_LINES, end=None, lifecycle=False):
+    """Yield (DataFrame, end_offset) for consecutive chunks of complete JSONL lines.
+
+    Reading starts at byte ``offset`` and stops at byte ``end`` if given; a
+    trailing line without a newline is left for the next call, so
+    ``end_offset`` is always safe to resume from. Malformed lines are
+    skipped, and so are session lifecycle records unless ``lifecycle``.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        yield from _read_chunks(f, offset, chunk_lines, end, lifecycle)
+
+# --- sealed segments ----------------------------------------------------------
+
+def file_head(data):
+    """Fingerprint of a log from its first HEAD_BYTES bytes ("" until it holds a complete line)."""
+    end = data.find(b"\n")
+    if end < 0 and len(data) < HEAD_BYTES:
+        return ""
+    return hashlib.blake2b(data[:end + 1] if end >= 0 else data, digest_size=8).hexdigest()
+
+def _same_file(position, inode, head):
+    # Checkpoints written before heads existed match on the inode alone
+    return position.get("inode") == inode and (not position.get("head") or position["head"] == head)
+
+def same_position(a, b):
+    """Whether two checkpoints (or LogCursor positions) resume at the same place."""
+    def key(position):
+        # Without an inode a checkpoint means "from the oldest segment", whatever its offset
+        if position.get("inode") is None:
+            return None
+        return position["inode"], position.get("head") or None, position.get("offset", 0)
+    return key(a) == key(b)
+
+def segment_dir(path=LOG_FILE):
+    return os.path.join(os.path.dirname(os.path.abspath(path)), SEGMENT_DIRNAME)
+
+def list_segments(path=LOG_FILE):
+    """Sealed segments of a log, oldest first.
+
+    Each is its index dict plus ``data`` (the file to read) and ``plain``
+    (True while it is still an uncompressed, unindexed JSONL file).
+    """
+    directory = segment_dir(path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    found = {}
+    for name in names:
+        match = _SEGMENT_NAME.match(name)
+        if match and match["stem"] == stem:
+            found.setdefault(match["number"], set()).add(match["ext"])
+    segments = []
+    for number in sorted(found):
+        base = os.path.join(directory, f"{stem}.{number}")
+        try:
+            if {"idx.json", "jsonl.gz"} <= found[number]:
+                segments.append({**_load_index(base + ".idx.json"), "data": base + ".jsonl.gz", "plain": False})
+            elif "jsonl" in found[number]:
+                with open(base + ".jsonl", "rb") as f:
+                    st = os.fstat(f.fileno())
+                    head = file_head(f.read(HEAD_BYTES))
+                segments.append({"source": {"inode": st.st_ino, "size": st.st_size, "head": head},
+                                 "data": base + ".jsonl",
+                                 "plain": True, "blocks": None, "first_ts": None, "last_ts": None})
+        except FileNotFoundError:
+            continue  # sealed or deleted while we looked
+    return segments
+
+def _load_index(index_path):
+    mtime = os.stat(index_path).st_mtime_ns
+    cached = _index_cache.get(index_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(index_path, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    _index_cache[index_path] = (mtime, index)
+    return index
+
+def _segment_lines(segment, start=0, blocks=None):
+    """Decompressed lines of a sealed segment from raw byte ``start`` (a line boundary)."""
+    if segment["plain"]:
+        try:
+            f = open(segment["data"], "rb")
+        except FileNotFoundError:
+            # Sealed since it was listed: read the compressed copy instead
+            base = segment["data"][:-len(".jsonl")]
+            segment = {**_load_index(base + ".idx.json"), "data": base + ".jsonl.gz", "plain": False}
+        else:
+            with f:
+                f.seek(start)
+                yield from f
+            return
+    with open(segment["data"], "rb") as f:
+        for block in segment["blocks"] if blocks is None else blocks:
+            if block["raw_offset"] + block["raw_length"] <= start:
+                continue
+            f.seek(block["offset"])
+            data = gzip.decompress(f.read(block["length"]))
+            if start > block["raw_offset"]:
+                data = data[start - block["raw_offset"]:]
+            yield from data.splitlines(keepends=True)
+
+def _overlaps(span, start, end):
+    """Whether a block/segment's [first_ts, last_ts] may hold events in [start, end]."""
+    if span.get("first_ts") is None:
+        return True
+    return (end is None or pd.Timestamp(span["first_ts"]) <= end) and \
+        (start is None or pd.Timestamp(span["last_ts"]) >= start)
+
+# --- reading across segments ----------------------------------------------------
+
+class LogCursor:
+    """Iterates (DataFrame, position) over records appended since ``checkpoint``, across rotations.
+
+    Positions are ``{"inode", "head", "offset"}`` in the coordinates of the
+    file the records were written to, which sealed segments remember; so a
+    checkpoint taken before a rotation resumes inside the sealed segment,
+    then moves on to newer segments and the live log. A checkpoint without
+    an inode means "from the oldest segment". ``position`` is where to
+    resume once iteration ends; ``until`` (a checkpoint) stops reading there.
+    """
+
+    def __init__(self, checkpoint, path=LOG_FILE, chunk_lines=CHUNK_LINES, lifecycle=False, until=None):
+        self.checkpoint = checkpoint
+        self.path = path
+        self.chunk_lines = chunk_lines
+        self.lifecycle = lifecycle
+        self.until = until
+        self.position = {"inode": checkpoint.get("inode"), "head": checkpoint.get("head"),
+                         "offset": checkpoint.get("offset", 0)}
+
+    def exists(self):
+        return os.path.exists(self.path) or bool(list_segments(self.path))
+
+    def _lost(self, reason):
+        # Records left unread in the old file are gone
+        print(f"[*] Log {reason} — starting from the beginning of the current file.")
+        self.checkpoint["rotations"] = self.checkpoint.get("rotations", 0) + 1
+
+    def _read(self, source, lines, start):
+        inode, head = source["inode"], source["head"]
+        end = self.until["offset"] if self.until and _same_file(self.until, inode, head) else None
+        for df, position in _read_chunks(lines, start, self.chunk_lines, end, self.lifecycle):
+            self.position = {"inode": inode, "head": head, "offset": position}
+            yield df, dict(self.position)
+        return end is not None
+
+    def __iter__(self):
+        # Open the live file first: if it is rolled meanwhile we keep reading it through this handle
+        try:
+            live = open(self.path, "rb")
+        except FileNotFoundError:
+            live = None
+        try:
+            source = None
+            if live is not None:
+                source = {"inode": os.fstat(live.fileno()).st_ino,
+                          "head": file_head(os.pread(live.fileno(), HEAD_BYTES, 0))}
+            offset = self.position["offset"]
+            # A segment that is the file we hold open was rolled after we opened it
+            segments = [s for s in list_segments(self.path) if source is None
+                        or (s["source"]["inode"], s["source"]["head"]) != (source["inode"], source["head"])]
+            if self.position["inode"] is None:
+                pending, offset = segments, 0
+            elif source is not None and _same_file(self.position, source["inode"], source["head"]):
+                pending = []
+                if os.fstat(live.fileno()).st_size < offset:
+                    self._lost("was truncated")
+                    offset = 0
+            else:
+                matches = [i for i, s in enumerate(segments)
+                           if _same_file(self.position, s["source"]["inode"], s["source"]["head"])]
+                pending = segments[matches[-1]:] if matches else []
+                if not matches:
+                    self._lost("rotation detected (old segment not found)")
+                    offset = 0
+
+            for i, segment in enumerate(pending):
+                start = offset if i == 0 else 0
+                self.position = {"inode": segment["source"]["inode"], "head": segment["source"]["head"],
+                                 "offset": start}
+                if (yield from self._read(segment["source"], _segment_lines(segment, start), start)):
+                    return
+            if live is not None:
+                start = offset if not pending else 0
+                if start == 0:
+                    # Re-read: the first line may have landed since we looked
+                    source["head"] = file_head(os.pread(live.fileno(), HEAD_BYTES, 0))
+                self.position = {**source, "offset": start}
+                live.seek(start)
+                yield from self._read(source, live, start)
+        finally:
+            if live is not None:
+                live.close()
+
+def iter_log_range(start=None, end=None, path=LOG_FILE, chunk_lines=CHUNK_LINES, lifecycle=False):
+    """Yield DataFrames of the events with ``start <= timestamp <= end`` from all segments and the live log.
+
+    Only the blocks of sealed segments whose indexed time span overlaps the
+    range are read and decompressed; the live log (at most one segment
+    long) is scanned. Omitted bounds are open.
+    """
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+
+    def within(df):
+        mask = pd.Series(True, index=df.index)
+        if start is not None:
+            mask &= df["timestamp"] >= start
+        if end is not None:
+            mask &= df["timestamp"] <= end
+        return df if mask.all() else df[mask].reset_index(drop=True)
+
+    for segment in list_segments(path):
+        if segment["plain"]:
+            lines = _segment_lines(segment)
+        else:
+            if not _overlaps(segment, start, end):
+                continue
+            blocks = [b for b in segment["blocks"] if _overlaps(b, start, end)]
+            lines = _segment_lines(segment, blocks=blocks)
+        for df, _ in _read_chunks(lines, 0, chunk_lines, lifecycle=lifecycle):
+            df = within(df)
+            if not df.empty:
+                yield df
+    if os.path.exists(path):
+        for df, _ in iter_log_chunks(path, chunk_lines=chunk_lines, lifecycle=lifecycle):
+            df = within(df)
+            if not df.empty:
+                yield df
+
+def load_logs_range(start=None, end=None, path=LOG_FILE, lifecycle=False):
+    """Events between ``start`` and ``end`` as one DataFrame (see iter_log_range)."""
+    chunks = list(iter_log_range(start, end, path, lifecycle=lifecycle))
+    return _concat(chunks) if chunks else empty_logs()
+
+def load_logs_from(path=LOG_FILE, offset=0, lifecycle=False):
+    """Load complete records starting at ``offset``; returns (DataFrame, end_offset)."""
+    chunks = []
+    end = offset
+    for chunk, end in iter_log_chunks(path, offset, lifecycle=lifecycle):
+        chunks.append(chunk)
+    return (_concat(chunks) if chunks else empty_logs()), end
+
+def load_logs_delta(checkpoint, path=LOG_FILE, until=None, lifecycle=False):
+    """Events appended since ``checkpoint`` (up to ``until``) as one DataFrame; returns (DataFrame, position).
+
+    See LogCursor; ``position`` is where the next delta starts.
+    """
+    cursor = LogCursor(dict(checkpoint), path, lifecycle=lifecycle, until=until)
+    chunks = [df for df, _ in cursor]
+    return (_concat(chunks) if chunks else empty_logs()), dict(cursor.position)
+
+def _cached(key, signature, load):
+    cached = _cache.get(key)
+    if cached and cached[0] == signature:
+        return cached[1]
+    df = load()
+    _cache[key] = (signature, df)
+    return df
+
+def load_logs(path=LOG_FILE):
+    """Load the whole attack log, sealed segments included, as a typed DataFrame.
+
+    Columns: datetime64 ``timestamp``, categorical ``source_ip``/``command``/
+    ``status`` and uint16 ``port``. Parses are cached per file state (sealed
+    segments never change), so analyzers running in the same process share them.
+    """
+    chunks = []
+    for segment in list_segments(path):
+        source = segment["source"]
+        chunks.append(_cached(segment["data"], (source["inode"], source["size"]), lambda: _concat(
+            [df for df, _ in _read_chunks(_segment_lines(segment), 0)] or [empty_logs()])))
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        if not chunks:
+            print(f"[!] Log file not found: {path}")
+            return empty_logs()
+    else:
+        chunks.append(_cached(path, (st.st_ino, st.st_size, st.st_mtime_ns), lambda: load_logs_from(path)[0]))
+    chunks = [c for c in chunks if not c.empty] or [empty_logs()]
+    return _concat(chunks).copy(deep=False)
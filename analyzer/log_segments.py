@@ -0,0 +1,260 @@
+import argparse
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers and --roll can't coordinate
+    fcntl = None
+
+from log_loader import (HEAD_BYTES, LOG_FILE, _SEGMENT_NAME, _loads, file_head, iter_log_range,
+                        list_segments, segment_dir)
+
+# The live log is rolled into a sealed segment once it reaches either limit
+SEGMENT_BYTES = int(float(os.environ.get("LOG_SEGMENT_MB", 64)) * 2 ** 20)
+SEGMENT_SECONDS = float(os.environ.get("LOG_SEGMENT_HOURS", 24)) * 3600
+# Uncompressed bytes per gzip member: the unit a time-range read decompresses
+BLOCK_BYTES = 1 * 2 ** 20
+COMPRESS_LEVEL = 6
+# Sealed segments whose newest event is older than this are deleted (0 keeps them all)
+RETENTION_DAYS = float(os.environ.get("LOG_RETENTION_DAYS", 0))
+INDEX_VERSION = 1
+
+
+def _timestamp(line):
+    """Normalized ISO timestamp of a JSONL record, or None."""
+    try:
+        value = _loads(line).get("timestamp")
+        return datetime.fromisoformat(value).isoformat() if isinstance(value, str) else None
+    except (ValueError, AttributeError):
+        return None
+
+def writer_lock(path=LOG_FILE, exclusive=False, wait=True):
+    """Take ``path``'s writer lock; returns the open lock file (closing it unlocks), or None if taken and not ``wait``.
+
+    A writer that rolls its own log holds the lock shared for as long as it
+    writes; rolling or sealing from outside one (the CLI) takes it
+    exclusively, so the log is never renamed under a running writer.
+    """
+    lock_file = open(path + ".lock", "a")
+    if fcntl:
+        try:
+            fcntl.flock(lock_file, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | (0 if wait else fcntl.LOCK_NB))
+        except BlockingIOError:
+            lock_file.close()
+            return None
+    return lock_file
+
+def roll(path=LOG_FILE):
+    """Move the live log aside as the next numbered plain segment; returns its path (None if empty)."""
+    try:
+        if os.path.getsize(path) == 0:
+            return None
+    except FileNotFoundError:
+        return None
+    directory = segment_dir(path)
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    numbers = [int(m["number"]) for m in map(_SEGMENT_NAME.match, os.listdir(directory))
+               if m and m["stem"] == stem]
+    target = os.path.join(directory, f"{stem}.{max(numbers, default=0) + 1:06d}.jsonl")
+    os.replace(path, target)
+    return target
+
+def seal_segment(plain_path, block_bytes=BLOCK_BYTES, level=COMPRESS_LEVEL):
+    """Compress a plain segment into independent gzip blocks plus a sidecar index; returns the index.
+
+    The index keeps the identity (inode and head) and byte offsets of the
+    file the records were written to, so readers' checkpoints into it stay
+    valid. The plain file
+    is removed only once both new files are in place.
+    """
+    base = plain_path[:-len(".jsonl")]
+    st = os.stat(plain_path)
+    blocks = []
+    raw_offset = 0
+    with open(plain_path, "rb") as src, open(base + ".jsonl.gz.tmp", "wb") as dst:
+        head = file_head(src.read(HEAD_BYTES))
+        src.seek(0)
+        pending = []
+        size = 0
+
+        def flush():
+            nonlocal raw_offset, pending, size
+            data = b"".join(pending)
+            member = gzip.compress(data, compresslevel=level, mtime=0)
+            stamps = [t for t in map(_timestamp, pending) if t is not None]
+            blocks.append({"offset": dst.tell(), "length": len(member), "raw_offset": raw_offset,
+                           "raw_length": len(data), "events": len(pending),
+                           "first_ts": min(stamps) if stamps else None, "last_ts": max(stamps) if stamps else None})
+            dst.write(member)
+            raw_offset += len(data)
+            pending, size = [], 0
+
+        for line in src:
+            if not line.endswith(b"\n"):
+                break  # torn final write; readers never consumed it either
+            pending.append(line)
+            size += len(line)
+            if size >= block_bytes:
+                flush()
+        if pending:
+            flush()
+        dst.flush()
+        os.fsync(dst.fileno())
+
+    stamped = [b for b in blocks if b["first_ts"] is not None]
+    index = {"version": INDEX_VERSION, "source": {"inode": st.st_ino, "head": head, "size": raw_offset},
+             "events": sum(b["events"] for b in blocks),
+             "first_ts": min((b["first_ts"] for b in stamped), default=None),
+             "last_ts": max((b["last_ts"] for b in stamped), default=None),
+             "sealed": datetime.now().isoformat(), "blocks": blocks}
+    os.replace(base + ".jsonl.gz.tmp", base + ".jsonl.gz")
+    with open(base + ".idx.json.tmp", "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(base + ".idx.json.tmp", base + ".idx.json")
+    os.remove(plain_path)
+    return index
+
+def seal_pending(path=LOG_FILE):
+    """Seal segments that were rolled but never compressed (e.g. the writer died mid-seal)."""
+    sealed = 0
+    for segment in list_segments(path):
+        if segment["plain"]:
+            seal_segment(segment["data"])
+            sealed += 1
+    return sealed
+
+def apply_retention(path=LOG_FILE, days=RETENTION_DAYS):
+    """Delete sealed segments whose newest event is older than ``days``; returns how many."""
+    if not days:
+        return 0
+    cutoff = (datetime.now() - timedelta(days=days)).isoformat()
+    removed = 0
+    for segment in list_segments(path):
+        if segment["plain"] or segment["last_ts"] is None or segment["last_ts"] >= cutoff:
+            continue
+        base = segment["data"][:-len(".jsonl.gz")]
+        os.remove(base + ".idx.json")
+        os.remove(segment["data"])
+        removed += 1
+    return removed
+
+
+class SegmentRoller:
+    """Decides when a writer's live log is rolled, and seals rolled segments in the background.
+
+    Writers call ``opened(path)`` before opening the log and after each
+    reopen, ``due(size)`` after each flushed batch and, when it says so,
+    close the file, call ``roll(path)`` and reopen. Compression runs on a
+    separate thread so the writer is only paused for the rename. The
+    writer lock is held from the first ``opened`` until ``close``.
+    """
+
+    def __init__(self, max_bytes=SEGMENT_BYTES, max_age=SEGMENT_SECONDS, retention_days=RETENTION_DAYS,
+                 background=True):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.retention_days = retention_days
+        self.background = background
+        self.started = time.time()
+        self.rolled = 0
+        self._threads = []
+        self._lock = None
+
+    def opened(self, path):
+        """Age the live log from its first record (or from now if it is empty)."""
+        if self._lock is None:
+            self._lock = writer_lock(path)
+        self.started = time.time()
+        try:
+            with open(path, "rb") as f:
+                first = f.readline()
+        except FileNotFoundError:
+            return
+        stamp = _timestamp(first) if first.endswith(b"\n") else None
+        if stamp:
+            self.started = min(self.started, datetime.fromisoformat(stamp).timestamp())
+
+    def due(self, size):
+        return size > 0 and (size >= self.max_bytes or time.time() - self.started >= self.max_age)
+
+    def roll(self, path):
+        segment = roll(path)
+        if segment is None:
+            return None
+        self.rolled += 1
+        self._threads = [t for t in self._threads if t.is_alive()]
+        if self.background:
+            thread = threading.Thread(target=self._seal, args=(path, segment), daemon=True,
+                                      name=f"seal:{os.path.basename(segment)}")
+            thread.start()
+            self._threads.append(thread)
+        else:
+            self._seal(path, segment)
+        return segment
+
+    def _seal(self, path, segment):
+        try:
+            index = seal_segment(segment)
+            removed = apply_retention(path, self.retention_days)
+        except OSError as e:
+            print(f"[!] Sealing {segment} failed ({e}); it stays readable uncompressed")
+            return
+        print(f"[+] Sealed {os.path.basename(segment)}: {index['events']} events in "
+              f"{len(index['blocks'])} blocks" + (f", {removed} expired segments removed" if removed else ""))
+
+    def close(self, timeout=60.0):
+        """Wait for background sealing to finish and release the writer lock."""
+        for thread in self._threads:
+            thread.join(timeout)
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Roll, seal and query time-indexed attack log segments")
+    parser.add_argument("--roll", action="store_true", help="seal the live log now")
+    parser.add_argument("--seal-pending", action="store_true", help="compress segments left unsealed")
+    parser.add_argument("--since", help="print events at or after this time (ISO, or an age such as 1h, 30min, 7d)")
+    parser.add_argument("--until", help="... and at or before this time")
+    args = parser.parse_args()
+
+    if args.roll or args.seal_pending:
+        lock = writer_lock(exclusive=True, wait=False)
+        if lock is None:
+            print(f"[!] A running writer holds {LOG_FILE}; it rolls and seals the log itself "
+                  "(LOG_SEGMENT_MB / LOG_SEGMENT_HOURS).")
+            raise SystemExit(1)
+        with lock:
+            if args.roll:
+                segment = roll()
+                print(f"[+] Rolled into {segment}" if segment else "[*] Live log is empty; nothing to roll.")
+            print(f"[+] Sealed {seal_pending()} pending segments.")
+
+    if args.since or args.until:
+        def when(value):
+            if value is None:
+                return None
+            try:
+                return pd.Timestamp.now() - pd.Timedelta(value)
+            except ValueError:
+                return pd.Timestamp(value)
+        start = time.perf_counter()
+        events = 0
+        for chunk in iter_log_range(when(args.since), when(args.until)):
+            events += len(chunk)
+            print(chunk[["timestamp", "source_ip", "command"]].to_string(index=False, header=False))
+        print(f"[+] {events} events in {time.perf_counter() - start:.2f}s")
+    else:
+        for segment in list_segments():
+            state = "plain" if segment["plain"] else f"{len(segment['blocks'])} blocks"
+            print(f"  {os.path.basename(segment['data']):<32}{segment.get('events', '?'):>10} events  "
+                  f"{segment['first_ts']} → {segment['last_ts']}  ({state})")
@@ -0,0 +1,370 @@
+import argparse
+import bisect
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from log_loader import BASE_DIR
+
+METRICS_DIR = os.path.join(BASE_DIR, "reports", "metrics")
+PROFILES_DIR = os.path.join(BASE_DIR, "reports", "profiles")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency buckets in seconds: sub-millisecond socket work up to multi-minute pipeline stages
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Sampling profiler period; a few ms is fine-grained enough for stages that run for seconds
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL_MS", 5)) / 1000
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _number(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if value.is_integer() and abs(value) < 2 ** 53:
+            return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """A named family of values, one per combination of label values.
+
+    Label values are passed as keyword arguments (``inc(stage="geo")``) and
+    must name exactly ``labels``. With ``function`` the (unlabelled) value
+    is read when the metric is collected instead of being tracked.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=(), function=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.function = function
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        try:
+            key = tuple([str(labels[name]) for name in self.labels])
+        except KeyError:
+            key = None
+        if key is None or len(labels) != len(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return key
+
+    def value(self, **labels):
+        if self.function is not None:
+            return self.function()
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        """(suffix, label values, extra label, value) tuples for the exposition format."""
+        if self.function is not None:
+            return [("", (), None, self.function())]
+        with self._lock:
+            return [("", key, None, value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_labels(self.labels, key, extra)} {_number(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("Counters only go up")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Observations counted into cumulative ``le`` buckets, plus their sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, the +Inf bucket last, then the sum
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def value(self, **labels):
+        """(count, sum) of the observations with these labels."""
+        state = self._values.get(self._key(labels))
+        return (sum(state[:-1]), state[-1]) if state else (0, 0.0)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(state)) for key, state in sorted(self._values.items())]
+        samples = []
+        for key, state in items:
+            total = 0
+            for bound, count in zip(self.buckets + (math.inf,), state):
+                total += count
+                samples.append(("_bucket", key, ("le", _number(float(bound))), total))
+            samples.append(("_sum", key, None, state[-1]))
+            samples.append(("_count", key, None, total))
+        return samples
+
+
+class Registry:
+    """The metrics of one process, rendered together in the Prometheus text format.
+
+    Declaring a metric that already exists returns the existing one, so
+    modules can declare what they update at import time.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _declare(self, cls, name, help, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError(f"Metric {name} is already a {metric.kind}")
+            return metric
+
+    def counter(self, name, help, labels=(), function=None):
+        return self._declare(Counter, name, help, labels=labels, function=function)
+
+    def gauge(self, name, help, labels=(), function=None):
+        return self._declare(Gauge, name, help, labels=labels, function=function)
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._declare(Histogram, name, help, labels=labels, buckets=buckets)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        return "".join(metric.render() + "\n" for metric in metrics)
+
+    def write_textfile(self, path):
+        """Write the metrics for node_exporter's textfile collector (or a dashboard) to read."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+REGISTRY = Registry()
+
+def counter(name, help, labels=(), function=None):
+    return REGISTRY.counter(name, help, labels, function)
+
+def gauge(name, help, labels=(), function=None):
+    return REGISTRY.gauge(name, help, labels, function)
+
+def histogram(name, help, labels=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.histogram(name, help, labels, buckets)
+
+
+def serve(address, registry=REGISTRY, extra=None):
+    """Expose ``GET /metrics`` on "host:port" from a daemon thread; returns the server.
+
+    ``extra`` is passed to ``render_with``.
+    """
+    host, _, port = address.rpartition(":")
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_with(registry, extra).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # scrapes every few seconds would drown the console
+
+    server = ThreadingHTTPServer((host or "0.0.0.0", int(port)), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+def _families(text, process=None):
+    """{name: (header lines, sample lines)} of an exposition, optionally labelling every sample."""
+    families = {}
+    current = None
+    for line in text.splitlines():
+        if line.startswith(("# HELP ", "# TYPE ")):
+            current = families.setdefault(line.split(" ", 3)[2], ([], []))
+            current[0].append(line)
+        elif line and not line.startswith("#") and current is not None:
+            if process:
+                name, sep, rest = line.partition("{")
+                label = f'process="{_escape(process)}"'
+                line = f"{name}{{{label},{rest}" if sep else line.replace(" ", f"{{{label}}} ", 1)
+            current[1].append(line)
+    return families
+
+def render_with(registry=REGISTRY, extra=None):
+    """This process's metrics merged with those other processes wrote to textfiles.
+
+    ``extra`` maps a process name to its textfile (see ``write_textfile``);
+    their samples get a ``process`` label so they never collide with ours.
+    Missing files are skipped.
+    """
+    families = _families(registry.render())
+    for process, path in (extra or {}).items():
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except FileNotFoundError:
+            continue
+        for name, (headers, samples) in _families(text, process).items():
+            family = families.setdefault(name, (headers, []))
+            family[1].extend(samples)
+    return "".join("\n".join(headers[:2] + samples) + "\n" for headers, samples in families.values())
+
+def textfiles(directory=METRICS_DIR):
+    """{process: path} of the metric textfiles written to ``directory``."""
+    try:
+        names = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        return {}
+    return {name[:-len(".prom")]: os.path.join(directory, name) for name in names if name.endswith(".prom")}
+
+
+class SamplingProfiler:
+    """Samples every thread's Python stack each ``interval`` seconds.
+
+    Stacks are tallied in the folded format flame graph tools read
+    (``thread;outer;...;inner count``), with the thread name as the root
+    frame, so renaming a worker thread for the task it runs (the pipeline
+    does this per stage) attributes samples to that task. Only the sampler
+    thread does work; the profiled code runs unmodified.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks = _Tally()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def top(self, n=15, prefix=None):
+        """[(frame, self samples, total samples)] of the hottest frames, optionally of one thread."""
+        own, total = _Tally(), _Tally()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            if prefix and frames[0] != prefix:
+                continue
+            own[frames[-1]] += count
+            for frame in set(frames[1:]):
+                total[frame] += count
+        return [(frame, own[frame], total[frame]) for frame, _ in own.most_common(n)]
+
+    def dump(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the metrics pipeline runs left behind, or serve them")
+    parser.add_argument("--serve", metavar="HOST:PORT", help="serve them on /metrics instead")
+    args = parser.parse_args()
+
+    files = textfiles()
+    if args.serve:
+        serve(args.serve, extra=files)
+        print(f"[+] Serving {', '.join(files) or 'no'} metric files on http://{args.serve}/metrics")
+        threading.Event().wait()
+    print(render_with(Registry(), files) or "[!] No metrics written yet.")
@@ -1,41 +1,241 @@
+import argparse
+import json
 import time
 import subprocess
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import os
 import webbrowser
 import threading
 
-# ✅ Correct paths based on your folder structure
-LOG_FILE = "../logs/attacks.log"
+import pandas as pd
+
+import ai_summary
+import anomaly_detector
+import geo_analyzer
+import incremental
+import report_store
+import rollups
+import session_analyzer
+import sketches
+import smart_analyzer
+import threat_intel_correlater
+from log_loader import BASE_DIR, LOG_FILE, load_logs_delta
+from metrics import METRICS_DIR, PROFILES_DIR, REGISTRY, SamplingProfiler, counter, gauge, histogram
+from watcher import watch
 
 DASHBOARD_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dashboard", "app.py")
 
+# Where the load stage's log checkpoint is kept between runs
+STATE_FILE = os.path.join(BASE_DIR, "reports", "state", "pipeline.json")
+
 DASHBOARD_URL = "http://127.0.0.1:5000"  # Flask default URL
 dashboard_running = False  # Prevents multiple launches
 
+MAX_WORKERS = 4
 
-class LogChangeHandler(FileSystemEventHandler):
-    def on_modified(self, event):
-        if event.src_path.endswith("attacks.log"):
-            print("\n🚨 New attack detected! Running analysis pipeline...\n")
-            run_pipeline()
+# Written after every run for the dashboard's /metrics (or node_exporter's textfile collector)
+METRICS_FILE = os.path.join(METRICS_DIR, "pipeline.prom")
+# PIPELINE_PROFILE=1 (or --profile) samples every run and dumps folded stacks to reports/profiles/
+PROFILE = os.environ.get("PIPELINE_PROFILE", "") == "1"
 
+STAGE_SECONDS = histogram("pipeline_stage_seconds", "Wall time of each pipeline stage", labels=("stage",))
+STAGE_ROWS = counter("pipeline_stage_rows_total", "Rows in the DataFrames pipeline stages returned",
+                     labels=("stage",))
+STAGE_FAILURES = counter("pipeline_stage_failures_total", "Pipeline stages that raised", labels=("stage",))
+RUNS = counter("pipeline_runs_total", "Pipeline runs by result", labels=("result",))
+RUN_SECONDS = gauge("pipeline_last_run_seconds", "Wall time of the latest pipeline run")
+LAST_RUN = gauge("pipeline_last_run_timestamp_seconds", "When the latest pipeline run finished (Unix time)")
 
-def run_pipeline():
-    global dashboard_running
+# --- stages -----------------------------------------------------------------
+# Each stage receives the outputs of the stages it depends on and returns its
+# own output, so DataFrames are handed along in memory.
+
+def load_state(path=STATE_FILE):
     try:
-        print("[1/4] 🌍 Running Geo Analyzer...")
-        subprocess.run(["python", "analyzer/geo_analyzer.py"], check=True)
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"checkpoint": {}}
+
+def save_state(state, path=STATE_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+def stage_load(inputs):
+    """The events appended since the previous run's load, with the log positions they span.
+
+    The checkpoint is saved straight away: each report kind remembers how
+    far it got itself, and catches up on its own if a stage failed (see
+    report_store.unstored_events).
+    """
+    state = load_state()
+    events, until = load_logs_delta(state["checkpoint"])
+    delta = {"events": events, "from": state["checkpoint"], "until": until}
+    save_state({**state, "checkpoint": until})
+    return delta
+
+# geo, smart and threat process the load delta for the stages after them; their
+# reports store the same rows, unless the report fell behind (a failed run, a
+# new kind) and has to catch up on a longer range of its own.
+
+def stage_geo(inputs):
+    delta = inputs["load"]
+    geo_df = geo_analyzer.enrich_geo(delta["events"])
+    events, checkpoint = report_store.unstored_events("geo", delta)
+    geo_analyzer.save_geo_report(geo_df if events is delta["events"] else geo_analyzer.enrich_geo(events),
+                                 checkpoint)
+    geo_analyzer.build_attack_map(geo_analyzer.stored_locations())
+    return geo_df
+
+def stage_reputation(inputs):
+    df = inputs["load"]["events"]
+    return threat_intel_correlater.lookup_reputation(df["source_ip"].unique())
+
+def stage_smart(inputs):
+    delta = inputs["load"]
+    smart_df = smart_analyzer.classify_logs(delta["events"])
+    events, checkpoint = report_store.unstored_events("smart", delta)
+    smart_analyzer.save_smart_report(smart_df if events is delta["events"] else smart_analyzer.classify_logs(events),
+                                     checkpoint)
+    return smart_df
+
+def stage_threat(inputs):
+    delta = inputs["load"]
+    threat_df = threat_intel_correlater.score_threats(inputs["smart"], inputs["reputation"])
+    events, checkpoint = report_store.unstored_events("threat", delta)
+    if events is not delta["events"]:
+        # Looks up reputation again: the catch-up range reaches back beyond the delta
+        stored = threat_intel_correlater.enrich_threats(smart_analyzer.classify_logs(events))
+    else:
+        stored = threat_df
+    threat_intel_correlater.save_threat_report(stored, checkpoint)
+    return threat_df
+
+def stage_aggregates(inputs):
+    return incremental.run_incremental()
+
+def stage_sessions(inputs):
+    return session_analyzer.run_sessions()
+
+def stage_anomaly(inputs):
+    return anomaly_detector.run_anomaly(sessions=inputs["sessions"])
+
+def stage_compact(inputs):
+    store = report_store.default_store()
+    return {"expired": store.apply_retention(), "merged": store.compact()}
+
+def stage_rollups(inputs):
+    events = rollups.with_geo_country(inputs["threat"], inputs["geo"])
+    return rollups.run_rollups(delta={**inputs["load"], "events": events})
+
+def stage_sketches(inputs):
+    events = sketches.with_country(inputs["load"]["events"], inputs["geo"])
+    return sketches.run_sketches(delta={**inputs["load"], "events": events})
+
+def stage_summary(inputs):
+    store = inputs["rollups"]
+    if store.is_empty():
+        print("[!] No events to summarize.")
+        return None
+    return ai_summary.save_summary(ai_summary.summarize_rollups(store, inputs["sketches"]))
+
+# name -> (function, dependencies, label)
+STAGES = {
+    "load": (stage_load, [], "📥 Loading attack log"),
+    "geo": (stage_geo, ["load"], "🌍 Geo Analyzer"),
+    "reputation": (stage_reputation, ["load"], "🛰️ IP Reputation Lookup"),
+    "smart": (stage_smart, ["load"], "🧠 Smart Analyzer"),
+    "threat": (stage_threat, ["load", "smart", "reputation"], "🛰️ Threat Intelligence Correlator"),
+    "aggregates": (stage_aggregates, [], "📈 Incremental Aggregates"),
+    "sessions": (stage_sessions, [], "🔗 Session Reconstruction"),
+    "anomaly": (stage_anomaly, ["sessions"], "🚨 Anomaly Detection"),
+    # Fold in the load delta, already classified, scored and geo-located
+    "rollups": (stage_rollups, ["load", "geo", "threat"], "🧮 Rollups"),
+    "sketches": (stage_sketches, ["load", "geo"], "📐 Streaming Sketches"),
+    "summary": (stage_summary, ["rollups", "sketches"], "🧾 AI Summary"),
+    "compact": (stage_compact, ["geo", "smart", "threat", "sessions", "anomaly"], "🗜️ Report Store Maintenance"),
+}
 
-        print("[2/4] 🧠 Running Smart Analyzer...")
-        subprocess.run(["python", "analyzer/smart_analyzer.py"], check=True)
 
-        print("[3/4] 🛰️ Running Threat Intelligence Correlator...")
-        subprocess.run(["python", "analyzer/threat_intel_correlater.py"], check=True)
+def resolve_stages(selected):
+    """Selected stages plus everything they depend on, in STAGES order."""
+    needed = set()
 
-        print("[4/4] 🧾 Running AI Summary...")
-        subprocess.run(["python", "analyzer/ai_summary.py"], check=True)
+    def visit(name):
+        if name not in STAGES:
+            raise ValueError(f"Unknown stage '{name}' (available: {', '.join(STAGES)})")
+        if name not in needed:
+            needed.add(name)
+            for dep in STAGES[name][1]:
+                visit(dep)
+
+    for name in selected:
+        visit(name)
+    return [name for name in STAGES if name in needed]
+
+
+def run_stages(names):
+    """Run stages in dependency order, independent ones concurrently.
+
+    Returns (outputs, timings) keyed by stage name.
+    """
+    outputs, timings = {}, {}
+    pending = list(names)
+    running = {}
+
+    def timed(name):
+        func, deps, label = STAGES[name]
+        # Named after the stage while it runs, so profiler samples are attributed to it
+        thread = threading.current_thread()
+        thread.name, pool_name = f"stage:{name}", thread.name
+        start = time.perf_counter()
+        try:
+            result = func({dep: outputs[dep] for dep in deps})
+        except Exception:
+            STAGE_FAILURES.inc(stage=name)
+            raise
+        finally:
+            thread.name = pool_name
+        timings[name] = time.perf_counter() - start
+        STAGE_SECONDS.observe(timings[name], stage=name)
+        rows = result["events"] if name == "load" else result
+        if isinstance(rows, pd.DataFrame):
+            STAGE_ROWS.inc(len(rows), stage=name)
+        print(f"[✓] {label} ({timings[name]:.2f}s)")
+        return result
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        while pending or running:
+            for name in [n for n in pending if all(d in outputs for d in STAGES[n][1])]:
+                pending.remove(name)
+                print(f"[→] {STAGES[name][2]}...")
+                running[pool.submit(timed, name)] = name
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                outputs[running.pop(future)] = future.result()
+
+    return outputs, timings
+
+
+def run_pipeline(stages=None, profile=PROFILE):
+    global dashboard_running
+    profiler = SamplingProfiler().start() if profile else None
+    try:
+        names = resolve_stages(stages or list(STAGES))
+        start = time.perf_counter()
+        _, timings = run_stages(names)
+        total = time.perf_counter() - start
+        RUNS.inc(result="ok")
+        RUN_SECONDS.set(round(total, 3))
+
+        print("\n⏱️ Stage timings:")
+        for name in names:
+            print(f"  - {name:<11} {timings[name]:.2f}s")
+        print(f"  = total       {total:.2f}s")
 
         # Launch dashboard once (if not already running)
         if not dashboard_running:
@@ -48,7 +248,24 @@ def run_pipeline():
         print("\n✅ Pipeline completed successfully.\n")
 
     except Exception as e:
+        RUNS.inc(result="error")
         print(f"[!] Pipeline error: {e}")
+    finally:
+        if profiler:
+            report_profile(profiler)
+        LAST_RUN.set(round(time.time(), 3))
+        REGISTRY.write_textfile(METRICS_FILE)
+
+
+def report_profile(profiler):
+    """Stop the profiler, dump its folded stacks and print the hottest functions of each stage."""
+    profiler.stop()
+    path = profiler.dump(os.path.join(PROFILES_DIR, f"pipeline_{time.strftime('%Y%m%d_%H%M%S')}.folded"))
+    print(f"\n🔥 Profile: {profiler.samples} samples → {path}")
+    stages = sorted({stack.split(";", 1)[0] for stack in profiler.stacks if stack.startswith("stage:")})
+    for stage in stages:
+        hot = ", ".join(f"{frame} ({own})" for frame, own, _ in profiler.top(3, prefix=stage))
+        print(f"  - {stage[len('stage:'):]:<11} {hot}")
 
 
 def run_dashboard():
@@ -59,27 +276,40 @@ def run_dashboard():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IoT Honeypot analysis pipeline")
+    parser.add_argument("--stages", help=f"comma-separated subset of: {', '.join(STAGES)} "
+                                         "(dependencies are added automatically)")
+    parser.add_argument("--no-dashboard", action="store_true", help="don't launch the dashboard")
+    parser.add_argument("--watch", action="store_true", help="re-run whenever the attack log changes")
+    parser.add_argument("--debounce", type=float, default=2.0,
+                        help="seconds of quiet before a watch-triggered run (default 2)")
+    parser.add_argument("--max-delay", type=float, default=30.0,
+                        help="longest a steady stream of writes may postpone a run (default 30)")
+    parser.add_argument("--poll", action="store_true", help="poll the log instead of using inotify/FSEvents")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--profile", action="store_true", default=PROFILE,
+                        help="sample stacks during each run and dump them to reports/profiles/ (PIPELINE_PROFILE=1)")
+    args = parser.parse_args()
+    stages = args.stages.split(",") if args.stages else None
+
+    if args.no_dashboard:
+        dashboard_running = True
+
     print("⚙️ IoT Honeypot Smart Pipeline Started")
     print(f"📡 Watching for new attacks in: {LOG_FILE}")
     print("------------------------------------------------\n")
 
     os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
 
-    # 🧠 TEMPORARY MODE (Run pipeline immediately for testing/demo)
-    run_pipeline()
+    # Run once immediately, then optionally keep watching
+    run_pipeline(stages, args.profile)
 
-    # 🕵️‍♂️ REAL-TIME MODE (commented out for now)
-    """
-    event_handler = LogChangeHandler()
-    observer = Observer()
-    observer.schedule(event_handler, path=os.path.dirname(LOG_FILE), recursive=False)
-    observer.start()
+    # 🕵️‍♂️ REAL-TIME MODE: bursts of writes are coalesced into one run
+    if args.watch:
+        def on_change():
+            print("\n🚨 New attacks detected! Running analysis pipeline...\n")
+            run_pipeline(stages, args.profile)
 
-    try:
-        while True:
-            time.sleep(2)
-    except KeyboardInterrupt:
-        observer.stop()
-        print("\n🛑 Pipeline stopped manually.")
-    observer.join()
-    """
+        stats = watch(LOG_FILE, on_change, debounce=args.debounce, max_delay=args.max_delay,
+                      poll=args.poll, poll_interval=args.poll_interval)
+        print(f"[*] Watcher totals: {stats['events_received']} events, {stats['runs_executed']} runs")
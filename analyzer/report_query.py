@@ -0,0 +1,286 @@
+import argparse
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from log_loader import same_position
+from report_store import default_store
+from rollups import GRANULARITIES, MINUTE_DIMENSIONS, MISSING, RETENTION, TRIM_AFTER, TRIM_DIMENSIONS, default_rollups
+
+GROUP_COLUMNS = ["source_ip", "command", "attack_type", "country", "risk_level", "ip_class", "port", "status"]
+BUCKETS = ["minute", "hour", "day", "week"]
+# metric name -> (source column, pyarrow aggregation)
+METRICS = {
+    "count": ("timestamp", "count"),
+    "unique_ips": ("source_ip", "count_distinct"),
+    "avg_threat": ("threat_score", "mean"),
+    "max_threat": ("threat_score", "max"),
+}
+MAX_LIMIT = 1000
+CACHE_SIZE = 256
+# Event counts grouped by at most one of these (or none) are answered from the
+# rollups when they are in step with the report (see rollup_plan). Not country:
+# the rollups prefer the geo-located country over the report's.
+ROLLUP_KIND = "threat"
+ROLLUP_GROUPS = ["attack_type", "source_ip", "command", "risk_level"]
+# The only one of them the report leaves empty (unscored events); the rollups
+# count those as MISSING, which the others can hold as a real value ("Unknown"
+# is the attack type of an empty command)
+NULL_GROUPS = ["risk_level"]
+
+_RELATIVE = re.compile(r"^(\d+)([mhdw])$")
+_UNITS = {"m": "min", "h": "h", "d": "D", "w": "W"}
+
+
+class QueryError(ValueError):
+    """Invalid query parameters (reported to API callers as 400)."""
+
+
+def parse_last(value, now=None):
+    """Start timestamp for a relative window such as "15m", "1h", "7d"."""
+    match = _RELATIVE.match(value or "")
+    if not match:
+        raise QueryError(f"Invalid window '{value}' (use e.g. 15m, 1h, 7d, 2w)")
+    now = now or pd.Timestamp.now().floor("min")
+    return now - pd.Timedelta(int(match.group(1)), _UNITS[match.group(2)])
+
+
+def parse_time(value, name):
+    if value is None or value == "":
+        return None
+    try:
+        return pd.Timestamp(value)
+    except ValueError:
+        raise QueryError(f"Invalid {name} timestamp '{value}'") from None
+
+
+def aggregate(table, group_by, bucket=None, metrics=("count",)):
+    """Group an Arrow table by columns (and a time bucket) and compute metrics."""
+    keys = list(group_by)
+    if bucket:
+        table = table.append_column("bucket", pc.floor_temporal(table["timestamp"], multiple=1, unit=bucket))
+        keys.insert(0, "bucket")
+    aggregations = [METRICS[m] for m in metrics]
+    result = table.group_by(keys).aggregate(aggregations)
+    # Groups are few; plain values sort and serialize where dictionaries can't
+    for i, field in enumerate(result.schema):
+        if pa.types.is_dictionary(field.type):
+            result = result.set_column(i, field.name, result[field.name].cast(field.type.value_type))
+    names = {f"{col}_{agg}": name for name, (col, agg) in zip(metrics, aggregations)}
+    return result.rename_columns([names.get(c, c) for c in result.column_names])
+
+
+def rollup_plan(start, group_by, bucket, now=None):
+    """How the rollups answer a count from ``start`` on: (end of the head, [(granularity, from, to)]).
+
+    The head, from ``start`` to the first whole bucket, is scanned from the
+    report; whole buckets come from the rollups. With a time ``bucket`` they
+    are buckets of that size, otherwise hours up to the next midnight (or
+    the head runs to it) and days after it. None when a bucket needed was
+    expired or trimmed, or doesn't keep the grouped dimension.
+    """
+    now = now or pd.Timestamp.now()
+    dim = group_by[0] if group_by else None
+
+    def usable(granularity, first):
+        if granularity == "minute" and dim is not None and dim not in MINUTE_DIMENSIONS:
+            return False
+        if granularity in RETENTION and first < now - RETENTION[granularity]:
+            return False
+        return not (dim in TRIM_DIMENSIONS and granularity in TRIM_AFTER and first < now - TRIM_AFTER[granularity])
+
+    if bucket:
+        if bucket not in GRANULARITIES:  # weeks aren't rolled up
+            return None
+        head = start.ceil(GRANULARITIES[bucket])
+        return (head, [(bucket, head, None)]) if usable(bucket, head) else None
+    midnight = start.ceil("D")
+    if not usable("day", midnight):
+        return None
+    head = start.ceil("h")
+    if head < midnight and usable("hour", head):
+        return head, [("hour", head, midnight), ("day", midnight, None)]
+    return midnight, [("day", midnight, None)]
+
+
+def _rollup_frame(rollups, pieces, group_by, bucket):
+    """Counts from the rollup buckets of ``pieces`` as a DataFrame with the query's key columns."""
+    dim = group_by[0] if group_by else None
+    frames = []
+    for granularity, first, to in pieces:
+        end = to - pd.Timedelta(seconds=1) if to is not None else None
+        if bucket:
+            rows = rollups.bucket_counts(granularity, dim, first, end)
+            frame = pd.DataFrame(rows, columns=["bucket", "value", "count"])
+            frame["bucket"] = pd.to_datetime(frame["bucket"])
+        elif dim:
+            rows = rollups.counts(dim, granularity, first, end)
+            frame = pd.DataFrame(list(rows.items()), columns=["value", "count"])
+        else:
+            frame = pd.DataFrame({"count": [rollups.totals(granularity, first, end)]})
+        frames.append(frame)
+    df = pd.concat(frames, ignore_index=True)
+    if dim:
+        values = df.pop("value").astype(object)
+        df[dim] = values.where(values != MISSING, None) if dim in NULL_GROUPS else values
+    return df.drop(columns=["value"], errors="ignore")
+
+
+def _from_rollups(store, rollups, kind, group_by, bucket, metrics, where, start, end):
+    """Result rows for the query from the rollups plus a scan of its head, or None to scan it all."""
+    if rollups is None or kind != ROLLUP_KIND or list(metrics) != ["count"] or where or end is not None:
+        return None
+    if len(group_by) > 1 or (group_by and group_by[0] not in ROLLUP_GROUPS):
+        return None
+    stored = store.checkpoint(kind)
+    if not stored or not same_position(stored.get("until", {}), rollups.checkpoint()):
+        return None  # not updated from the same log position
+    # The report has nothing before its oldest event; the rollups may, since
+    # their day buckets outlive the report's retention
+    first = [p["min_ts"] for p in store.parts(kind) if p["min_ts"]]
+    if not first:
+        return None
+    start = max(start, pd.Timestamp(min(first))) if start is not None else pd.Timestamp(min(first))
+    plan = rollup_plan(start, group_by, bucket)
+    if plan is None:
+        return None
+    head, pieces = plan
+    frames = [_rollup_frame(rollups, pieces, group_by, bucket)]
+    if head > start:
+        table = store.read_table(kind, columns=["timestamp", *group_by], start=start,
+                                 end=head - pd.Timedelta(1, "ns"))
+        frames.append(aggregate(table, group_by, bucket, metrics).to_pandas())
+    df = pd.concat(frames, ignore_index=True)
+    keys = (["bucket"] if bucket else []) + group_by
+    if keys:
+        df = df.groupby(keys, dropna=False, sort=False, as_index=False)["count"].sum()
+        df = df[df["count"] > 0]
+    else:
+        df = pd.DataFrame({"count": [int(df["count"].sum())]})
+    order = ["bucket"] if bucket else ["count"]
+    df = df.sort_values(order + group_by, ascending=[bool(bucket)] + [True] * len(group_by),
+                        na_position="last", kind="stable")
+    return df
+
+
+def run_query(kind="threat", group_by=(), start=None, end=None, last=None, bucket=None,
+              metrics=("count",), where=None, limit=100, store=None, rollups=None):
+    """Time-filtered group-by over a stored report kind.
+
+    ``where`` maps columns to required values (pushed into the Parquet
+    reader). Rows are ordered by time bucket when ``bucket`` is set, else
+    by the first metric, descending. Open-ended event counts are answered
+    from the rollups when they can be exactly (see ``rollup_plan``), so
+    they don't scan the report; pass ``rollups`` along with a custom
+    ``store`` for that. Returns a list of dicts.
+    """
+    if store is None:
+        store, rollups = default_store(), rollups or default_rollups()
+    group_by = list(group_by)
+    for col in group_by + list(where or {}):
+        if col not in GROUP_COLUMNS:
+            raise QueryError(f"Cannot group or filter by '{col}' (use: {', '.join(GROUP_COLUMNS)})")
+    if bucket and bucket not in BUCKETS:
+        raise QueryError(f"Unknown bucket '{bucket}' (use: {', '.join(BUCKETS)})")
+    unknown = [m for m in metrics if m not in METRICS]
+    if unknown or not metrics:
+        raise QueryError(f"Unknown metric {unknown} (use: {', '.join(METRICS)})")
+    if not 0 < limit <= MAX_LIMIT:
+        raise QueryError(f"limit must be between 1 and {MAX_LIMIT}")
+    start = parse_last(last) if last else parse_time(start, "start")
+    end = parse_time(end, "end")
+
+    columns = list(dict.fromkeys(["timestamp", *group_by, *(where or {}), *(METRICS[m][0] for m in metrics)]))
+    schema = store.schema(kind)
+    missing = [c for c in columns if c not in schema.names]
+    if missing:
+        raise QueryError(f"Report '{kind}' has no column(s): {', '.join(missing)}")
+
+    rolled = _from_rollups(store, rollups, kind, group_by, bucket, metrics, where, start, end)
+    if rolled is not None:
+        return json.loads(rolled.head(limit).to_json(orient="records", date_format="iso"))
+
+    filters = []
+    for col, value in (where or {}).items():
+        if pa.types.is_integer(schema.field(col).type):
+            try:
+                value = int(value)
+            except ValueError:
+                raise QueryError(f"'{col}' must be an integer") from None
+        filters.append((col, "=", value))
+    table = store.read_table(kind, columns=columns, start=start, end=end, filters=filters or None)
+    result = aggregate(table, group_by, bucket, metrics)
+
+    order = [("bucket", "ascending")] if bucket else [(metrics[0], "descending")]
+    order += [(col, "ascending") for col in group_by]
+    result = result.sort_by(order).slice(0, limit)
+    return json.loads(result.to_pandas().to_json(orient="records", date_format="iso"))
+
+
+class QueryCache:
+    """LRU of query results, keyed by the report's store version and the query."""
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get_or_run(self, version, params, run):
+        key = (version, json.dumps(params, sort_keys=True, default=str))
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key], True
+            self.misses += 1
+        result = run()
+        with self._lock:
+            self.entries[key] = result
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return result, False
+
+
+_cache = QueryCache()
+
+def cached_query(**params):
+    """``run_query`` with results reused until the report's version changes.
+
+    Relative windows (``last``) are resolved to the minute, so they are
+    cached for at most a minute too. Returns (rows, elapsed ms, cache hit).
+    """
+    store = params.get("store") or default_store()
+    kind = params.get("kind", "threat")
+    if params.get("last"):
+        params = {**params, "start": parse_last(params["last"]), "last": None}
+    key = {k: v for k, v in params.items() if k not in ("store", "rollups")}
+    started = time.perf_counter()
+    rows, hit = _cache.get_or_run(store.version(kind), key, lambda: run_query(**params))
+    return rows, (time.perf_counter() - started) * 1000, hit
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate a stored report")
+    parser.add_argument("--kind", default="threat")
+    parser.add_argument("--group-by", default="", help=f"comma-separated: {', '.join(GROUP_COLUMNS)}")
+    parser.add_argument("--bucket", choices=BUCKETS)
+    parser.add_argument("--metrics", default="count", help=f"comma-separated: {', '.join(METRICS)}")
+    parser.add_argument("--start")
+    parser.add_argument("--end")
+    parser.add_argument("--last", help="relative window, e.g. 1h or 7d")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    rows, elapsed, _ = cached_query(kind=args.kind, group_by=[c for c in args.group_by.split(",") if c],
+                                    bucket=args.bucket, metrics=args.metrics.split(","), start=args.start,
+                                    end=args.end, last=args.last, limit=args.limit)
+    print(pd.DataFrame(rows).to_string(index=False))
+    print(f"\n[*] {len(rows)} rows in {elapsed:.1f} ms")
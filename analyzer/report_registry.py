@@ -0,0 +1,125 @@
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking
+    fcntl = None
+
+from log_loader import BASE_DIR
+
+REGISTRY_FILE = os.path.join(BASE_DIR, "reports", "registry.json")
+
+# Legacy file names -> report kind, used by --rebuild
+FILE_KINDS = [
+    (re.compile(r"^geo_report_.*\.csv$"), "geo", "csv"),
+    (re.compile(r"^smart_report_.*\.csv$"), "smart", "csv"),
+    (re.compile(r"^threat_correlation_.*\.csv$"), "threat", "csv"),
+    (re.compile(r"^attack_report_.*\.csv$"), "attack", "csv"),
+    (re.compile(r"^ai_summary_.*\.txt$"), "summary", "path"),
+    (re.compile(r"^attack_map\.html$"), "map", "path"),
+]
+
+_thread_lock = threading.RLock()
+
+
+@contextmanager
+def file_lock(lock_path):
+    """Exclusive lock shared by threads (RLock) and processes (flock)."""
+    with _thread_lock:
+        with open(lock_path, "a") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class ReportRegistry:
+    """Latest artifact per report kind, kept in one small JSON file.
+
+    Producers call ``register()`` after writing a report; readers get the
+    newest entry of a kind with a single stat + (cached) read instead of
+    scanning ``reports/``.
+    """
+
+    def __init__(self, path=REGISTRY_FILE):
+        self.path = path
+        self._cached = (None, {})
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def load(self):
+        """All entries; re-read only when the file changed."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if self._cached[0] != mtime:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._cached = (mtime, json.load(f))
+        return self._cached[1]
+
+    def latest(self, kind):
+        return self.load().get(kind)
+
+    def register(self, kind, **fields):
+        """Merge ``fields`` into the kind's entry (paths are stored absolute)."""
+        for key in ("path", "csv"):
+            if fields.get(key):
+                fields[key] = os.path.abspath(fields[key])
+        with file_lock(self.path + ".lock"):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    entries = json.load(f)
+            except FileNotFoundError:
+                entries = {}
+            entry = entries.setdefault(kind, {})
+            entry.update(fields)
+            entry["updated"] = time.time()
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entries, f, indent=1)
+            os.replace(tmp, self.path)
+        return entry
+
+    def rebuild(self, reports_dir):
+        """One-off scan registering the newest legacy file of each kind."""
+        newest = {}
+        for name in os.listdir(reports_dir):
+            for pattern, kind, key in FILE_KINDS:
+                if pattern.match(name):
+                    path = os.path.join(reports_dir, name)
+                    mtime = os.path.getmtime(path)
+                    if kind not in newest or mtime > newest[kind][0]:
+                        newest[kind] = (mtime, key, path)
+        for kind, (_, key, path) in newest.items():
+            self.register(kind, **{key: path})
+        return sorted(newest)
+
+
+_default = None
+
+def default_registry():
+    global _default
+    if _default is None:
+        _default = ReportRegistry()
+    return _default
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show or rebuild the report registry")
+    parser.add_argument("--rebuild", metavar="DIR", nargs="?", const=os.path.join(BASE_DIR, "reports"),
+                        help="register the newest existing report files in DIR (default reports/)")
+    args = parser.parse_args()
+
+    registry = default_registry()
+    if args.rebuild:
+        print(f"[+] Registered: {', '.join(registry.rebuild(args.rebuild)) or 'nothing'}")
+    print(json.dumps(registry.load(), indent=1))
@@ -0,0 +1,455 @@
+import argparse
+import io
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from log_loader import BASE_DIR, LOG_FILE, load_logs_delta, same_position
+from report_registry import default_registry, file_lock
+
+STORE_DIR = os.path.join(BASE_DIR, "reports", "store")
+RETENTION_DAYS = int(os.environ.get("REPORT_RETENTION_DAYS", 90))
+COMPACT_MIN_PARTS = 8
+# Rows per Parquet row group; the unit tail and page reads fetch
+ROW_GROUP_SIZE = 65_536
+# Also write the old timestamped CSV dumps next to the store (REPORTS_CSV=1)
+EXPORT_CSV = os.environ.get("REPORTS_CSV", "") == "1"
+UNKNOWN_DAY = "unknown"
+
+# Columns that don't belong in a columnar file (nested dicts already flattened)
+DROP_COLUMNS = ["location"]
+
+
+class ReportStore:
+    """Append-only Parquet report store, partitioned by report kind and day.
+
+    Layout: ``<root>/<kind>/date=YYYY-MM-DD/part-*.parquet`` plus a
+    ``manifest.json`` listing every part with its row count, size and
+    timestamp range. Reads use the manifest to skip parts outside the
+    requested time range and only load the requested columns; the
+    manifest's per-kind ``version`` changes on every write and is
+    published to ``registry`` (if given) for cheap "latest" lookups.
+    """
+
+    def __init__(self, root=STORE_DIR, registry=None, retention_days=RETENTION_DAYS):
+        self.root = root
+        self.registry = registry
+        self.retention_days = retention_days  # None keeps every day
+        self.manifest_path = os.path.join(root, "manifest.json")
+        self._cached = (None, {"kinds": {}})
+        os.makedirs(root, exist_ok=True)
+
+    # --- manifest ---------------------------------------------------------
+
+    def _locked(self):
+        return file_lock(os.path.join(self.root, "manifest.lock"))
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"kinds": {}}
+
+    def manifest(self):
+        """Manifest for readers; re-parsed only when the file was replaced.
+
+        Treat the result as read-only, writers work on a fresh copy.
+        """
+        try:
+            st = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return {"kinds": {}}
+        signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if self._cached[0] != signature:
+            self._cached = (signature, self._read_manifest())
+        return self._cached[1]
+
+    def _save_manifest(self, manifest):
+        tmp = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp, self.manifest_path)
+
+    def _publish(self, manifest):
+        if self.registry is None:
+            return
+        for kind, entry in manifest["kinds"].items():
+            self.registry.register(kind, store=True, version=entry["version"], max_ts=entry["max_ts"],
+                                   rows=sum(p["rows"] for p in entry["parts"]))
+
+    def _kind(self, manifest, kind):
+        return manifest["kinds"].setdefault(kind, {"version": 0, "max_ts": None, "parts": []})
+
+    def parts(self, kind):
+        return self.manifest()["kinds"].get(kind, {}).get("parts", [])
+
+    def version(self, kind):
+        return self.manifest()["kinds"].get(kind, {}).get("version", 0)
+
+    def kinds(self):
+        return list(self.manifest()["kinds"])
+
+    # --- writes -----------------------------------------------------------
+
+    def _write_part(self, kind, day, df):
+        directory = os.path.join(self.root, kind, f"date={day}")
+        os.makedirs(directory, exist_ok=True)
+        name = f"part-{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}.parquet"
+        path = os.path.join(directory, name)
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path,
+                       compression="zstd", row_group_size=ROW_GROUP_SIZE)
+        ts = df["timestamp"] if "timestamp" in df.columns else pd.Series(dtype="datetime64[ns]")
+        return {
+            "path": os.path.relpath(path, self.root),
+            "day": day,
+            "rows": len(df),
+            "row_groups": [min(ROW_GROUP_SIZE, len(df) - i) for i in range(0, len(df), ROW_GROUP_SIZE)],
+            "bytes": os.path.getsize(path),
+            "min_ts": ts.min().isoformat() if ts.notna().any() else None,
+            "max_ts": ts.max().isoformat() if ts.notna().any() else None,
+            "created": time.time(),
+        }
+
+    def append(self, kind, df, checkpoint=None):
+        """Append rows to a report kind; returns the number of rows written.
+
+        Rows on days retention already expired are left out, so appending
+        old events can't bring them back. ``checkpoint`` (JSON, e.g. the log
+        range the rows came from) is saved with the rows in the same
+        manifest update, so a reader of ``checkpoint(kind)`` never sees one
+        without the other; writers resume after it instead of the store
+        looking for duplicates.
+        """
+        df = df.drop(columns=[c for c in DROP_COLUMNS if c in df.columns])
+        days = None
+        if "timestamp" in df.columns:
+            days = df["timestamp"].dt.strftime("%Y-%m-%d").fillna(UNKNOWN_DAY)
+            cutoff = _cutoff(self.retention_days)
+            if cutoff is not None:
+                kept = ((days >= cutoff) | (days == UNKNOWN_DAY)).to_numpy()
+                df, days = df[kept], days[kept]
+        with self._locked():
+            manifest = self._read_manifest()
+            entry = self._kind(manifest, kind)
+            if df.empty:
+                if checkpoint is not None and entry.get("checkpoint") != checkpoint:
+                    # Nothing to store, but the range the checkpoint covers was processed
+                    entry["checkpoint"] = checkpoint
+                    self._save_manifest(manifest)
+                return 0
+
+            groups = df.groupby(days.to_numpy(), sort=True) if days is not None else [(UNKNOWN_DAY, df)]
+            for day, part in groups:
+                entry["parts"].append(self._write_part(kind, day, part))
+
+            latest = [p["max_ts"] for p in entry["parts"] if p["max_ts"]]
+            entry["max_ts"] = max(latest) if latest else None
+            if checkpoint is not None:
+                entry["checkpoint"] = checkpoint
+            entry["version"] += 1
+            self._save_manifest(manifest)
+            self._publish({"kinds": {kind: entry}})
+        return len(df)
+
+    def checkpoint(self, kind):
+        """The ``checkpoint`` saved by the latest ``append`` that had one (None if none)."""
+        return self.manifest()["kinds"].get(kind, {}).get("checkpoint")
+
+    # --- reads ------------------------------------------------------------
+
+    def select_parts(self, kind, start=None, end=None):
+        """Parts whose timestamp range overlaps [start, end]."""
+        start = pd.Timestamp(start).isoformat() if start is not None else None
+        end = pd.Timestamp(end).isoformat() if end is not None else None
+        selected = []
+        for part in self.parts(kind):
+            if start and part["max_ts"] and part["max_ts"] < start:
+                continue
+            if end and part["min_ts"] and part["min_ts"] > end:
+                continue
+            selected.append(part)
+        return selected
+
+    def _empty_table(self, kind, columns=None):
+        """Zero-row table with the kind's columns (from the newest part's schema)."""
+        parts = self.parts(kind)
+        if not parts:
+            return pa.table({c: pa.array([], pa.null()) for c in columns or []})
+        table = pq.read_schema(os.path.join(self.root, parts[-1]["path"])).empty_table()
+        return table.select(columns) if columns else table
+
+    def schema(self, kind):
+        return self._empty_table(kind).schema
+
+    def _empty(self, kind, columns=None):
+        return self._empty_table(kind, columns).to_pandas()
+
+    def read(self, kind, columns=None, start=None, end=None, filters=None):
+        """Read a report kind with column projection and predicate pushdown.
+
+        ``start``/``end`` prune whole parts via the manifest and are pushed
+        into the Parquet reader together with any extra pyarrow ``filters``.
+        """
+        return self.read_table(kind, columns, start, end, filters).to_pandas()
+
+    def read_table(self, kind, columns=None, start=None, end=None, filters=None):
+        """Same as ``read()`` but returns the Arrow table."""
+        parts = self.select_parts(kind, start, end)
+        predicates = list(filters or [])
+        if start is not None:
+            predicates.append(("timestamp", ">=", pd.Timestamp(start)))
+        if end is not None:
+            predicates.append(("timestamp", "<=", pd.Timestamp(end)))
+
+        tables = []
+        for part in parts:
+            path = os.path.join(self.root, part["path"])
+            tables.append(pq.read_table(path, columns=columns, filters=predicates or None))
+        if not tables:
+            return self._empty_table(kind, columns)
+        # Parts may type a column differently (e.g. dictionary index width): promote them
+        return pa.concat_tables(tables, promote_options="permissive")
+
+    def _row_groups(self, kind):
+        """(path, row group index, rows) for every row group, oldest first."""
+        groups = []
+        for part in self.parts(kind):
+            path = os.path.join(self.root, part["path"])
+            sizes = part.get("row_groups")
+            if sizes is None:  # parts written before row groups were recorded
+                meta = pq.ParquetFile(path).metadata
+                sizes = [meta.row_group(i).num_rows for i in range(meta.num_row_groups)]
+            groups.extend((path, i, rows) for i, rows in enumerate(sizes))
+        return groups
+
+    def count(self, kind):
+        return sum(part["rows"] for part in self.parts(kind))
+
+    def read_range(self, kind, lo, hi, columns=None):
+        """Rows [lo, hi) in storage (time) order, reading only the row groups they span."""
+        tables, pos = [], 0
+        for path, i, rows in self._row_groups(kind):
+            if pos >= hi:
+                break
+            if pos + rows > lo:
+                table = pq.ParquetFile(path).read_row_group(i, columns=columns)
+                start = max(lo - pos, 0)
+                tables.append(table.slice(start, min(hi - pos, rows) - start))
+            pos += rows
+        if not tables:
+            return self._empty(kind, columns)
+        return pa.concat_tables(tables, promote_options="permissive").to_pandas()
+
+    def tail(self, kind, n=10, columns=None):
+        """Last ``n`` rows, reading only the newest row groups."""
+        total = self.count(kind)
+        return self.read_range(kind, max(total - n, 0), total, columns)
+
+    def page(self, kind, offset=0, limit=50, descending=True, columns=None):
+        """One page of rows ordered by time (newest first unless ``descending`` is False).
+
+        Returns (DataFrame, total rows). Memory is bounded by ``limit`` plus
+        the row groups the page touches, however large the report is.
+        """
+        total = self.count(kind)
+        if descending:
+            hi = max(total - offset, 0)
+            lo = max(hi - limit, 0)
+            df = self.read_range(kind, lo, hi, columns).iloc[::-1]
+        else:
+            lo = min(offset, total)
+            df = self.read_range(kind, lo, min(lo + limit, total), columns)
+        return df.reset_index(drop=True), total
+
+    def export_csv(self, kind, path, **read_kwargs):
+        """On-demand CSV export of a report kind."""
+        df = self.read(kind, **read_kwargs)
+        df.to_csv(path, index=False)
+        return path
+
+    # --- maintenance ------------------------------------------------------
+
+    def apply_retention(self, days=None):
+        """Delete day partitions older than ``days`` (default: the store's retention); returns parts removed."""
+        cutoff = _cutoff(self.retention_days if days is None else days)
+        if cutoff is None:
+            return 0
+        removed = 0
+        with self._locked():
+            manifest = self._read_manifest()
+            for kind, entry in manifest["kinds"].items():
+                keep = []
+                for part in entry["parts"]:
+                    if part["day"] != UNKNOWN_DAY and part["day"] < cutoff:
+                        _remove(os.path.join(self.root, part["path"]))
+                        removed += 1
+                    else:
+                        keep.append(part)
+                if len(keep) != len(entry["parts"]):
+                    entry["parts"] = keep
+                    entry["version"] += 1
+            self._save_manifest(manifest)
+            self._publish(manifest)
+        return removed
+
+    def drop(self, kind):
+        """Delete every part of a report kind (before rebuilding it from scratch)."""
+        with self._locked():
+            manifest = self._read_manifest()
+            entry = self._kind(manifest, kind)
+            for part in entry["parts"]:
+                _remove(os.path.join(self.root, part["path"]))
+            entry.update(parts=[], max_ts=None, checkpoint=None, version=entry["version"] + 1)
+            self._save_manifest(manifest)
+            self._publish({"kinds": {kind: entry}})
+
+    def compact(self, min_parts=COMPACT_MIN_PARTS):
+        """Merge days that accumulated many small parts into one file each."""
+        merged = 0
+        with self._locked():
+            manifest = self._read_manifest()
+            for kind, entry in manifest["kinds"].items():
+                by_day = {}
+                for part in entry["parts"]:
+                    by_day.setdefault(part["day"], []).append(part)
+                for day, parts in by_day.items():
+                    if len(parts) < min_parts:
+                        continue
+                    tables = [pq.read_table(os.path.join(self.root, p["path"])) for p in parts]
+                    df = pa.concat_tables(tables, promote_options="permissive").to_pandas()
+                    new_part = self._write_part(kind, day, df)
+                    for p in parts:
+                        _remove(os.path.join(self.root, p["path"]))
+                    paths = {p["path"] for p in parts}
+                    entry["parts"] = [p for p in entry["parts"] if p["path"] not in paths] + [new_part]
+                    entry["parts"].sort(key=lambda p: (p["min_ts"] or "", p["created"]))
+                    entry["version"] += 1
+                    merged += len(parts)
+            self._save_manifest(manifest)
+            self._publish(manifest)
+        return merged
+
+
+def _cutoff(days):
+    """Oldest day (YYYY-MM-DD) a retention of ``days`` keeps; None keeps everything."""
+    if days is None:
+        return None
+    return (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+
+
+def tail_csv(path, n=10, block_size=64 * 1024):
+    """Last ``n`` rows of a CSV, read by seeking backwards from the end.
+
+    Assumes no newlines inside quoted fields (true for the analyzers' reports).
+    """
+    with open(path, "rb") as f:
+        header = f.readline()
+        body_start = f.tell()
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b""
+        while pos > body_start and data.count(b"\n") <= n:
+            step = min(block_size, pos - body_start)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.splitlines(keepends=True)
+    if pos > body_start:
+        lines = lines[1:]  # first line may be partial
+    return pd.read_csv(io.BytesIO(header + b"".join(lines[-n:] if n else [])))
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+_default = None
+
+def default_store():
+    global _default
+    if _default is None:
+        _default = ReportStore(registry=default_registry())
+    return _default
+
+
+def stored_until(kind, store=None):
+    """Log position a report kind has stored the events up to (``{}``: none yet).
+
+    A kind stored before checkpoints existed is dropped, so it is rebuilt
+    from the log once.
+    """
+    store = store or default_store()
+    done = store.checkpoint(kind)
+    if done is None and store.count(kind):
+        print(f"[*] {kind} report has no log checkpoint — rebuilding it from the log.")
+        store.drop(kind)
+    return (done or {}).get("until", {})
+
+
+def unstored_events(kind, delta=None, path=LOG_FILE, store=None):
+    """Log events a report kind hasn't stored yet; returns (DataFrame, checkpoint for ``save_report``).
+
+    ``delta`` is the pipeline's load output (``events`` between positions
+    ``from`` and ``until``): when the kind's checkpoint is where the delta
+    starts, its events are returned as they are (the same object).
+    Otherwise the kind fell behind (a failed stage, a new kind) and reads
+    its own range, from its checkpoint up to the end of the delta (or of
+    the log).
+    """
+    since = stored_until(kind, store)
+    if delta is not None and same_position(since, delta["from"]):
+        return delta["events"], {"from": since, "until": delta["until"]}
+    events, until = load_logs_delta(since, path, until=delta["until"] if delta is not None else None)
+    return events, {"from": since, "until": until}
+
+
+def save_report(kind, df, csv_path=None, checkpoint=None):
+    """Append a stage's report to the store; the CSV dump is opt-in.
+
+    ``checkpoint`` (from ``unstored_events``) records the log range the
+    rows came from, so the next run only hands over what follows it.
+    """
+    store = default_store()
+    rows = store.append(kind, df, checkpoint=checkpoint)
+    print(f"[+] {kind} report: {rows} new rows stored in {store.root}")
+    if EXPORT_CSV and csv_path:
+        df.to_csv(csv_path, index=False)
+        default_registry().register(kind, csv=csv_path)
+        print(f"[+] CSV copy saved to: {csv_path}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and maintain the Parquet report store")
+    parser.add_argument("--export", metavar="KIND", help="write one report kind to CSV")
+    parser.add_argument("--out", help="CSV path for --export (default reports/<kind>_export.csv)")
+    parser.add_argument("--start", help="only export rows at or after this timestamp")
+    parser.add_argument("--end", help="only export rows at or before this timestamp")
+    parser.add_argument("--compact", action="store_true", help="merge small parts and apply retention")
+    parser.add_argument("--retention-days", type=int, default=RETENTION_DAYS)
+    args = parser.parse_args()
+
+    store = default_store()
+    if args.export:
+        out = args.out or os.path.join(BASE_DIR, "reports", f"{args.export}_export.csv")
+        store.export_csv(args.export, out, start=args.start, end=args.end)
+        print(f"[+] Exported {args.export} to: {out}")
+    if args.compact:
+        print(f"[+] Retention removed {store.apply_retention(args.retention_days)} parts, "
+              f"compaction merged {store.compact()} parts")
+
+    for kind, entry in store.manifest()["kinds"].items():
+        rows = sum(p["rows"] for p in entry["parts"])
+        size = sum(p["bytes"] for p in entry["parts"])
+        print(f"  - {kind:<8} v{entry['version']:<4} {len(entry['parts']):>4} parts "
+              f"{rows:>10,} rows {size / 1024:>9.1f} KiB  (latest {entry['max_ts']})")
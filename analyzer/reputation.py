@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from ip_filter import GLOBAL_LABELS, default_classifier
+from log_loader import BASE_DIR
+from ttl_cache import SqliteTTLCache
+
+ABUSEIPDB_URL = os.environ.get("ABUSEIPDB_URL", "https://api.abuseipdb.com")
+
+CACHE_FILE = os.path.join(BASE_DIR, "reports", "state", "reputation_cache.sqlite")
+CACHE_TTL = 24 * 3600
+CACHE_MAX_ENTRIES = 500_000
+
+
+class TokenBucket:
+    """Thread-safe token bucket; ``acquire()`` blocks until a token is free.
+
+    ``pause_until()`` lets a provider stop all callers until its quota
+    window resets (e.g. after a 429 or an exhausted X-RateLimit-Remaining).
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = self.paused_until - now
+            time.sleep(wait)
+
+    def pause_until(self, deadline):
+        with self._lock:
+            self.paused_until = max(self.paused_until, deadline)
+            self.tokens = 0
+            self.updated = self.paused_until
+
+
+class MockProvider:
+    """Deterministic heuristic scoring used when no API key is configured."""
+
+    name = "mock"
+
+    def lookup(self, ip):
+        octets = ip.split(".")
+        risk = int(octets[-1]) % 100 if len(octets) == 4 and octets[-1].isdigit() else 0
+        return {
+            "score": risk,
+            "confidence": risk // 10,
+            "country": "MockLand",
+            "isp": "UnknownISP"
+        }
+
+
+class AbuseIPDBProvider:
+    """AbuseIPDB v2 ``check`` endpoint over a pooled HTTP session.
+
+    Requests go through a token bucket; quota headers (X-RateLimit-Remaining /
+    X-RateLimit-Reset) and 429 Retry-After pause the bucket for everyone.
+    Returns None when the lookup failed so callers can fall back.
+    """
+
+    name = "abuseipdb"
+
+    def __init__(self, api_key, base_url=ABUSEIPDB_URL, rate=10.0, timeout=10, max_retries=3, pool_size=16):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Key": api_key, "Accept": "application/json"})
+
+    def _respect_quota(self, res):
+        remaining = res.headers.get("X-RateLimit-Remaining")
+        reset = res.headers.get("X-RateLimit-Reset")
+        retry_after = res.headers.get("Retry-After")
+        if res.status_code == 429 and retry_after:
+            self.bucket.pause_until(time.monotonic() + float(retry_after))
+        elif remaining is not None and int(remaining) <= 0 and reset:
+            # Reset is a unix timestamp
+            self.bucket.pause_until(time.monotonic() + max(0.0, float(reset) - time.time()))
+
+    def lookup(self, ip):
+        for _ in range(self.max_retries):
+            self.bucket.acquire()
+            try:
+                res = self.session.get(f"{self.base_url}/api/v2/check",
+                                       params={"ipAddress": ip, "maxAgeInDays": "90"},
+                                       timeout=self.timeout)
+            except requests.RequestException as e:
+                print(f"[x] Reputation API failed for {ip}: {e}")
+                return None
+            self._respect_quota(res)
+            if res.status_code == 429:
+                continue
+            if res.status_code != 200:
+                print(f"[x] Reputation API returned {res.status_code} for {ip}")
+                return None
+            try:
+                data = res.json()["data"]
+                return {
+                    "score": data.get("abuseConfidenceScore", 0),
+                    "confidence": data.get("totalReports", 0),
+                    "country": data.get("countryCode", "Unknown"),
+                    "isp": data.get("isp", "Unknown")
+                }
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                print(f"[x] Reputation API sent a malformed response for {ip}: {e!r}")
+                return None
+        return None
+
+
+class ReputationService:
+    """Cached, concurrent reputation lookups for many IPs.
+
+    Cached answers are reused; misses for routable addresses go to the
+    provider on a bounded thread pool. Failed or skipped lookups fall back
+    to the mock scorer and are not cached.
+    """
+
+    def __init__(self, provider, cache=None, max_workers=8):
+        self.provider = provider
+        self.cache = cache
+        self.max_workers = max_workers
+        self.fallback = MockProvider()
+
+    def lookup_many(self, ips):
+        ips = [str(ip) for ip in dict.fromkeys(ips) if ip]
+        classifier = default_classifier()
+        routable = [ip for ip, label in zip(ips, classifier.classify_many(ips)) if label in GLOBAL_LABELS]
+
+        results = self.cache.get_many(routable) if self.cache else {}
+        misses = [ip for ip in routable if ip not in results]
+        fresh = {}
+        if misses:
+            if self.max_workers > 1 and len(misses) > 1:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                    answers = pool.map(self.provider.lookup, misses)
+                    fresh = {ip: rep for ip, rep in zip(misses, answers) if rep is not None}
+            else:
+                fresh = {ip: rep for ip in misses if (rep := self.provider.lookup(ip)) is not None}
+            if self.cache and fresh:
+                self.cache.set_many(fresh)
+        results.update(fresh)
+
+        for ip in ips:
+            if ip not in results:
+                results[ip] = self.fallback.lookup(ip)
+        if self.cache:
+            s = self.cache.stats()
+            print(f"[*] Reputation: {len(routable)} routable IPs, {len(routable) - len(misses)} cached, "
+                  f"{len(fresh)} fetched from {self.provider.name} (cache hit rate {s['hit_rate']:.0%})")
+        return results
+
+
+def default_service(api_key, max_workers=8):
+    """AbuseIPDB with a persistent cache when a key is set, else the mock scorer."""
+    if not api_key:
+        return ReputationService(MockProvider(), cache=None, max_workers=1)
+    cache = SqliteTTLCache(CACHE_FILE, table="reputation", ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+    return ReputationService(AbuseIPDBProvider(api_key), cache=cache, max_workers=max_workers)
@@ -0,0 +1,346 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from geoip import located_countries
+from log_loader import BASE_DIR, LOG_FILE, LogCursor, same_position
+from sketches import HyperLogLog
+from smart_analyzer import classify_logs
+from threat_intel_correlater import enrich_threats
+
+ROLLUP_FILE = os.path.join(BASE_DIR, "reports", "state", "rollups.sqlite")
+
+# granularity -> pandas floor frequency; "all" is a single all-time bucket
+GRANULARITIES = {"minute": "min", "hour": "h", "day": "D", "all": None}
+ALL_TIME = "all"
+BUCKET_FORMAT = "%Y-%m-%dT%H:%M:%S"
+DIMENSIONS = ["attack_type", "country", "source_ip", "command", "risk_level"]
+# Per-IP / per-command rows aren't kept per minute (that is nearly one row per event)
+MINUTE_DIMENSIONS = ["attack_type", "country", "risk_level"]
+
+# Buckets older than this are deleted (day buckets are kept forever)
+RETENTION = {"minute": timedelta(days=2), "hour": timedelta(days=90)}
+# Long-tail dimensions are cut to their TOP_K values (the rest summed into
+# OTHER) once a bucket is older than TRIM_AFTER
+TRIM_DIMENSIONS = ["source_ip", "command"]
+TRIM_AFTER = {"hour": timedelta(days=7), "day": timedelta(days=30)}
+TOP_K = 100
+# The all-time bucket keeps this many of each (its distinct IPs come from a HyperLogLog)
+ALL_TIME_TOP_K = 10_000
+OTHER = "(other)"
+MISSING = "Unknown"
+
+
+class RollupStore:
+    """Per-bucket event counts at minute/hour/day (and all-time) granularity in SQLite.
+
+    ``rollup`` holds counts per (granularity, dimension, bucket, value);
+    ``bucket_stats`` holds events and distinct source IPs per bucket (NULL
+    for minutes, which don't track IPs); the log checkpoint lives in
+    ``meta`` and is committed with the counts it covers. Hour and day
+    buckets count an IP as distinct when its row is first inserted, so the
+    count stays exact when the bucket's IPs are trimmed later; the all-time
+    count is a HyperLogLog estimate (kept in ``meta``), since its IPs are
+    trimmed to ALL_TIME_TOP_K. Top-N answers over trimmed buckets are
+    approximate.
+    """
+
+    def __init__(self, path=ROLLUP_FILE):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # Counts and checkpoint share a transaction, so a lost commit is simply redone
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS rollup ("
+            " granularity TEXT, dimension TEXT, bucket TEXT, value TEXT, count INTEGER,"
+            " PRIMARY KEY (granularity, dimension, bucket, value)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS bucket_stats ("
+            " granularity TEXT, bucket TEXT, events INTEGER, distinct_ips INTEGER,"
+            " PRIMARY KEY (granularity, bucket)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);"
+            "CREATE INDEX IF NOT EXISTS rollup_all_top ON rollup (dimension, count) WHERE granularity = 'all';"
+        )
+        self._db.commit()
+
+    # --- checkpoint -------------------------------------------------------
+
+    def checkpoint(self):
+        with self._lock:
+            rows = dict(self._db.execute("SELECT key, value FROM meta").fetchall())
+        return {
+            "inode": int(rows["inode"]) if rows.get("inode") else None,
+            "head": rows.get("head"),
+            "offset": int(rows.get("offset", 0)),
+            "rotations": int(rows.get("rotations", 0)),
+        }
+
+    def _set_checkpoint(self, checkpoint):
+        self._db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                             [(k, str(v)) for k, v in checkpoint.items() if v is not None])
+
+    def save_checkpoint(self, checkpoint):
+        with self._lock:
+            self._set_checkpoint(checkpoint)
+            self._db.commit()
+
+    # --- writes -----------------------------------------------------------
+
+    def add(self, df, checkpoint=None, now=None):
+        """Fold enriched events into every granularity (one transaction)."""
+        df = df[df["timestamp"].notna()]
+        now = now or datetime.now()
+        timestamps = df["timestamp"]
+        values = {}
+        for dim in DIMENSIONS:
+            if dim in df.columns:
+                column = df[dim].astype(object)
+                values[dim] = column.where(column.notna(), MISSING).astype(str).to_numpy()
+
+        with self._lock:
+            for granularity, freq in GRANULARITIES.items():
+                # Skip rows downsample() would delete straight away
+                keep = (timestamps >= now - RETENTION[granularity]).to_numpy() if granularity in RETENTION \
+                    else np.ones(len(df), dtype=bool)
+                if not keep.any():
+                    continue
+                if freq is None:
+                    codes, labels = np.zeros(int(keep.sum()), dtype=np.intp), [ALL_TIME]
+                else:
+                    codes, uniques = pd.factorize(timestamps[keep].dt.floor(freq))
+                    labels = list(uniques.strftime(BUCKET_FORMAT))
+                events = np.bincount(codes, minlength=len(labels))
+                self._db.executemany(
+                    "INSERT INTO bucket_stats (granularity, bucket, events) VALUES (?, ?, ?)"
+                    " ON CONFLICT DO UPDATE SET events = events + excluded.events",
+                    [(granularity, label, int(n)) for label, n in zip(labels, events)])
+
+                dims = MINUTE_DIMENSIONS if granularity == "minute" else DIMENSIONS
+                if "source_ip" in dims and "source_ip" in values:
+                    self._count_distinct(granularity, labels, codes, values["source_ip"][keep])
+                for dim in dims:
+                    if dim not in values:
+                        continue
+                    counts = pd.DataFrame({"bucket": codes, "value": values[dim][keep]})
+                    counts = counts.groupby(["bucket", "value"], sort=False).size()
+                    self._db.executemany(
+                        "INSERT INTO rollup (granularity, dimension, bucket, value, count) VALUES (?, ?, ?, ?, ?)"
+                        " ON CONFLICT DO UPDATE SET count = count + excluded.count",
+                        [(granularity, dim, labels[b], v, int(n)) for (b, v), n in counts.items()])
+            if checkpoint:
+                self._set_checkpoint(checkpoint)
+            self._db.commit()
+
+    def _count_distinct(self, granularity, labels, codes, ips):
+        """Add the chunk's new IPs to its buckets' distinct counts (call before their rows are upserted)."""
+        if granularity == ALL_TIME:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'all_ips'").fetchone()
+            if row:
+                sketch = HyperLogLog.from_dict(json.loads(row[0]))
+            else:  # rollups from before the sketch: seed it with the (untrimmed) all-time IPs
+                sketch = HyperLogLog().update([v for (v,) in self._db.execute(
+                    "SELECT value FROM rollup WHERE granularity = ? AND dimension = 'source_ip' AND value != ?",
+                    (ALL_TIME, OTHER))])
+            sketch.update(ips)
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('all_ips', ?)",
+                             (json.dumps(sketch.to_dict()),))
+            self._db.execute("UPDATE bucket_stats SET distinct_ips = ? WHERE granularity = ? AND bucket = ?",
+                             (sketch.count(), granularity, ALL_TIME))
+            return
+        pairs = pd.DataFrame({"bucket": codes, "value": ips}).drop_duplicates()
+        for b, group in pairs.groupby("bucket", sort=False):
+            # Primary-key lookups of the chunk's IPs only, however many the bucket already holds
+            chunk = list(group["value"])
+            seen = 0
+            for i in range(0, len(chunk), 500):
+                batch = chunk[i:i + 500]
+                seen += self._db.execute(
+                    "SELECT COUNT(*) FROM rollup WHERE granularity = ? AND dimension = 'source_ip' AND bucket = ?"
+                    f" AND value IN ({','.join('?' * len(batch))})", (granularity, labels[b], *batch)).fetchone()[0]
+            new = len(chunk) - seen
+            self._db.execute(
+                "UPDATE bucket_stats SET distinct_ips = COALESCE(distinct_ips, 0) + ? WHERE granularity = ? AND bucket = ?",
+                (new, granularity, labels[b]))
+
+    def downsample(self, now=None):
+        """Drop expired fine-grained buckets and trim long tails of old ones."""
+        now = now or datetime.now()
+        deleted = trimmed = 0
+        with self._lock:
+            for granularity, age in RETENTION.items():
+                cutoff = (now - age).strftime(BUCKET_FORMAT)
+                for table in ("rollup", "bucket_stats"):
+                    deleted += self._db.execute(
+                        f"DELETE FROM {table} WHERE granularity = ? AND bucket < ?", (granularity, cutoff)).rowcount
+            for granularity, age in TRIM_AFTER.items():
+                cutoff = (now - age).strftime(BUCKET_FORMAT)
+                for dim in TRIM_DIMENSIONS:
+                    trimmed += self._trim(granularity, dim, cutoff)
+            for dim in TRIM_DIMENSIONS:
+                trimmed += self._trim(ALL_TIME, dim, "~", ALL_TIME_TOP_K)
+            self._db.commit()
+        return deleted, trimmed
+
+    def _trim(self, granularity, dim, cutoff, keep=TOP_K):
+        rows = self._db.execute(
+            "SELECT bucket, COUNT(*) FROM rollup WHERE granularity = ? AND dimension = ? AND bucket < ?"
+            " GROUP BY bucket HAVING COUNT(*) > ?", (granularity, dim, cutoff, keep + 1)).fetchall()
+        for bucket, _ in rows:
+            tail = self._db.execute(
+                "SELECT value, count FROM rollup WHERE granularity = ? AND dimension = ? AND bucket = ?"
+                " AND value != ? ORDER BY count DESC, value LIMIT -1 OFFSET ?",
+                (granularity, dim, bucket, OTHER, keep)).fetchall()
+            self._db.executemany(
+                "DELETE FROM rollup WHERE granularity = ? AND dimension = ? AND bucket = ? AND value = ?",
+                [(granularity, dim, bucket, value) for value, _ in tail])
+            self._db.execute(
+                "INSERT INTO rollup (granularity, dimension, bucket, value, count) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT DO UPDATE SET count = count + excluded.count",
+                (granularity, dim, bucket, OTHER, sum(n for _, n in tail)))
+        return len(rows)
+
+    # --- reads ------------------------------------------------------------
+
+    @staticmethod
+    def _range(start, end):
+        start = pd.Timestamp(start).strftime(BUCKET_FORMAT) if start is not None else ""
+        # "~" sorts after every timestamp and after the ALL_TIME bucket name
+        end = pd.Timestamp(end).strftime(BUCKET_FORMAT) if end is not None else "~"
+        return start, end
+
+    def totals(self, granularity="all", start=None, end=None):
+        """Events in buckets starting within [start, end] (all-time by default)."""
+        if granularity == ALL_TIME:
+            start = end = None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COALESCE(SUM(events), 0) FROM bucket_stats WHERE granularity = ? AND bucket BETWEEN ? AND ?",
+                (granularity, *self._range(start, end))).fetchone()
+        return row[0]
+
+    def counts(self, dimension, granularity="all", start=None, end=None, limit=None, include_other=False):
+        """{value: count} for one dimension, largest first (all-time by default)."""
+        if granularity == ALL_TIME:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT value, count FROM rollup WHERE granularity = 'all' AND dimension = ?"
+                    " AND (? OR value != ?) ORDER BY count DESC, value LIMIT ?",
+                    (dimension, include_other, OTHER, limit or -1)).fetchall()
+            return dict(rows)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT value, SUM(count) AS n FROM rollup WHERE granularity = ? AND dimension = ?"
+                " AND bucket BETWEEN ? AND ? AND (? OR value != ?) GROUP BY value ORDER BY n DESC, value LIMIT ?",
+                (granularity, dimension, *self._range(start, end), include_other, OTHER, limit or -1)).fetchall()
+        return dict(rows)
+
+    def series(self, granularity="hour", dimension=None, value=None, start=None, end=None):
+        """[(bucket, events, distinct_ips)] or, for a dimension value, [(bucket, count)]."""
+        with self._lock:
+            if dimension is None:
+                return self._db.execute(
+                    "SELECT bucket, events, distinct_ips FROM bucket_stats WHERE granularity = ?"
+                    " AND bucket BETWEEN ? AND ? ORDER BY bucket", (granularity, *self._range(start, end))).fetchall()
+            return self._db.execute(
+                "SELECT bucket, SUM(count) FROM rollup WHERE granularity = ? AND dimension = ?"
+                " AND (? IS NULL OR value = ?) AND bucket BETWEEN ? AND ? GROUP BY bucket ORDER BY bucket",
+                (granularity, dimension, value, value, *self._range(start, end))).fetchall()
+
+    def bucket_counts(self, granularity, dimension=None, start=None, end=None):
+        """[(bucket, value, count)] for buckets starting within [start, end] (value None without a dimension)."""
+        with self._lock:
+            if dimension is None:
+                return self._db.execute(
+                    "SELECT bucket, NULL, events FROM bucket_stats WHERE granularity = ? AND bucket BETWEEN ? AND ?",
+                    (granularity, *self._range(start, end))).fetchall()
+            return self._db.execute(
+                "SELECT bucket, value, count FROM rollup WHERE granularity = ? AND dimension = ?"
+                " AND bucket BETWEEN ? AND ?", (granularity, dimension, *self._range(start, end))).fetchall()
+
+    def is_empty(self):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM bucket_stats LIMIT 1").fetchone() is None
+
+    def reset(self):
+        with self._lock:
+            self._db.executescript("DELETE FROM rollup; DELETE FROM bucket_stats; DELETE FROM meta;")
+
+
+def with_geo_country(df, geo=None):
+    """Prefer the geo-located country (see ``located_countries``) over the reputation provider's."""
+    countries = located_countries(df["source_ip"].unique(), geo)
+    df = df.copy(deep=False)
+    df["country"] = df["source_ip"].astype(object).map(countries).fillna(df["country"])
+    return df
+
+
+def run_rollups(full=False, log_file=LOG_FILE, store=None, delta=None):
+    """Fold newly appended log records into the rollups, then downsample.
+
+    ``delta`` is the pipeline's load output with ``events`` already enriched
+    (threat columns, geo-located country); it is folded in as it is when the
+    rollups' checkpoint is where it starts. Otherwise (no delta, or the
+    rollups fell behind) the log is read and enriched here, up to the end
+    of the delta if there is one.
+    """
+    store = store or default_rollups()
+    if full:
+        store.reset()
+    checkpoint = store.checkpoint()
+    start = time.perf_counter()
+    new_events = 0
+    if delta is not None and same_position(checkpoint, delta["from"]):
+        new_events = len(delta["events"])
+        until = {**delta["until"], "rotations": checkpoint["rotations"]}
+        if new_events:
+            store.add(delta["events"], until)
+        else:
+            store.save_checkpoint(until)
+    else:
+        cursor = LogCursor(checkpoint, log_file, until=delta["until"] if delta is not None else None)
+        if not cursor.exists():
+            print(f"[!] Log file not found: {log_file}")
+            return store
+        for chunk, position in cursor:
+            df = with_geo_country(enrich_threats(classify_logs(chunk)))
+            store.add(df, {**position, "rotations": checkpoint["rotations"]})
+            new_events += len(chunk)
+        if new_events == 0:
+            # Still record the inode so a rotation isn't detected twice
+            store.save_checkpoint({**cursor.position, "rotations": checkpoint["rotations"]})
+    deleted, trimmed = store.downsample()
+    print(f"[+] Rollups: {new_events} new events in {time.perf_counter() - start:.2f}s "
+          f"({deleted} expired rows, {trimmed} buckets trimmed)")
+    return store
+
+
+_default = None
+
+def default_rollups():
+    global _default
+    if _default is None:
+        _default = RollupStore()
+    return _default
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain minute/hour/day rollups of the attack log")
+    parser.add_argument("--full", action="store_true", help="discard rollups and rebuild from the oldest segment")
+    args = parser.parse_args()
+
+    rollups = run_rollups(full=args.full)
+    print(f"[*] {rollups.totals():,} events rolled up")
+    for dim in ("attack_type", "country"):
+        print(f"\n{dim}:")
+        for value, count in rollups.counts(dim, limit=5).items():
+            print(f"  - {value}: {count}")
@@ -0,0 +1,213 @@
+import argparse
+import json
+import math
+import os
+import posixpath
+import time
+
+import pandas as pd
+
+from attack_classifier import classify_command
+from log_loader import BASE_DIR, LOG_FILE, LogCursor
+from report_store import default_store
+
+STATE_FILE = os.path.join(BASE_DIR, "reports", "state", "sessions.json")
+
+# A session with no end record is closed after this much silence; logs
+# written before the honeypot had session ids are split on it per IP
+SESSION_GAP = 300
+CREDENTIAL_VERBS = {"login", "user", "username", "pass", "password", "passwd", "su", "sudo", "enable", "admin"}
+
+# Numeric per-session features, in the order scorers should use them
+FEATURE_COLUMNS = [
+    "duration", "commands", "mean_gap", "min_gap", "max_gap", "distinct_verbs",
+    "credential_attempts", "download_attempts", "bytes_in", "bytes_out",
+]
+EVENT_COLUMNS = ["timestamp", "source_ip", "command", "event", "session_id",
+                 "reason", "duration", "bytes_in", "bytes_out"]
+
+
+def _present(value):
+    return value is not None and not (isinstance(value, float) and math.isnan(value))
+
+
+class SessionTracker:
+    """Groups time-ordered log events into sessions in a single pass.
+
+    Only open sessions are held: a session is finished by its
+    ``session_end`` record, or after ``gap`` seconds without events. Events
+    without a session id (older logs) are grouped per source IP instead.
+    Finished sessions come back as feature rows.
+    """
+
+    def __init__(self, gap=SESSION_GAP, open_sessions=None):
+        self.gap = gap
+        self.open = dict(open_sessions or {})
+        # legacy grouping: source IP -> key of its open session
+        self.by_ip = {s["source_ip"]: key for key, s in self.open.items() if s.get("legacy")}
+
+    def _start(self, key, ip, ts, legacy=False):
+        session = {"session_id": key, "source_ip": ip, "start": ts, "last": ts, "commands": 0,
+                   "gap_sum": 0.0, "min_gap": None, "max_gap": 0.0, "verbs": [],
+                   "credentials": 0, "downloads": 0, "legacy": legacy}
+        self.open[key] = session
+        if legacy:
+            self.by_ip[ip] = key
+        return session
+
+    def _command(self, session, ts, command):
+        if session["commands"]:
+            gap = ts - session["last"]
+            session["gap_sum"] += gap
+            session["min_gap"] = gap if session["min_gap"] is None else min(session["min_gap"], gap)
+            session["max_gap"] = max(session["max_gap"], gap)
+        session["commands"] += 1
+        session["last"] = ts
+        args = str(command or "").split()
+        verb = posixpath.basename(args[0]).lower() if args else ""
+        if verb and verb not in session["verbs"]:
+            session["verbs"].append(verb)
+        attack_type = classify_command(command)
+        if verb in CREDENTIAL_VERBS or attack_type == "Brute Force Attempt":
+            session["credentials"] += 1
+        if attack_type == "Malware Download Attempt":
+            session["downloads"] += 1
+
+    def _finish(self, key, end=None, reason="idle"):
+        session = self.open.pop(key)
+        if session.get("legacy") and self.by_ip.get(session["source_ip"]) == key:
+            del self.by_ip[session["source_ip"]]
+        end = end or {}
+        intervals = session["commands"] - 1
+        return {
+            "timestamp": pd.Timestamp(end.get("ts", session["last"]), unit="s").round("us"),
+            "session_id": key,
+            "source_ip": session["source_ip"],
+            "start": pd.Timestamp(session["start"], unit="s").round("us"),
+            "duration": float(end["duration"]) if _present(end.get("duration"))
+            else session["last"] - session["start"],
+            "commands": session["commands"],
+            "mean_gap": session["gap_sum"] / intervals if intervals > 0 else 0.0,
+            "min_gap": session["min_gap"] or 0.0,
+            "max_gap": session["max_gap"],
+            "distinct_verbs": len(session["verbs"]),
+            "credential_attempts": session["credentials"],
+            "download_attempts": session["downloads"],
+            "bytes_in": int(end["bytes_in"]) if _present(end.get("bytes_in")) else 0,
+            "bytes_out": int(end["bytes_out"]) if _present(end.get("bytes_out")) else 0,
+            "end_reason": end.get("reason") if _present(end.get("reason")) else reason,
+        }
+
+    def feed(self, df):
+        """Process one chunk of events (lifecycle records included); returns finished sessions."""
+        finished = []
+        if df.empty:
+            return finished
+        events = df.reindex(columns=EVENT_COLUMNS)
+        seconds = (events["timestamp"] - pd.Timestamp(0)).dt.total_seconds()
+        for ts, ip, command, event, sid, reason, duration, bytes_in, bytes_out in zip(
+                seconds, events["source_ip"], events["command"], events["event"], events["session_id"],
+                events["reason"], events["duration"], events["bytes_in"], events["bytes_out"]):
+            if not _present(sid):
+                key = self.by_ip.get(ip)
+                if key is not None and ts - self.open[key]["last"] > self.gap:
+                    finished.append(self._finish(key))
+                    key = None
+                session = self.open[key] if key is not None else self._start(f"{ip}@{ts:.0f}", ip, ts, True)
+            elif event == "session_end":
+                if sid not in self.open:
+                    self._start(sid, ip, ts)
+                finished.append(self._finish(sid, {"ts": ts, "reason": reason, "duration": duration,
+                                                   "bytes_in": bytes_in, "bytes_out": bytes_out}))
+                continue
+            else:
+                session = self.open.get(sid) or self._start(sid, ip, ts)
+            if event != "session_start":
+                self._command(session, ts, command)
+        finished.extend(self.expire(seconds.max()))
+        return finished
+
+    def expire(self, now):
+        """Finish sessions silent for longer than the gap (e.g. the honeypot died mid-session)."""
+        stale = [key for key, s in self.open.items() if now - s["last"] > self.gap]
+        return [self._finish(key) for key in stale]
+
+    def flush(self):
+        """Finish every open session."""
+        return [self._finish(key) for key in list(self.open)]
+
+
+def empty_state():
+    return {"checkpoint": {"inode": None, "offset": 0, "rotations": 0}, "open": {}}
+
+def load_state(path=STATE_FILE):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return empty_state()
+
+def save_state(state, path=STATE_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+def run_sessions(full=False, log_file=LOG_FILE, state_file=STATE_FILE, store=None):
+    """Reconstruct sessions from newly appended log records and store their features.
+
+    Open sessions are carried in the state file with the log checkpoint.
+    Returns the sessions finished in this run as a DataFrame.
+    """
+    store = store or default_store()
+    state = empty_state() if full else load_state(state_file)
+    if full:
+        store.drop("session")
+    if not LogCursor(state["checkpoint"], log_file).exists():
+        print(f"[!] Log file not found: {log_file}")
+        return pd.DataFrame(columns=["session_id", "source_ip", *FEATURE_COLUMNS])
+
+    start = time.perf_counter()
+    tracker = SessionTracker(open_sessions=state["open"])
+    batch = store.checkpoint("session")
+    replayed = []
+    if batch and batch["from"] == state["checkpoint"]:
+        # The last run stored its sessions but died before saving its state: redo it without storing them
+        replay = LogCursor(dict(state["checkpoint"]), log_file, lifecycle=True, until=batch["until"])
+        for chunk, _ in replay:
+            replayed.extend(tracker.feed(chunk))
+        state["checkpoint"].update(replay.position)
+    since = dict(state["checkpoint"])
+    cursor = LogCursor(state["checkpoint"], log_file, lifecycle=True)
+    frames = []
+    for chunk, _ in cursor:
+        finished = tracker.feed(chunk)
+        if finished:
+            frames.append(pd.DataFrame(finished))
+    state["checkpoint"].update(cursor.position)
+    state["open"] = tracker.open
+    if frames:
+        # Stored with the log range they came from, so a crash before save_state can't store them twice
+        store.append("session", pd.concat(frames, ignore_index=True),
+                     checkpoint={"from": since, "until": dict(cursor.position)})
+    save_state(state, state_file)
+    if replayed:
+        frames.insert(0, pd.DataFrame(replayed))  # finished in the lost run, so not scored yet either
+    total = sum(len(f) for f in frames)
+    print(f"[+] Sessions: {total} finished, {len(tracker.open)} still open "
+          f"({time.perf_counter() - start:.2f}s)")
+    if not frames:
+        return pd.DataFrame(columns=["session_id", "source_ip", *FEATURE_COLUMNS])
+    return pd.concat(frames, ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconstruct attacker sessions and extract per-session features")
+    parser.add_argument("--full", action="store_true", help="drop the session report and rescan from the oldest segment")
+    args = parser.parse_args()
+
+    run_sessions(full=args.full)
+    sessions = default_store().tail("session", 10)
+    if not sessions.empty:
+        print(sessions[["session_id", "source_ip", *FEATURE_COLUMNS]].to_string(index=False))
@@ -0,0 +1,535 @@
+import argparse
+import base64
+import json
+import math
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from geoip import located_countries
+from log_loader import BASE_DIR, LOG_FILE, LogCursor, same_position
+
+SKETCH_FILE = os.path.join(BASE_DIR, "reports", "state", "sketches.json")
+
+HEAVY_KEYS = ["source_ip", "command", "country"]
+TOP_K = 1000              # Space-Saving counters per key
+CM_WIDTH, CM_DEPTH = 2048, 5
+HLL_PRECISION = 14        # all-time distinct IPs: 16 KB, ~0.8% error
+WINDOW_PRECISION = 12     # per-day distinct IPs: 4 KB, ~1.6% error
+WINDOW_DAYS = 30
+TDIGEST_COMPRESSION = 200
+SESSION_GAP = 300         # seconds of silence that end an attacker's session
+
+
+def _hash(values):
+    """Stable 64-bit hashes of values as strings (nulls dropped).
+
+    ``pd.util.hash_array`` uses a fixed key, so sketches built in different
+    processes or on different honeypot nodes hash identically and can be merged.
+    """
+    s = pd.Series(values)
+    s = s[s.notna()]
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        categories = np.asarray(s.cat.categories.astype(str), dtype=object)
+        return pd.util.hash_array(categories)[s.cat.codes.to_numpy()]
+    return pd.util.hash_array(np.asarray(s.astype(str), dtype=object))
+
+
+def _value_counts(values):
+    """Exact counts of a batch as a Series indexed by the values as strings, largest first."""
+    counts = pd.Series(values).value_counts()
+    counts = counts[counts > 0]
+    counts.index = counts.index.astype(str)
+    return counts
+
+
+def _encode(array):
+    return base64.b64encode(np.ascontiguousarray(array).tobytes()).decode("ascii")
+
+
+def _decode(text, dtype, shape=None):
+    array = np.frombuffer(base64.b64decode(text), dtype=dtype).copy()
+    return array.reshape(shape) if shape else array
+
+
+class SpaceSaving:
+    """Top-k heavy hitters in ``k`` counters (Metwally et al.).
+
+    Each tracked item has an estimate and an error: the true count lies in
+    ``[count - error, count]``. Errors never exceed N/k (N = total weight
+    added), so every item with a true count above N/k is tracked. Merging
+    two summaries keeps the same bound over the combined stream (Agarwal et
+    al., "Mergeable Summaries").
+    """
+
+    def __init__(self, k=TOP_K):
+        self.k = k
+        self.n = 0
+        self.counters = {}   # item -> [count, error]
+
+    def floor(self):
+        """Upper bound on the count of any untracked item."""
+        if len(self.counters) < self.k:
+            return 0
+        return min(c for c, _ in self.counters.values())
+
+    def add(self, item, weight=1):
+        self.n += weight
+        if item in self.counters:
+            self.counters[item][0] += weight
+        elif len(self.counters) < self.k:
+            self.counters[item] = [weight, 0]
+        else:
+            victim = min(self.counters, key=lambda x: self.counters[x][0])
+            floor = self.counters.pop(victim)[0]
+            self.counters[item] = [floor + weight, floor]
+
+    def update(self, values):
+        """Add a batch of values: count them exactly, then merge that summary in.
+
+        Only the batch's own top k can displace tracked items, so the merge
+        looks at those plus the current counters rather than every value.
+        """
+        counts = _value_counts(values)
+        if counts.empty:
+            return self
+        floor = self.floor()
+        tracked = pd.DataFrame.from_dict(self.counters, orient="index", columns=["count", "error"])
+        tracked = tracked.astype("int64")
+        candidates = tracked.index.union(counts.index[:self.k], sort=False)
+        merged = pd.DataFrame({
+            "count": tracked["count"].reindex(candidates, fill_value=floor) + counts.reindex(candidates, fill_value=0),
+            "error": tracked["error"].reindex(candidates, fill_value=floor),
+        }).nlargest(self.k, "count")
+        self.n += int(counts.sum())
+        self.counters = {item: [int(c), int(e)] for item, c, e in
+                         zip(merged.index, merged["count"], merged["error"])}
+        return self
+
+    def merge(self, other):
+        """Fold in another summary; absent items are assumed to be at the other side's floor."""
+        mine, theirs = self.floor(), other.floor()
+        merged = {}
+        for item in self.counters.keys() | other.counters.keys():
+            c1, e1 = self.counters.get(item, (mine, mine))
+            c2, e2 = other.counters.get(item, (theirs, theirs))
+            merged[item] = [c1 + c2, e1 + e2]
+        self.n += other.n
+        self.counters = dict(sorted(merged.items(), key=lambda kv: kv[1][0], reverse=True)[:self.k])
+        return self
+
+    def top(self, n=10):
+        """[(item, count, error)] by estimated count."""
+        ranked = sorted(self.counters.items(), key=lambda kv: kv[1][0], reverse=True)[:n]
+        return [(item, count, error) for item, (count, error) in ranked]
+
+    def to_dict(self):
+        return {"type": "space_saving", "k": self.k, "n": self.n, "counters": self.counters}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["k"])
+        sketch.n = data["n"]
+        sketch.counters = {item: list(v) for item, v in data["counters"].items()}
+        return sketch
+
+
+class CountMinSketch:
+    """Point frequency estimates in ``depth`` x ``width`` counters (Cormode & Muthukrishnan).
+
+    Estimates never undercount; with probability at least 1 - e^-depth they
+    overcount by at most e/width * N. The defaults (2048 x 5, 80 KB) give
+    0.13% of N with 99.3% confidence. Only sketches of the same shape merge.
+    """
+
+    def __init__(self, width=CM_WIDTH, depth=CM_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.n = 0
+        self.table = np.zeros((depth, width), dtype=np.uint64)
+
+    def _columns(self, hashes):
+        # Kirsch-Mitzenmacher: row i uses h1 + i * h2
+        h1 = hashes & 0xFFFFFFFF
+        h2 = hashes >> np.uint64(32)
+        return [(h1 + np.uint64(i) * h2) % np.uint64(self.width) for i in range(self.depth)]
+
+    def update(self, values, weights=None):
+        counts = _value_counts(values) if weights is None \
+            else pd.Series(weights, index=pd.Index(values).astype(str)).groupby(level=0).sum()
+        weights = counts.to_numpy(dtype=np.uint64)
+        for row, columns in enumerate(self._columns(_hash(counts.index))):
+            np.add.at(self.table[row], columns.astype(np.intp), weights)
+        self.n += int(weights.sum())
+        return self
+
+    def estimate(self, item):
+        columns = self._columns(_hash([item]))
+        return int(min(self.table[row, col[0]] for row, col in enumerate(columns)))
+
+    def error_bound(self):
+        return math.e / self.width * self.n
+
+    def merge(self, other):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Count-Min sketches of different shapes can't be merged")
+        self.table += other.table
+        self.n += other.n
+        return self
+
+    def to_dict(self):
+        return {"type": "count_min", "width": self.width, "depth": self.depth, "n": self.n,
+                "table": _encode(self.table)}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["width"], data["depth"])
+        sketch.n = data["n"]
+        sketch.table = _decode(data["table"], np.uint64, (sketch.depth, sketch.width))
+        return sketch
+
+
+class HyperLogLog:
+    """Distinct count in 2^p one-byte registers (Flajolet et al., with linear counting for small sets).
+
+    Standard error is 1.04 / sqrt(2^p): 0.81% at p=14, 1.6% at p=12.
+    Merging takes the register-wise maximum, so the union of any number of
+    nodes or windows has the same error as a single sketch.
+    """
+
+    def __init__(self, p=HLL_PRECISION):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def update(self, values):
+        hashes = _hash(values)
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.intp)
+        rest = hashes << np.uint64(self.p)
+        # Vectorized count of leading zeros in the remaining 64 - p bits
+        zeros = np.zeros(len(rest), dtype=np.uint8)
+        for shift in (32, 16, 8, 4, 2, 1):
+            small = rest < np.uint64(1 << (64 - shift))
+            zeros[small] += shift
+            rest = np.where(small, rest << np.uint64(shift), rest)
+        rank = np.minimum(zeros, 64 - self.p) + 1
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+        return self
+
+    def add(self, item):
+        return self.update([item])
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        empty = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and empty:
+            estimate = m * math.log(m / empty)
+        return int(round(estimate))
+
+    def standard_error(self):
+        return 1.04 / math.sqrt(1 << self.p)
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError("HyperLogLogs of different precision can't be merged")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def to_dict(self):
+        return {"type": "hyperloglog", "p": self.p, "registers": _encode(self.registers)}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["p"])
+        sketch.registers = _decode(data["registers"], np.uint8)
+        return sketch
+
+
+class TDigest:
+    """Quantiles from at most ~compression/2 weighted centroids (Dunning's merging t-digest).
+
+    Centroids are sized by the arcsine scale function, so they are small
+    near the tails: rank error is roughly proportional to q(1 - q) /
+    compression. There is no hard worst-case bound; with the default
+    compression the benchmark checks rank error below 0.5% at p50 and
+    below 0.1% at p99, also after merging.
+    """
+
+    def __init__(self, compression=TDIGEST_COMPRESSION):
+        self.compression = compression
+        self.means = np.zeros(0)
+        self.weights = np.zeros(0)
+        self.min = math.inf
+        self.max = -math.inf
+
+    @property
+    def n(self):
+        return float(self.weights.sum())
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        # Midpoint quantile of each item -> unit-wide bins of k(q) = delta/2pi * asin(2q - 1)
+        q = (np.cumsum(weights) - weights / 2) / total
+        k = self.compression / (2 * math.pi) * np.arcsin(2 * q - 1)
+        bins = np.floor(k - k[0]).astype(np.intp)
+        w = np.bincount(bins, weights)
+        keep = w > 0
+        self.weights = w[keep]
+        self.means = np.bincount(bins, weights * means)[keep] / self.weights
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.min = min(self.min, float(values.min()))
+            self.max = max(self.max, float(values.max()))
+            self._compress(np.concatenate([self.means, values]),
+                           np.concatenate([self.weights, np.ones(len(values))]))
+        return self
+
+    def merge(self, other):
+        if len(other.weights):
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            self._compress(np.concatenate([self.means, other.means]),
+                           np.concatenate([self.weights, other.weights]))
+        return self
+
+    def quantile(self, q):
+        if not len(self.weights):
+            return None
+        if len(self.weights) == 1:
+            return float(self.means[0])
+        # Interpolate between centroid centres, pinned to the exact min and max
+        ranks = np.concatenate([[0], np.cumsum(self.weights) - self.weights / 2, [self.n]])
+        points = np.concatenate([[self.min], self.means, [self.max]])
+        return float(np.interp(q * self.n, ranks, points))
+
+    def to_dict(self):
+        return {"type": "tdigest", "compression": self.compression, "min": self.min, "max": self.max,
+                "means": self.means.tolist(), "weights": self.weights.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["compression"])
+        sketch.min, sketch.max = data["min"], data["max"]
+        sketch.means = np.asarray(data["means"], dtype=float)
+        sketch.weights = np.asarray(data["weights"], dtype=float)
+        return sketch
+
+
+SKETCH_TYPES = {"space_saving": SpaceSaving, "count_min": CountMinSketch,
+                "hyperloglog": HyperLogLog, "tdigest": TDigest}
+
+def load_sketch(data):
+    return SKETCH_TYPES[data["type"]].from_dict(data)
+
+
+class StreamStats:
+    """Bounded-memory attack statistics built from a stream of log chunks.
+
+    Heavy hitters per key (Space-Saving, plus Count-Min for per-IP lookups),
+    distinct source IPs all-time and per day (HyperLogLog), and session
+    duration / commands-per-session quantiles (t-digest). A session is one
+    IP's events without a gap longer than SESSION_GAP; sessions still open
+    at the end of a chunk are carried over. Serializes to JSON and merges
+    across nodes and time ranges.
+    """
+
+    def __init__(self):
+        self.events = 0
+        self.heavy = {}
+        self.ip_counts = CountMinSketch()
+        self.distinct = HyperLogLog()
+        self.windows = {}    # "YYYY-MM-DD" -> HyperLogLog
+        self.durations = TDigest()
+        self.commands = TDigest()
+        self.open_sessions = {}  # ip -> [first epoch s, last epoch s, commands]
+
+    def update(self, df):
+        if df.empty:
+            return self
+        self.events += len(df)
+        for key in HEAVY_KEYS:
+            if key in df.columns:
+                self.heavy.setdefault(key, SpaceSaving()).update(df[key].dropna())
+        ips = df["source_ip"]
+        self.ip_counts.update(ips.dropna())
+        self.distinct.update(ips)
+        days = df["timestamp"].dt.strftime("%Y-%m-%d")
+        for day, day_ips in ips.groupby(days, observed=True):
+            self.windows.setdefault(day, HyperLogLog(WINDOW_PRECISION)).update(day_ips)
+        for day in sorted(self.windows)[:-WINDOW_DAYS]:
+            del self.windows[day]
+        self._sessions(df)
+        return self
+
+    def _sessions(self, df):
+        seconds = (df["timestamp"] - pd.Timestamp(0)).dt.total_seconds()
+        events = pd.DataFrame({"ip": df["source_ip"].astype(str), "start": seconds, "end": seconds, "n": 1})
+        rows = pd.concat([self._open_frame(), events], ignore_index=True).sort_values(["ip", "start"], kind="stable")
+        prev_end = rows.groupby("ip", sort=False)["end"].cummax().groupby(rows["ip"], sort=False).shift()
+        session = (prev_end.isna() | (rows["start"] - prev_end > SESSION_GAP)).cumsum()
+        sessions = rows.groupby(session).agg(ip=("ip", "first"), start=("start", "min"),
+                                             end=("end", "max"), n=("n", "sum"))
+        closed = sessions["end"] < seconds.max() - SESSION_GAP
+        self.close_sessions(sessions[closed])
+        still_open = sessions[~closed]
+        self.open_sessions = {ip: [s, e, int(n)] for ip, s, e, n in
+                              zip(still_open["ip"], still_open["start"], still_open["end"], still_open["n"])}
+
+    def _open_frame(self):
+        frame = pd.DataFrame([[ip, *v] for ip, v in self.open_sessions.items()],
+                             columns=["ip", "start", "end", "n"])
+        return frame.astype({"ip": object, "start": float, "end": float, "n": "int64"})
+
+    def close_sessions(self, sessions=None):
+        """Record sessions in the digests (all open ones when called without arguments)."""
+        if sessions is None:
+            sessions = self._open_frame()
+            self.open_sessions = {}
+        self.durations.update((sessions["end"] - sessions["start"]).to_numpy())
+        self.commands.update(sessions["n"].to_numpy())
+
+    def merge(self, other):
+        self.events += other.events
+        for key, sketch in other.heavy.items():
+            self.heavy.setdefault(key, SpaceSaving(sketch.k)).merge(sketch)
+        self.ip_counts.merge(other.ip_counts)
+        self.distinct.merge(other.distinct)
+        for day, sketch in other.windows.items():
+            self.windows.setdefault(day, HyperLogLog(sketch.p)).merge(sketch)
+        self.durations.merge(other.durations)
+        self.commands.merge(other.commands)
+        # An IP active on several nodes at once is one session across the fleet
+        for ip, (start, end, n) in other.open_sessions.items():
+            mine = self.open_sessions.get(ip)
+            self.open_sessions[ip] = [min(mine[0], start), max(mine[1], end), mine[2] + n] if mine \
+                else [start, end, n]
+        return self
+
+    def distinct_ips(self, start=None, end=None):
+        """Distinct source IPs, all-time or over the per-day windows between two dates."""
+        if start is None and end is None:
+            return self.distinct.count()
+        union = HyperLogLog(WINDOW_PRECISION)
+        for day, sketch in self.windows.items():
+            if (start is None or day >= str(start)[:10]) and (end is None or day <= str(end)[:10]):
+                union.merge(sketch)
+        return union.count()
+
+    def top(self, key, n=5):
+        sketch = self.heavy.get(key)
+        return {item: count for item, count, _ in sketch.top(n)} if sketch else {}
+
+    def to_dict(self):
+        return {
+            "events": self.events,
+            "heavy": {key: sketch.to_dict() for key, sketch in self.heavy.items()},
+            "ip_counts": self.ip_counts.to_dict(),
+            "distinct": self.distinct.to_dict(),
+            "windows": {day: sketch.to_dict() for day, sketch in self.windows.items()},
+            "durations": self.durations.to_dict(),
+            "commands": self.commands.to_dict(),
+            "open_sessions": self.open_sessions,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.events = data["events"]
+        stats.heavy = {key: load_sketch(d) for key, d in data["heavy"].items()}
+        stats.ip_counts = load_sketch(data["ip_counts"])
+        stats.distinct = load_sketch(data["distinct"])
+        stats.windows = {day: load_sketch(d) for day, d in data["windows"].items()}
+        stats.durations = load_sketch(data["durations"])
+        stats.commands = load_sketch(data["commands"])
+        stats.open_sessions = data["open_sessions"]
+        return stats
+
+
+def load_stats(path=SKETCH_FILE):
+    """(checkpoint, StreamStats) from a sketch state file, or a fresh pair."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return {"inode": None, "offset": 0, "rotations": 0}, StreamStats()
+    return state["checkpoint"], StreamStats.from_dict(state["stats"])
+
+def save_stats(checkpoint, stats, path=SKETCH_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"checkpoint": checkpoint, "stats": stats.to_dict()}, f)
+    os.replace(tmp, path)
+
+def with_country(df, geo=None):
+    """Add the geo-located country of each source IP (see ``located_countries``)."""
+    countries = located_countries(df["source_ip"].unique(), geo)
+    df = df.copy(deep=False)
+    df["country"] = df["source_ip"].astype(object).map(countries)
+    return df
+
+def run_sketches(full=False, log_file=LOG_FILE, path=SKETCH_FILE, delta=None):
+    """Fold newly appended log records into the persisted sketches, one chunk at a time.
+
+    ``delta`` is the pipeline's load output with ``country`` already added
+    (see ``with_country``); it is folded in as it is when the sketches'
+    checkpoint is where it starts, otherwise the log is read here, up to
+    the end of the delta if there is one.
+    """
+    checkpoint, stats = ({"inode": None, "offset": 0, "rotations": 0}, StreamStats()) if full \
+        else load_stats(path)
+    start = time.perf_counter()
+    new_events = 0
+    if delta is not None and same_position(checkpoint, delta["from"]):
+        stats.update(delta["events"])
+        new_events = len(delta["events"])
+        checkpoint.update(delta["until"])
+    else:
+        cursor = LogCursor(checkpoint, log_file, until=delta["until"] if delta is not None else None)
+        if not cursor.exists():
+            print(f"[!] Log file not found: {log_file}")
+            return stats
+        for chunk, _ in cursor:
+            stats.update(with_country(chunk))
+            new_events += len(chunk)
+        checkpoint.update(cursor.position)
+    save_stats(checkpoint, stats, path)
+    print(f"[+] Sketches: {new_events} new events in {time.perf_counter() - start:.2f}s "
+          f"({stats.events} total, ~{stats.distinct_ips():,} distinct IPs)")
+    return stats
+
+def merge_files(paths):
+    """Merge sketch state files from several nodes or periods into one StreamStats."""
+    merged = StreamStats()
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"[!] Sketch file not found: {path}")
+            continue
+        merged.merge(load_stats(path)[1])
+    return merged
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bounded-memory streaming attack statistics")
+    parser.add_argument("--full", action="store_true", help="discard the sketches and rescan from the oldest segment")
+    parser.add_argument("--merge", nargs="+", metavar="FILE", help="report on merged sketch files instead")
+    args = parser.parse_args()
+
+    stats = merge_files(args.merge) if args.merge else run_sketches(full=args.full)
+    print(f"[*] {stats.events:,} events, ~{stats.distinct_ips():,} distinct source IPs")
+    for key in HEAVY_KEYS:
+        print(f"\n{key}:")
+        for item, count in stats.top(key).items():
+            print(f"  - {item}: ~{count}")
+    for name, digest in (("session seconds", stats.durations), ("commands/session", stats.commands)):
+        if digest.n:
+            print(f"\n{name}: p50 {digest.quantile(0.5):.0f}, p90 {digest.quantile(0.9):.0f}, "
+                  f"p99 {digest.quantile(0.99):.0f}")
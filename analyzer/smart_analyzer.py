@@ -1,66 +1,36 @@
-import json
-import pandas as pd
 from datetime import datetime
 import os
 
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-LOG_FILE = os.path.join(BASE_DIR, "logs", "attacks.log")
+from attack_classifier import classify_command, default_classifier
+from log_loader import load_logs
+from report_store import save_report, unstored_events
 
 REPORTS_DIR = "reports"
 
 os.makedirs(REPORTS_DIR, exist_ok=True)
 
-def load_logs():
-    data = []
-    try:
-        with open(LOG_FILE, "r") as f:
-            for line in f:
-                line = line.strip()
-                if line:
-                    try:
-                        data.append(json.loads(line))
-                    except json.JSONDecodeError:
-                        continue
-        return data
-    except FileNotFoundError:
-        print("[!] Log file not found!")
-        return []
-
 def classify_attack(command):
-    if not command:
-        return "Unknown"
-    cmd = command.lower()
-    if "login" in cmd or "admin" in cmd or "password" in cmd:
-        return "Brute Force Attempt"
-    elif "ls" in cmd or "cat" in cmd or "dir" in cmd:
-        return "Reconnaissance"
-    elif "rm" in cmd or "delete" in cmd:
-        return "Destruction Attempt"
-    elif "wget" in cmd or "curl" in cmd:
-        return "Malware Download Attempt"
-    elif "reboot" in cmd or "shutdown" in cmd:
-        return "System Disruption Attempt"
-    else:
-        return "General Probe"
+    """Attack type for one command, per the rules in attack_rules.json."""
+    return classify_command(command)
 
-def analyze_logs():
-    logs = load_logs()
-    if not logs:
-        print("[!] No logs found.")
-        return
+def classify_logs(df):
+    """Return a copy of the events with an attack_type column."""
+    df = df.copy(deep=False)
+    df["attack_type"] = default_classifier().classify_series(df["command"])
+    return df
 
-    df = pd.DataFrame(logs)
+def save_smart_report(df, checkpoint=None):
+    csv_path = os.path.join(REPORTS_DIR, f"smart_report_{datetime.now():%Y%m%d_%H%M%S}.csv")
+    return save_report("smart", df, csv_path, checkpoint)
 
-    if 'command' not in df.columns:
-        print("[!] Command column missing — check honeypot logs format.")
+def analyze_logs():
+    df = load_logs()
+    if df.empty:
+        print("[!] No logs found.")
         return
 
     # Add attack classification
-    df["attack_type"] = df["command"].apply(classify_attack)
-
-    # Convert timestamp to datetime
-    if "timestamp" in df.columns:
-        df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+    df = classify_logs(df)
 
     print("\n===== SMART ATTACK ANALYZER =====")
     print(f"Total Attacks Detected: {len(df)}")
@@ -70,9 +40,9 @@ def analyze_logs():
     print("\nMost Common Commands:")
     print(df["command"].value_counts().head(10))
 
-    csv_path = os.path.join(REPORTS_DIR, f"smart_report_{datetime.now():%Y%m%d_%H%M%S}.csv")
-    df.to_csv(csv_path, index=False)
-    print(f"\n[+] Smart report saved to: {csv_path}")
+    # Only the events the store doesn't have yet are appended
+    events, checkpoint = unstored_events("smart")
+    save_smart_report(classify_logs(events), checkpoint)
 
 if __name__ == "__main__":
     analyze_logs()
@@ -1,114 +1,123 @@
 import os
-import json
+import numpy as np
 import pandas as pd
-import requests
 from datetime import datetime
 
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-LOG_FILE = os.path.join(BASE_DIR, "logs", "attacks.log")
+from ip_filter import default_classifier
+from log_loader import load_logs
+from report_store import save_report, unstored_events
+from reputation import default_service
 
 REPORTS_DIR = "reports"
 os.makedirs(REPORTS_DIR, exist_ok=True)
 
 # Optional: set your free AbuseIPDB key (if available)
-ABUSE_IPDB_API_KEY = ""  # Add key here if you have one
-
-def load_logs():
-    """Load honeypot logs as DataFrame."""
-    if not os.path.exists(LOG_FILE):
-        print("[!] No logs found.")
-        return pd.DataFrame()
-    
-    data = []
-    with open(LOG_FILE, "r") as f:
-        for line in f:
-            try:
-                data.append(json.loads(line.strip()))
-            except json.JSONDecodeError:
-                continue
-    return pd.DataFrame(data)
+ABUSE_IPDB_API_KEY = os.environ.get("ABUSE_IPDB_API_KEY", "")  # Add key here if you have one
+REPUTATION_WORKERS = int(os.environ.get("REPUTATION_WORKERS", 8))
+
+_service = None
+
+def reputation_service():
+    global _service
+    if _service is None:
+        _service = default_service(ABUSE_IPDB_API_KEY, max_workers=REPUTATION_WORKERS)
+    return _service
 
 def check_ip_reputation(ip):
     """Query AbuseIPDB API if key is available, else use mock scoring."""
     if not ip:
         return {"score": 0, "confidence": 0, "country": "Unknown", "isp": "Unknown"}
-
-    if ABUSE_IPDB_API_KEY:
-        try:
-            url = f"https://api.abuseipdb.com/api/v2/check"
-            headers = {"Key": ABUSE_IPDB_API_KEY, "Accept": "application/json"}
-            params = {"ipAddress": ip, "maxAgeInDays": "90"}
-            res = requests.get(url, headers=headers, params=params)
-            if res.status_code == 200:
-                data = res.json()["data"]
-                return {
-                    "score": data.get("abuseConfidenceScore", 0),
-                    "confidence": data.get("totalReports", 0),
-                    "country": data.get("countryCode", "Unknown"),
-                    "isp": data.get("isp", "Unknown")
-                }
-        except Exception as e:
-            print(f"[x] Reputation API failed for {ip}: {e}")
-            pass
-
-    # Fallback mock scoring based on heuristics
-    octets = ip.split(".")
-    risk = int(octets[-1]) % 100 if len(octets) == 4 else 0
-    return {
-        "score": risk,
-        "confidence": risk // 10,
-        "country": "MockLand",
-        "isp": "UnknownISP"
-    }
-
-def compute_threat_score(row):
+    return reputation_service().lookup_many([ip])[ip]
+
+# Scoring weights shared by the row-wise and vectorized scorers
+THREAT_WEIGHTS = {
+    # First tier whose keywords appear in the command wins
+    "command_tiers": [
+        (["wget", "curl", "rm", "shutdown", "reboot"], 40),
+        (["ls", "cat", "dir", "whoami"], 10),
+        (["login", "password", "admin"], 25),
+    ],
+    "risky_ports": [22, 23, 445, 3389],
+    "port_score": 20,
+    "reputation_column": "reputation_score",
+    "reputation_weight": 0.8,
+    "max_score": 100,
+}
+
+def command_score(cmd, weights=THREAT_WEIGHTS):
+    cmd = cmd.lower()
+    for keywords, points in weights["command_tiers"]:
+        if any(k in cmd for k in keywords):
+            return points
+    return 0
+
+def compute_threat_score(row, weights=THREAT_WEIGHTS):
     """Weighted score based on multiple factors."""
     score = 0
 
     # Command-based risk
-    cmd = str(row.get("command", "")).lower()
-    if any(k in cmd for k in ["wget", "curl", "rm", "shutdown", "reboot"]):
-        score += 40
-    elif any(k in cmd for k in ["ls", "cat", "dir", "whoami"]):
-        score += 10
-    elif any(k in cmd for k in ["login", "password", "admin"]):
-        score += 25
+    score += command_score(str(row.get("command", "")), weights)
 
     # Port-based risk
     port = int(row.get("port", 0))
-    if port in [22, 23, 445, 3389]:
-        score += 20
+    if port in weights["risky_ports"]:
+        score += weights["port_score"]
 
     # Add IP reputation
-    rep = row.get("reputation_score", 0)
-    score += rep * 0.8  # weight factor
+    rep = row.get(weights["reputation_column"], 0)
+    score += rep * weights["reputation_weight"]  # weight factor
 
     # Confidence scaling
-    score = min(100, score)
+    score = min(weights["max_score"], score)
     return round(score, 2)
 
-def correlate_threats():
-    df = load_logs()
-    if df.empty:
-        print("[!] No logs found to correlate.")
-        return
-
-    unique_ips = df["source_ip"].unique()
+def compute_threat_scores(df, weights=THREAT_WEIGHTS):
+    """Column-wise equivalent of ``df.apply(compute_threat_score, axis=1)``.
+
+    Commands are scored once per distinct value and broadcast back through
+    factorized codes; ports use ``isin``. Results match the row-wise scorer
+    exactly, including Python's rounding.
+    """
+    n = len(df)
+    if "command" in df.columns:
+        codes, uniques = pd.factorize(df["command"], use_na_sentinel=True)
+        table = np.array([command_score(str(c), weights) for c in uniques] +
+                         [command_score("nan", weights)], dtype=np.int64)
+        cmd_scores = table[np.where(codes >= 0, codes, len(uniques))]
+    else:
+        cmd_scores = np.zeros(n, dtype=np.int64)
+
+    ports = df["port"].to_numpy().astype(np.int64) if "port" in df.columns else np.zeros(n, dtype=np.int64)
+    port_scores = np.where(np.isin(ports, weights["risky_ports"]), weights["port_score"], 0)
+
+    rep_col = weights["reputation_column"]
+    rep = df[rep_col].to_numpy(dtype=np.float64) if rep_col in df.columns else np.zeros(n)
+    score = (cmd_scores + port_scores) + rep * weights["reputation_weight"]
+
+    # min(max_score, score) keeps max_score unless score is smaller (NaN included)
+    score = np.where(score < weights["max_score"], score, float(weights["max_score"]))
+
+    # Python's round() per distinct value keeps results bit-for-bit identical
+    values, inverse = np.unique(score, return_inverse=True)
+    rounded = np.array([round(float(v), 2) for v in values], dtype=np.float64)
+    return pd.Series(rounded[inverse.reshape(-1)], index=df.index, name="threat_score")
+
+def lookup_reputation(unique_ips):
+    """Reputation table (one row per IP) for the given addresses."""
     print(f"[*] Correlating {len(unique_ips)} unique IPs...")
 
-    rep_data = []
-    for ip in unique_ips:
-        rep = check_ip_reputation(ip)
-        rep_data.append({
-            "source_ip": ip,
-            **rep
-        })
+    reps = reputation_service().lookup_many(ip for ip in unique_ips if isinstance(ip, str))
+    rep_data = [{"source_ip": ip, **rep} for ip, rep in reps.items()]
 
-    rep_df = pd.DataFrame(rep_data)
+    return pd.DataFrame(rep_data, columns=["source_ip", "score", "confidence", "country", "isp"])
+
+def score_threats(df, rep_df):
+    """Merge reputation into the events and compute threat_score / risk_level."""
     df = df.merge(rep_df, on="source_ip", how="left")
+    df["ip_class"] = default_classifier().classify_series(df["source_ip"])
 
     # Compute threat scores
-    df["threat_score"] = df.apply(compute_threat_score, axis=1)
+    df["threat_score"] = compute_threat_scores(df)
 
     # Risk Category
     df["risk_level"] = pd.cut(
@@ -116,14 +125,30 @@ def correlate_threats():
         bins=[0, 30, 60, 100],
         labels=["Low", "Medium", "High"]
     )
+    return df
+
+def enrich_threats(df):
+    """Attach reputation, threat_score and risk_level columns to log events."""
+    return score_threats(df, lookup_reputation(df["source_ip"].unique()))
+
+def save_threat_report(df, checkpoint=None):
+    csv_path = os.path.join(REPORTS_DIR, f"threat_correlation_{datetime.now():%Y%m%d_%H%M%S}.csv")
+    return save_report("threat", df, csv_path, checkpoint)
+
+def correlate_threats():
+    df = load_logs()
+    if df.empty:
+        print("[!] No logs found to correlate.")
+        return
+
+    df = enrich_threats(df)
 
     print("\n=== THREAT INTELLIGENCE CORRELATOR ===")
     print(df[["timestamp", "source_ip", "country", "command", "threat_score", "risk_level"]].head(10))
 
-    # Save Report
-    csv_path = os.path.join(REPORTS_DIR, f"threat_correlation_{datetime.now():%Y%m%d_%H%M%S}.csv")
-    df.to_csv(csv_path, index=False)
-    print(f"\n[+] Threat intelligence report saved: {csv_path}")
+    # Save Report (only the events the store doesn't have yet)
+    events, checkpoint = unstored_events("threat")
+    save_threat_report(enrich_threats(events), checkpoint)
 
     # Summary
     print("\nRisk Distribution:")
@@ -0,0 +1,104 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import counter
+
+CACHE_LOOKUPS = counter("cache_lookups_total", "Cache lookups by table (geo, reputation) and result",
+                        labels=("table", "result"))
+
+
+class SqliteTTLCache:
+    """Small persistent key -> JSON value cache with expiry and a size bound.
+
+    Entries older than ``ttl`` seconds are treated as misses. When the table
+    grows past ``max_entries`` the least recently used entries are evicted.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path, table="cache", ttl=7 * 24 * 3600, max_entries=100_000):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            " key TEXT PRIMARY KEY, value TEXT, stored REAL, accessed REAL)"
+        )
+        self._db.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table}(accessed)")
+        self._db.commit()
+
+    def get_many(self, keys):
+        """Return {key: value} for the keys that are cached and fresh."""
+        keys = list(keys)
+        found = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                rows = self._db.execute(
+                    f"SELECT key, value FROM {self.table} WHERE stored >= ? AND key IN ({','.join('?' * len(batch))})",
+                    [now - self.ttl, *batch],
+                ).fetchall()
+                found.update((k, json.loads(v)) for k, v in rows)
+            if found:
+                self._db.executemany(f"UPDATE {self.table} SET accessed = ? WHERE key = ?",
+                                     [(now, k) for k in found])
+                self._db.commit()
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        CACHE_LOOKUPS.inc(len(found), table=self.table, result="hit")
+        CACHE_LOOKUPS.inc(len(keys) - len(found), table=self.table, result="miss")
+        return found
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def set_many(self, items, ttl=None):
+        """Store the items; with ``ttl`` they expire after that many seconds instead of the cache's."""
+        now = time.time()
+        # Expiry is computed from "stored", so a shorter lifetime is a backdated entry
+        stored = now if ttl is None else now - max(self.ttl - ttl, 0)
+        with self._lock:
+            self._db.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, stored, accessed) VALUES (?, ?, ?, ?)",
+                [(k, json.dumps(v), stored, now) for k, v in items.items()],
+            )
+            self._evict()
+            self._db.commit()
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def _evict(self):
+        (count,) = self._db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        if count > self.max_entries:
+            self._db.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY accessed LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def purge_expired(self):
+        with self._lock:
+            self._db.execute(f"DELETE FROM {self.table} WHERE stored < ?", (time.time() - self.ttl,))
+            self._db.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
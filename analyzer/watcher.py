@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+from watchdog.observers.polling import PollingObserver
+
+
+class CoalescingRunner:
+    """Runs a callback after bursts of change events have settled.
+
+    Events arriving within ``debounce`` seconds of each other are coalesced
+    into one run; ``max_delay`` bounds how long a steady stream of events can
+    postpone it. At most one run is in flight: events that arrive while it
+    runs only set a dirty flag, which triggers exactly one follow-up run.
+    """
+
+    def __init__(self, run, debounce=2.0, max_delay=30.0):
+        self.run = run
+        self.debounce = debounce
+        self.max_delay = max_delay
+
+        self.events_received = 0
+        self.runs_executed = 0
+        self.last_lag = 0.0      # first pending event -> run start
+        self.max_lag = 0.0
+        self.last_duration = 0.0
+
+        self._cond = threading.Condition()
+        self._dirty = False
+        self._first_event = None
+        self._last_event = None
+        self._stopped = False
+        self._thread = threading.Thread(target=self._loop, name="pipeline-runner", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def notify(self):
+        with self._cond:
+            now = time.monotonic()
+            self.events_received += 1
+            self._last_event = now
+            if not self._dirty:
+                self._dirty = True
+                self._first_event = now
+            self._cond.notify()
+
+    def stop(self, timeout=None):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            "events_received": self.events_received,
+            "runs_executed": self.runs_executed,
+            "pending": self._dirty,
+            "last_lag": round(self.last_lag, 3),
+            "max_lag": round(self.max_lag, 3),
+            "last_duration": round(self.last_duration, 3),
+        }
+
+    def _wait_until_settled(self):
+        """Block until a coalesced run is due; returns False when stopping."""
+        with self._cond:
+            while not self._stopped:
+                if not self._dirty:
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                due = min(self._last_event + self.debounce, self._first_event + self.max_delay)
+                if now >= due:
+                    self.last_lag = now - self._first_event
+                    self.max_lag = max(self.max_lag, self.last_lag)
+                    self._dirty = False
+                    return True
+                self._cond.wait(due - now)
+            return False
+
+    def _loop(self):
+        while self._wait_until_settled():
+            start = time.monotonic()
+            try:
+                self.run()
+            except Exception as e:
+                print(f"[!] Pipeline run failed: {e}")
+            self.last_duration = time.monotonic() - start
+            self.runs_executed += 1
+            s = self.stats()
+            print(f"[*] Watcher: {s['events_received']} events -> {s['runs_executed']} runs, "
+                  f"lag {s['last_lag']:.2f}s (max {s['max_lag']:.2f}s), run {s['last_duration']:.2f}s")
+
+
+class LogChangeHandler(FileSystemEventHandler):
+    """Forwards writes to the watched log file to a CoalescingRunner."""
+
+    def __init__(self, log_file, runner):
+        self.log_name = os.path.basename(log_file)
+        self.runner = runner
+
+    def on_any_event(self, event):
+        if event.event_type in ("modified", "created", "moved") and \
+                os.path.basename(getattr(event, "dest_path", "") or event.src_path) == self.log_name:
+            self.runner.notify()
+
+
+def start_observer(log_file, runner, poll=False, poll_interval=1.0):
+    """Schedule the log watch; uses a polling observer if asked or if inotify fails."""
+    handler = LogChangeHandler(log_file, runner)
+    path = os.path.dirname(os.path.abspath(log_file))
+    if not poll:
+        observer = Observer()
+        observer.schedule(handler, path=path, recursive=False)
+        try:
+            observer.start()
+            return observer
+        except OSError as e:
+            print(f"[!] Native file watching unavailable ({e}); falling back to polling.")
+    observer = PollingObserver(timeout=poll_interval)
+    observer.schedule(handler, path=path, recursive=False)
+    observer.start()
+    return observer
+
+
+def watch(log_file, run, debounce=2.0, max_delay=30.0, poll=False, poll_interval=1.0):
+    """Run ``run`` whenever ``log_file`` changes, coalescing bursts, until Ctrl+C."""
+    runner = CoalescingRunner(run, debounce=debounce, max_delay=max_delay).start()
+    observer = start_observer(log_file, runner, poll=poll, poll_interval=poll_interval)
+    try:
+        while True:
+            time.sleep(2)
+    except KeyboardInterrupt:
+        print("\n🛑 Pipeline stopped manually.")
+    finally:
+        observer.stop()
+        observer.join()
+        runner.stop()
+    return runner.stats()
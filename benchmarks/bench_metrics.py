@@ -0,0 +1,89 @@
+"""Cost of the instrumentation: metric updates, a /metrics render, and the sampling profiler.
+
+Times ``--ops`` labelled counter increments and histogram observations
+(what the honeypot does per command and the dashboard per request),
+renders a registry with ``--series`` label combinations, and runs a
+CPU-bound workload with and without the profiler sampling. Exits
+non-zero if an update costs more than ``--max-update-us`` or profiling
+slows the workload by more than ``--max-profile-overhead``.
+
+    python benchmarks/bench_metrics.py --ops 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "analyzer"))
+
+from metrics import Registry, SamplingProfiler
+
+def check(name, ok, detail):
+    print(f"[{'✓' if ok else '!'}] {name:<40}{detail}")
+    return ok
+
+def workload(n=2_000_000):
+    """Python-heavy loop standing in for a pipeline stage."""
+    total = 0
+    for i in range(n):
+        total += len(str(i * 7919 % 104729))
+    return total
+
+def best(fn, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ops", type=int, default=300_000)
+    parser.add_argument("--series", type=int, default=2_000, help="label combinations rendered")
+    parser.add_argument("--max-update-us", type=float, default=5.0)
+    parser.add_argument("--max-profile-overhead", type=float, default=0.25)
+    args = parser.parse_args()
+
+    registry = Registry()
+    commands = registry.counter("bench_commands_total", "Commands", labels=("reason",))
+    latency = registry.histogram("bench_request_seconds", "Latency", labels=("route", "method", "status"))
+    ok = True
+
+    start = time.perf_counter()
+    for _ in range(args.ops):
+        commands.inc(reason="exit")
+    per_inc = (time.perf_counter() - start) / args.ops * 1e6
+    start = time.perf_counter()
+    for i in range(args.ops):
+        latency.observe(i % 1000 / 1e4, route="/data", method="GET", status=200)
+    per_observe = (time.perf_counter() - start) / args.ops * 1e6
+    ok &= check("Labelled counter inc", per_inc <= args.max_update_us, f"{per_inc:.2f} µs")
+    ok &= check("Labelled histogram observe", per_observe <= args.max_update_us, f"{per_observe:.2f} µs")
+
+    for i in range(args.series):
+        latency.observe(0.01, route=f"/route/{i}", method="GET", status=200)
+    start = time.perf_counter()
+    text = registry.render()
+    rendered = time.perf_counter() - start
+    lines = text.count("\n")
+    print(f"[*] Render: {args.series + 1} histogram series, {lines:,} lines, {len(text) / 1024:.0f} KiB "
+          f"in {rendered * 1000:.0f} ms")
+
+    plain = best(workload)
+    profiler = SamplingProfiler()
+
+    def profiled():
+        with profiler:
+            workload()
+
+    sampled = best(profiled)
+    overhead = sampled / plain - 1
+    ok &= check("Profiler overhead", overhead <= args.max_profile_overhead,
+                f"{plain:.2f}s → {sampled:.2f}s ({overhead:+.1%}), {profiler.samples} samples "
+                f"every {profiler.interval * 1000:g} ms")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
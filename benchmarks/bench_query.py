@@ -0,0 +1,72 @@
+"""Latency of report_query aggregations over a synthetic threat report.
+
+Writes ``--rows`` events (one part per simulated day) into a temporary
+report store and rollup database, then times typical dashboard queries
+cold and cached. Open-ended counts by one dimension come from the
+rollups; the rest scan the report.
+
+    python benchmarks/bench_query.py --rows 50000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "analyzer"))
+
+from synth import enriched_day_frame, random_ips
+from report_query import cached_query, run_query
+from report_store import ReportStore
+from rollups import RollupStore
+
+QUERIES = {
+    "top IPs, last 1h": dict(group_by=["source_ip"], last="1h", limit=10),
+    "top IPs, all time": dict(group_by=["source_ip"], limit=10),
+    "commands per country": dict(group_by=["country", "command"], limit=50),
+    "hourly risk trend, 7d": dict(group_by=["risk_level"], bucket="hour", last="7d", limit=1000),
+    "daily counts + avg": dict(bucket="day", metrics=["count", "avg_threat", "max_threat"], limit=1000),
+    "recon by country": dict(group_by=["country"], where={"attack_type": "Reconnaissance"}),
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    ips = random_ips(50_000, rng)
+    first_day = pd.Timestamp.now().normalize() - pd.Timedelta(days=args.days - 1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ReportStore(tmp)
+        rollups = RollupStore(os.path.join(tmp, "rollups.sqlite"))
+        start = time.perf_counter()
+        per_day = args.rows // args.days
+        for i in range(args.days):
+            day = enriched_day_frame(per_day, first_day + pd.Timedelta(days=i), ips, rng)
+            # Both are updated up to the same (made-up) log position, as by the pipeline
+            position = {"inode": 1, "head": None, "offset": i + 1}
+            store.append("threat", day, checkpoint={"from": {}, "until": position})
+            rollups.add(day, checkpoint=position)
+        rollups.downsample()
+        print(f"[*] Wrote {store.count('threat'):,} rows in {time.perf_counter() - start:.1f}s")
+
+        print(f"{'query':<24}{'cold':>10}{'cached':>10}{'groups':>8}")
+        for name, params in QUERIES.items():
+            start = time.perf_counter()
+            rows = run_query(store=store, rollups=rollups, **params)
+            cold = (time.perf_counter() - start) * 1000
+            cached_query(store=store, rollups=rollups, **params)
+            _, warm, hit = cached_query(store=store, rollups=rollups, **params)
+            assert hit
+            print(f"{name:<24}{cold:>8.0f}ms{warm:>8.2f}ms{len(rows):>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Timestamped CSV report vs the Parquet report store.
+
+Builds a threat report (mock reputation) from a synthetic log, then compares
+on-disk size, write time and read latency for a full read, a 3-column
+projection, a one-day time range, the dashboard's last-10 view and a deep
+page (CSV column: full parse, then the seek-from-end CSV tail reader).
+
+    python benchmarks/bench_report_store.py --rows 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "analyzer"))
+
+from synth import write_synthetic_log
+from log_loader import load_logs_from
+from report_store import ReportStore, tail_csv
+from smart_analyzer import classify_logs
+from threat_intel_correlater import enrich_threats
+
+COLUMNS = ["source_ip", "attack_type", "command"]
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = os.path.join(tmp, "attacks.log")
+        write_synthetic_log(log_path, rows=args.rows)
+        df, _ = load_logs_from(log_path)
+        df = enrich_threats(classify_logs(df))
+        print(f"[*] Threat report: {len(df):,} rows, {len(df.columns)} columns")
+
+        day_start = df["timestamp"].min().normalize() + pd.Timedelta(days=1)
+        day_end = day_start + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+
+        csv_path = os.path.join(tmp, "threat_correlation.csv")
+        _, csv_write = timed(lambda: df.to_csv(csv_path, index=False))
+        store = ReportStore(os.path.join(tmp, "store"), retention_days=None)
+        _, store_write = timed(lambda: store.append("threat", df))
+
+        def csv_range():
+            full = pd.read_csv(csv_path, parse_dates=["timestamp"])
+            return full[(full["timestamp"] >= day_start) & (full["timestamp"] <= day_end)]
+
+        reads = {
+            "full read": (lambda: pd.read_csv(csv_path), lambda: store.read("threat")),
+            "3 columns": (lambda: pd.read_csv(csv_path, usecols=COLUMNS),
+                          lambda: store.read("threat", columns=COLUMNS)),
+            "one day": (csv_range, lambda: store.read("threat", start=day_start, end=day_end)),
+            "last 10": (lambda: pd.read_csv(csv_path).tail(10), lambda: store.tail("threat", 10)),
+            "page @50%": (lambda: pd.read_csv(csv_path).iloc[len(df) // 2:len(df) // 2 + 50],
+                          lambda: store.page("threat", len(df) // 2, 50)[0]),
+        }
+
+        csv_size, store_size = os.path.getsize(csv_path), dir_size(store.root)
+        print(f"{'':<12}{'CSV':>12}{'store':>12}")
+        print(f"{'size':<12}{csv_size / 2**20:>10.1f}MB{store_size / 2**20:>10.1f}MB")
+        print(f"{'write':<12}{csv_write:>11.2f}s{store_write:>11.2f}s")
+        for name, (csv_read, store_read) in reads.items():
+            csv_df, csv_t = timed(csv_read)
+            store_df, store_t = timed(store_read)
+            assert len(csv_df) == len(store_df), (name, len(csv_df), len(store_df))
+            print(f"{name:<12}{csv_t:>11.3f}s{store_t:>11.3f}s  ({len(store_df):,} rows)")
+        _, seek_t = timed(lambda: tail_csv(csv_path, 10))
+        print(f"{'CSV tail':<12}{seek_t:>11.3f}s  (seek from end)")
+
+if __name__ == "__main__":
+    main()
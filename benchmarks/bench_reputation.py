@@ -0,0 +1,85 @@
+"""Throughput of reputation lookups against a local mock AbuseIPDB server.
+
+The mock answers /api/v2/check after a fixed delay and sends quota headers,
+so the run exercises the pooled session, worker pool, token bucket and
+cache without touching the real API.
+
+    python benchmarks/bench_reputation.py --ips 10000 --workers 32 --latency-ms 20
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "analyzer"))
+
+from reputation import AbuseIPDBProvider, ReputationService
+from ttl_cache import SqliteTTLCache
+
+def mock_server(latency):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency)
+            ip = parse_qs(urlparse(self.path).query)["ipAddress"][0]
+            body = json.dumps({"data": {"ipAddress": ip, "abuseConfidenceScore": hash(ip) % 100,
+                                        "totalReports": 3, "countryCode": "ZZ", "isp": "Mock ISP"}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("X-RateLimit-Limit", "1000000")
+            self.send_header("X-RateLimit-Remaining", "999999")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def timed_lookup(service, ips):
+    start = time.perf_counter()
+    service.lookup_many(ips)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ips", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--rate", type=float, default=100000, help="token bucket requests/sec")
+    parser.add_argument("--serial-sample", type=int, default=200,
+                        help="IPs used to estimate the old one-by-one loop")
+    args = parser.parse_args()
+
+    server = mock_server(args.latency_ms / 1000)
+    url = f"http://127.0.0.1:{server.server_port}"
+    rng = random.Random(1)
+    ips = list({f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+                for _ in range(args.ips * 2)})[:args.ips]
+
+    serial = ReputationService(AbuseIPDBProvider("bench", base_url=url, rate=args.rate), max_workers=1)
+    t = timed_lookup(serial, ips[:args.serial_sample])
+    print(f"serial (old loop): {args.serial_sample / t:8.0f} IPs/s  "
+          f"(~{len(ips) * t / args.serial_sample:.1f}s projected for {len(ips)})")
+
+    cache = SqliteTTLCache(":memory:", table="reputation")
+    provider = AbuseIPDBProvider("bench", base_url=url, rate=args.rate, pool_size=args.workers)
+    service = ReputationService(provider, cache=cache, max_workers=args.workers)
+    t = timed_lookup(service, ips)
+    print(f"concurrent cold:   {len(ips) / t:8.0f} IPs/s  ({t:.2f}s, {args.workers} workers)")
+    t = timed_lookup(service, ips)
+    print(f"cached warm:       {len(ips) / t:8.0f} IPs/s  ({t:.2f}s)")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""AI summary cost as history grows: full value_counts vs day rollups.
+
+Adds one synthetic day at a time to an in-memory DataFrame and to a
+temporary RollupStore, then times summarize_attacks (all raw events) and
+summarize_rollups at a few history lengths.
+
+    python benchmarks/bench_rollups.py --rows-per-day 200000 --days 90
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "analyzer"))
+
+from synth import enriched_day_frame, random_ips
+from ai_summary import summarize_attacks, summarize_rollups
+from rollups import RollupStore
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows-per-day", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=60)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    ips = random_ips(50_000, rng)
+    first_day = pd.Timestamp.now().normalize() - pd.Timedelta(days=args.days - 1)
+    checkpoints = {max(1, args.days // 8), args.days // 4, args.days // 2, args.days}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = RollupStore(os.path.join(tmp, "rollups.sqlite"))
+        frames = []
+        add_time = 0.0
+        print(f"{'days':>5}{'events':>13}{'raw summary':>14}{'rollup summary':>16}{'add/day':>10}")
+        for i in range(args.days):
+            day = enriched_day_frame(args.rows_per_day, first_day + pd.Timedelta(days=i), ips, rng)
+            frames.append(day)
+            add_time += timed(lambda: store.add(day))
+            if i + 1 in checkpoints:
+                store.downsample()
+                events = pd.concat(frames, ignore_index=True)
+                raw = timed(lambda: summarize_attacks(events))
+                rolled = timed(lambda: summarize_rollups(store))
+                print(f"{i + 1:>5}{len(events):>13,}{raw:>13.3f}s{rolled:>15.3f}s{add_time / (i + 1):>9.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Rolled, compressed log segments: time-range reads vs a full scan, and checkpoints across rotations.
+
+Streams ``--events`` synthetic events (about one a second) through the
+honeypot's BatchLogWriter with a SegmentRoller rolling every
+``--segment-mb``, with an incremental reader checkpointing part way. Then
+checks every event landed exactly once across the sealed segments and the
+live log, that the checkpoint resumes through the rotations without loss
+or repeats, and that reading the last hour through the block index
+returns the same events as filtering a full scan, only faster. Exits
+non-zero on any violation.
+
+    python benchmarks/bench_segments.py --events 1000000 --segment-mb 16
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(ROOT, "analyzer"))
+sys.path.insert(0, os.path.join(ROOT, "honeypot"))
+
+from synth import synthetic_events
+from log_loader import LogCursor, iter_log_range, list_segments, load_logs_range
+from log_segments import SegmentRoller
+from log_writer import BatchLogWriter
+
+def check(name, ok, detail):
+    print(f"[{'✓' if ok else '!'}] {name:<44}{detail}")
+    return ok
+
+def read(cursor):
+    stamps = []
+    for chunk, _ in cursor:
+        stamps.append(chunk["timestamp"])
+    return pd.concat(stamps, ignore_index=True) if stamps else pd.Series(dtype="datetime64[ns]")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=500_000)
+    parser.add_argument("--segment-mb", type=float, default=8)
+    parser.add_argument("--min-speedup", type=float, default=3.0,
+                        help="required speedup of the last-hour read over a full scan")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_segments_")
+    log = os.path.join(tmp, "attacks.log")
+    ok = True
+    try:
+        roller = SegmentRoller(max_bytes=int(args.segment_mb * 2 ** 20), max_age=float("inf"))
+        writer = BatchLogWriter(log, max_queue=args.events, batch_size=4096, fsync="never", roller=roller)
+        events = synthetic_events(args.events, start=datetime(2026, 10, 1))
+        checkpoint = {"inode": None, "offset": 0}
+        first = None
+        start = time.perf_counter()
+        for i, event in enumerate(events, 1):
+            writer.write(json.dumps(event))
+            if i == args.events // 3:
+                # An incremental reader catches up once, mid-stream, then the log rolls on under it
+                while writer.queue.qsize():
+                    time.sleep(0.01)
+                time.sleep(writer.flush_interval * 2)
+                cursor = LogCursor(checkpoint, log)
+                first = read(cursor)
+                checkpoint.update(cursor.position)
+        writer.close(timeout=600)
+        elapsed = time.perf_counter() - start
+        segments = list_segments(log)
+        sealed = [s for s in segments if not s["plain"]]
+        raw = sum(s["source"]["size"] for s in sealed)
+        packed = sum(os.path.getsize(s["data"]) for s in sealed)
+        print(f"[*] {args.events:,} events written in {elapsed:.2f}s; {roller.rolled} rolls, "
+              f"{len(sealed)} sealed segments ({raw / 2**20:.0f} MB → {packed / 2**20:.1f} MB, "
+              f"{raw / max(packed, 1):.1f}x), live log {os.path.getsize(log) / 2**20:.1f} MB")
+        ok &= check("All rolled segments sealed", len(sealed) == len(segments) == roller.rolled >= 2,
+                    f"{len(sealed)}/{roller.rolled}")
+
+        with open(log, "rb") as f:
+            live = sum(1 for _ in f)
+        stored = sum(s["events"] for s in sealed) + live
+        ok &= check("Every event stored exactly once", stored == writer.written == args.events,
+                    f"{stored:,} stored, {writer.dropped} dropped")
+
+        cursor = LogCursor(dict(checkpoint), log)
+        rest = read(cursor)
+        both = pd.concat([first, rest], ignore_index=True)
+        ok &= check("Checkpoint resumes across rotations", len(both) == args.events and
+                    both.is_monotonic_increasing and both.is_unique,
+                    f"{len(first):,} before + {len(rest):,} after")
+        again = read(LogCursor(dict(cursor.position), log))
+        ok &= check("Resuming at the end reads nothing", again.empty, f"{len(again)} events")
+
+        start = time.perf_counter()
+        full = pd.concat([chunk for chunk in iter_log_range(path=log)], ignore_index=True)
+        scan = time.perf_counter() - start
+        since = full["timestamp"].max() - pd.Timedelta(hours=1)
+        start = time.perf_counter()
+        recent = load_logs_range(since, path=log)
+        ranged = time.perf_counter() - start
+        expected = full[full["timestamp"] >= since]
+        ok &= check("Last hour matches a filtered full scan", len(recent) == len(expected) and
+                    recent["timestamp"].reset_index(drop=True).equals(expected["timestamp"].reset_index(drop=True)),
+                    f"{len(recent):,} events")
+        speedup = scan / ranged
+        ok &= check(f"Last hour ≥ {args.min_speedup:g}x faster than a full scan", speedup >= args.min_speedup,
+                    f"{ranged * 1000:.0f} ms vs {scan:.2f}s ({speedup:.0f}x)")
+    finally:
+        shutil.rmtree(tmp)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Streaming sketches vs exact counts, with their documented error bounds checked.
+
+Splits a Zipf-distributed synthetic stream of source IPs and session
+durations across ``--nodes`` simulated honeypots, builds each node's
+sketches chunk by chunk, round-trips them through JSON and merges them,
+then compares against exact pandas answers. Exits non-zero if any bound
+documented in analyzer/sketches.py is violated.
+
+    python benchmarks/bench_sketches.py --events 5000000 --nodes 8
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "analyzer"))
+
+from synth import random_ips
+from sketches import CountMinSketch, HyperLogLog, SpaceSaving, TDigest, load_sketch
+
+CHUNK = 200_000
+
+def roundtrip(sketch):
+    return load_sketch(json.loads(json.dumps(sketch.to_dict())))
+
+def check(name, ok, detail):
+    print(f"[{'✓' if ok else '!'}] {name:<34}{detail}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=2_000_000)
+    parser.add_argument("--distinct", type=int, default=300_000)
+    parser.add_argument("--nodes", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    pool = np.array(random_ips(args.distinct, rng), dtype=object)
+    # Half the traffic from a few persistent scanners (Zipf), half from a botnet wave (uniform)
+    ranks = np.minimum(rng.zipf(1.3, args.events) - 1, len(pool) - 1)
+    wave = rng.random(args.events) < 0.5
+    ranks[wave] = rng.integers(0, len(pool), wave.sum())
+    ips = pool[ranks]
+    durations = rng.lognormal(3, 1.5, args.events // 10)
+
+    start = time.perf_counter()
+    merged = [SpaceSaving(), CountMinSketch(), HyperLogLog(), TDigest()]
+    for node_ips, node_durations in zip(np.array_split(ips, args.nodes), np.array_split(durations, args.nodes)):
+        node = [SpaceSaving(), CountMinSketch(), HyperLogLog(), TDigest()]
+        for i in range(0, len(node_ips), CHUNK):
+            chunk = node_ips[i:i + CHUNK]
+            for sketch in node[:3]:
+                sketch.update(chunk)
+        node[3].update(node_durations)
+        for total, part in zip(merged, node):
+            total.merge(roundtrip(part))
+    sketch_time = time.perf_counter() - start
+    heavy, cm, hll, digest = merged
+
+    start = time.perf_counter()
+    exact = pd.Series(ips).value_counts()
+    exact_time = time.perf_counter() - start
+    n = len(ips)
+    sizes = {type(s).__name__: len(json.dumps(s.to_dict())) for s in merged}
+    print(f"[*] {n:,} events, {len(exact):,} distinct IPs, {args.nodes} nodes")
+    print(f"[*] sketches {sketch_time:.2f}s, {sum(sizes.values()) / 2**10:.0f} KB serialized "
+          f"({', '.join(f'{k} {v / 2**10:.0f} KB' for k, v in sizes.items())}); "
+          f"exact value_counts {exact_time:.2f}s, {exact.memory_usage(deep=True) / 2**20:.0f} MB")
+
+    ok = True
+    truth = exact.reindex(list(heavy.counters), fill_value=0)
+    errors = [count - truth[item] for item, (count, _) in heavy.counters.items()]
+    within = all(count - err <= truth[item] <= count for item, (count, err) in heavy.counters.items())
+    ok &= check("Space-Saving: true in [c - e, c]", within, f"{len(heavy.counters)} counters")
+    ok &= check("Space-Saving: error <= N/k", max(errors) <= n / heavy.k,
+                f"max {max(errors):,} vs N/k {n / heavy.k:,.0f}")
+    frequent = exact[exact > n / heavy.k]
+    ok &= check("Space-Saving: all > N/k tracked", set(frequent.index) <= set(heavy.counters),
+                f"{len(frequent)} frequent IPs")
+    top10 = [item for item, _, _ in heavy.top(10)]
+    print(f"    top-10 overlap with exact: {len(set(top10) & set(exact.index[:10]))}/10")
+
+    sample = exact.sample(min(5_000, len(exact)), random_state=0)
+    over = np.array([cm.estimate(item) for item in sample.index]) - sample.to_numpy()
+    ok &= check("Count-Min: never undercounts", over.min() >= 0, f"min overcount {over.min()}")
+    failure = float(np.mean(over > cm.error_bound()))
+    ok &= check("Count-Min: P(err > eN/w) <= e^-d", failure <= math.exp(-cm.depth),
+                f"{failure:.4f} vs {math.exp(-cm.depth):.4f} (bound {cm.error_bound():,.0f})")
+
+    relative = abs(hll.count() - len(exact)) / len(exact)
+    ok &= check("HyperLogLog: error <= 3 sigma", relative <= 3 * hll.standard_error(),
+                f"{hll.count():,} ({relative:.2%} vs sigma {hll.standard_error():.2%})")
+
+    ordered = np.sort(durations)
+    for q, limit in ((0.5, 0.005), (0.9, 0.005), (0.99, 0.001)):
+        rank = np.searchsorted(ordered, digest.quantile(q)) / len(ordered)
+        ok &= check(f"t-digest: p{q * 100:g} rank error <= {limit:.1%}", abs(rank - q) <= limit,
+                    f"{abs(rank - q):.4%} ({len(digest.weights)} centroids)")
+
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
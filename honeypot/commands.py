@@ -0,0 +1,227 @@
+import json
+import os
+import posixpath
+
+PROFILES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles.json")
+DEFAULT_PROFILE = "smartplug"
+
+CRLF = b"\r\n"
+# ping options whose value is the next argument (ping -c 1 1.2.3.4)
+PING_VALUE_OPTIONS = {"-c", "-i", "-s", "-W", "-w", "-t", "-I"}
+
+class FakeFilesystem:
+    """Tiny in-memory filesystem built once from a profile's ``files`` map.
+
+    Keys ending in ``/`` (or with a null value) are directories; parent
+    directories are created implicitly. Directory listings keep the order
+    entries appear in the profile.
+    """
+
+    def __init__(self, files):
+        self.files = {}
+        self.dirs = {"/": {}}
+        for path, content in files.items():
+            is_dir = path.endswith("/") or content is None
+            path = posixpath.normpath("/" + path.strip("/"))
+            if is_dir:
+                self._mkdir(path)
+            else:
+                self._mkdir(posixpath.dirname(path))
+                self.dirs[posixpath.dirname(path)][posixpath.basename(path)] = False
+                self.files[path] = content.encode("utf-8", errors="replace")
+
+    def _mkdir(self, path):
+        if path in self.dirs:
+            return
+        parent = posixpath.dirname(path)
+        self._mkdir(parent)
+        self.dirs[parent][posixpath.basename(path)] = True
+        self.dirs[path] = {}
+
+    @staticmethod
+    def resolve(cwd, path):
+        return posixpath.normpath(posixpath.join(cwd, path)) if path else cwd
+
+    def listdir(self, path):
+        entries = self.dirs.get(path)
+        if entries is None:
+            return None
+        return [name + "/" if is_dir else name for name, is_dir in entries.items()]
+
+class CommandRegistry:
+    """Verb-keyed command table for one emulated device profile.
+
+    Lookup order for a command line: exact static response for the whole
+    line, then a handler registered for the verb, then the profile's
+    "unknown command" reply. Static replies and file contents are encoded
+    (with the trailing prompt) once at load time.
+    """
+
+    def __init__(self, name, profile):
+        self.name = name
+        self.profile = profile
+        self.banner = profile["banner"].encode()
+        self.prompt = profile.get("prompt", "> ").encode()
+        self.user = profile.get("user", "root")
+        self.home = profile.get("home", "/")
+        self.unknown = profile.get("unknown", "Command not recognized")
+        self.fs = FakeFilesystem(profile.get("files", {}))
+
+        self.static = {line: self.reply(text) for line, text in profile.get("responses", {}).items()}
+        self.file_replies = {path: content + CRLF + self.prompt for path, content in self.fs.files.items()}
+        self.handlers = dict(HANDLERS)
+
+    def reply(self, text):
+        """Encode command output followed by the prompt."""
+        if isinstance(text, str):
+            text = text.encode("utf-8", errors="replace")
+        if not text:
+            return self.prompt
+        return text + CRLF + self.prompt
+
+    def register(self, verb, handler):
+        self.handlers[verb] = handler
+
+    def new_session(self):
+        return {"cwd": self.home}
+
+    def dispatch(self, line, session):
+        """Return (reply bytes, close_session) for a command line."""
+        static = self.static.get(line)
+        if static is not None:
+            return static, False
+
+        args = line.split()
+        if not args:
+            return self.prompt, False
+        verb = posixpath.basename(args[0])
+        handler = self.handlers.get(verb)
+        if handler is None:
+            return self.reply(self.unknown.format(verb=verb)), False
+        return handler(self, session, args[1:])
+
+# --- handlers -------------------------------------------------------------
+
+def cmd_exit(registry, session, args):
+    return b"Logging out..." + CRLF, True
+
+def cmd_ls(registry, session, args):
+    paths = [a for a in args if not a.startswith("-")] or [""]
+    out = []
+    for path in paths:
+        target = registry.fs.resolve(session["cwd"], path)
+        entries = registry.fs.listdir(target)
+        if entries is not None:
+            out.append("  ".join(entries))
+        elif target in registry.fs.files:
+            out.append(path)
+        else:
+            out.append(f"ls: {path}: No such file or directory")
+    return registry.reply("\n".join(out)), False
+
+def cmd_cat(registry, session, args):
+    if len(args) == 1:
+        cached = registry.file_replies.get(registry.fs.resolve(session["cwd"], args[0]))
+        if cached is not None:
+            return cached, False
+    out = []
+    for path in args:
+        target = registry.fs.resolve(session["cwd"], path)
+        if target in registry.fs.files:
+            out.append(registry.fs.files[target].decode("utf-8", errors="replace"))
+        elif target in registry.fs.dirs:
+            out.append(f"cat: {path}: Is a directory")
+        else:
+            out.append(f"cat: {path}: No such file or directory")
+    return registry.reply("\n".join(out)), False
+
+def cmd_cd(registry, session, args):
+    target = registry.fs.resolve(session["cwd"], args[0] if args else registry.home)
+    if target not in registry.fs.dirs:
+        return registry.reply(f"cd: can't cd to {args[0]}"), False
+    session["cwd"] = target
+    return registry.prompt, False
+
+def cmd_pwd(registry, session, args):
+    return registry.reply(session["cwd"]), False
+
+def cmd_whoami(registry, session, args):
+    return registry.reply(registry.user), False
+
+def cmd_id(registry, session, args):
+    uid = 0 if registry.user == "root" else 1000
+    return registry.reply(f"uid={uid}({registry.user}) gid={uid}({registry.user})"), False
+
+def cmd_uname(registry, session, args):
+    full = registry.profile.get("uname", "Linux")
+    return registry.reply(full if "-a" in args else full.split()[0]), False
+
+def cmd_echo(registry, session, args):
+    return registry.reply(" ".join(a.strip("'\"") for a in args)), False
+
+def cmd_ping(registry, session, args):
+    target, skip = "8.8.8.8", False
+    for arg in args:
+        if skip:
+            skip = False
+        elif arg in PING_VALUE_OPTIONS:
+            skip = True
+        elif not arg.startswith("-"):
+            target = arg  # the last operand is the host
+    return registry.reply(f"Pinging {target} with 32 bytes of data...\n"
+                          f"Reply from {target}: bytes=32 time=20ms TTL=54"), False
+
+def cmd_download(registry, session, args):
+    url = next((a for a in args if "://" in a or "/" in a), None)
+    if url is None:
+        return registry.reply("wget: missing URL"), False
+    host = url.split("://")[-1].split("/")[0]
+    filename = url.rstrip("/").split("/")[-1] or "index.html"
+    return registry.reply(f"Connecting to {host}... connected.\n"
+                          f"HTTP request sent, awaiting response... 200 OK\n"
+                          f"Saving to: '{filename}'"), False
+
+def cmd_shell(registry, session, args):
+    # sh / enable / system / shell: pretend we dropped into a privileged shell
+    return registry.prompt, False
+
+def cmd_busybox(registry, session, args):
+    if not args:
+        return registry.reply("BusyBox v1.19.4 (2013-05-02 16:05:45 CST) multi-call binary."), False
+    applet = posixpath.basename(args[0])
+    handler = registry.handlers.get(applet)
+    if handler is None or handler is cmd_busybox:
+        return registry.reply(f"{applet}: applet not found"), False
+    return handler(registry, session, args[1:])
+
+HANDLERS = {
+    "exit": cmd_exit,
+    "logout": cmd_exit,
+    "quit": cmd_exit,
+    "ls": cmd_ls,
+    "cat": cmd_cat,
+    "cd": cmd_cd,
+    "pwd": cmd_pwd,
+    "whoami": cmd_whoami,
+    "id": cmd_id,
+    "uname": cmd_uname,
+    "echo": cmd_echo,
+    "ping": cmd_ping,
+    "wget": cmd_download,
+    "curl": cmd_download,
+    "tftp": cmd_download,
+    "sh": cmd_shell,
+    "shell": cmd_shell,
+    "enable": cmd_shell,
+    "system": cmd_shell,
+    "linuxshell": cmd_shell,
+    "busybox": cmd_busybox,
+}
+
+def load_registry(profile_name=DEFAULT_PROFILE, profiles_file=PROFILES_FILE):
+    """Build the command registry for a device profile from the profiles file."""
+    with open(profiles_file, "r", encoding="utf-8") as f:
+        profiles = json.load(f)
+    if profile_name not in profiles:
+        raise ValueError(f"Unknown device profile '{profile_name}' (available: {', '.join(profiles)})")
+    return CommandRegistry(profile_name, profiles[profile_name])
@@ -1,101 +1,230 @@
+import asyncio
+import os
 import socket
-import datetime
-import logging
-import json
+import sys
+import time
+import uuid
 from datetime import datetime
 
-# Logging setup
-logger = logging.getLogger("honeypot_logger")
-logger.setLevel(logging.INFO)
-
-file_handler = logging.FileHandler("../logs/attacks.log")
-file_handler.setFormatter(logging.Formatter('%(message)s'))
-logger.addHandler(file_handler)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "analyzer"))
+
+from attack_classifier import classify_command
+from commands import DEFAULT_PROFILE, PROFILES_FILE, load_registry
+from ip_filter import IpClassifier, load_cidr_file
+from log_writer import BatchLogWriter
+from metrics import counter, gauge, histogram, serve as serve_metrics
+
+LOG_FILE = os.path.join(BASE_DIR, "logs", "attacks.log")
+SESSION_LOG_FILE = os.path.join(BASE_DIR, "honeypot", "honeypot_logs.txt")
+
+# Logging setup: writes are queued and flushed in batches off the socket path
+LOG_FSYNC = os.environ.get("HONEYPOT_LOG_FSYNC", "interval")  # never | batch | interval
+LOG_QUEUE_SIZE = int(os.environ.get("HONEYPOT_LOG_QUEUE", 100000))
+# Stream events to a central collector instead of the local log, e.g.
+# "collector.example:5140" or "unix:/run/honeypot/collector.sock"
+COLLECTOR = os.environ.get("HONEYPOT_COLLECTOR", "")
+SENSOR_ID = os.environ.get("HONEYPOT_SENSOR_ID", socket.gethostname())
+
+if COLLECTOR:
+    sys.path.insert(0, os.path.join(BASE_DIR, "collector"))
+    from protocol import CollectorClient
+    event_writer = BatchLogWriter(LOG_FILE, max_queue=LOG_QUEUE_SIZE,
+                                  sink=CollectorClient(COLLECTOR, SENSOR_ID))
+else:
+    # Rolled into compressed, time-indexed segments (LOG_SEGMENT_MB / LOG_SEGMENT_HOURS)
+    from log_segments import SegmentRoller
+    event_writer = BatchLogWriter(LOG_FILE, max_queue=LOG_QUEUE_SIZE, fsync=LOG_FSYNC, roller=SegmentRoller())
+session_writer = BatchLogWriter(SESSION_LOG_FILE, max_queue=LOG_QUEUE_SIZE, fsync="never")
 
 # Function to log attacks
-def log_event(ip, port, command, status):
+def log_event(ip, port, command, status, session_id=None, attack_type=None):
     entry = {
         "timestamp": datetime.now().isoformat(),
         "source_ip": ip,
         "port": port,
         "command": command,
-        "status": status
+        "status": status,
+        "attack_type": attack_type or classify_command(command),  # live tag; analyzers re-classify
+        "session_id": session_id,
     }
-    logger.info(json.dumps(entry))
-
-HOST = '0.0.0.0'
-PORT = 2323
-
-server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-server.bind((HOST, PORT))
-server.listen(5)
+    event_writer.write(entry)
 
-print("🚨 Fake Telnet device running on port 2323...")
-
-while True:
-    client_socket, client_address = server.accept()
-    print(f"[+] Connection from {client_address[0]}")
+def log_lifecycle(event, ip, port, session_id, **fields):
+    """Session start/end record; the log loader skips these unless asked for them."""
+    entry = {
+        "timestamp": datetime.now().isoformat(),
+        "source_ip": ip,
+        "port": port,
+        "event": event,
+        "status": event.replace("_", " "),
+        "session_id": session_id,
+        **fields,
+    }
+    event_writer.write(entry)
+
+def log_session(text):
+    session_writer.write(text)
+
+HOST = os.environ.get("HONEYPOT_HOST", '0.0.0.0')
+PORT = int(os.environ.get("HONEYPOT_PORT", 2323))
+
+# Session engine limits (all overridable from the environment)
+MAX_CONNECTIONS = int(os.environ.get("HONEYPOT_MAX_CONNECTIONS", 5000))
+BACKLOG = int(os.environ.get("HONEYPOT_BACKLOG", 1024))
+IDLE_TIMEOUT = float(os.environ.get("HONEYPOT_IDLE_TIMEOUT", 60))    # seconds without input
+WRITE_TIMEOUT = float(os.environ.get("HONEYPOT_WRITE_TIMEOUT", 10))  # seconds to drain a reply
+MAX_LINE = 4096  # bytes buffered per command line before we cut it off
+
+# Emulated device (see profiles.json)
+DEVICE_PROFILE = os.environ.get("HONEYPOT_PROFILE", DEFAULT_PROFILE)
+PROFILES_FILE = os.environ.get("HONEYPOT_PROFILES_FILE", PROFILES_FILE)
+
+registry = load_registry(DEVICE_PROFILE, PROFILES_FILE)
+
+# Peer filtering: files with one CIDR per line
+DROP_LIST = os.environ.get("HONEYPOT_DROP_LIST", "")      # disconnected immediately
+IGNORE_LIST = os.environ.get("HONEYPOT_IGNORE_LIST", "")  # served, but not logged (e.g. our own scanners)
+
+peer_lists = {}
+if IGNORE_LIST:
+    peer_lists["ignore"] = load_cidr_file(IGNORE_LIST)
+if DROP_LIST:
+    peer_lists["drop"] = load_cidr_file(DROP_LIST)
+peer_filter = IpClassifier(peer_lists) if peer_lists else None
+
+active_sessions = 0
+
+# Prometheus /metrics listener ("host:port", empty to disable); keep it off the attacker-facing interface
+METRICS_ADDRESS = os.environ.get("HONEYPOT_METRICS", "127.0.0.1:9101")
+# Accept-to-first-byte is socket work, so the buckets start well under a millisecond
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+SESSIONS = counter("honeypot_sessions_total", "Sessions by how they ended", labels=("reason",))
+REJECTED = counter("honeypot_connections_rejected_total", "Connections closed on accept", labels=("reason",))
+COMMANDS = counter("honeypot_commands_total", "Commands received")
+BYTES = counter("honeypot_bytes_total", "Session traffic", labels=("direction",))
+FIRST_BYTE = histogram("honeypot_first_byte_seconds", "Accept to banner sent", buckets=LATENCY_BUCKETS)
+SESSION_SECONDS = histogram("honeypot_session_seconds", "Session duration")
+gauge("honeypot_sessions_open", "Sessions currently open", function=lambda: active_sessions)
+gauge("honeypot_log_queue_depth", "Events waiting in the log writer queue",
+      function=lambda: event_writer.queue.qsize())
+counter("honeypot_log_events_written_total", "Events written to the log (or acked by the collector)",
+        function=lambda: event_writer.written)
+counter("honeypot_log_events_dropped_total", "Events dropped because the log queue was full",
+        function=lambda: event_writer.dropped)
+
+async def read_command(reader):
+    """Read one command line; returns None when the client went away."""
+    buffer = b""
+    while True:
+        chunk = await asyncio.wait_for(reader.read(1024), IDLE_TIMEOUT)
+        if not chunk:
+            return None if not buffer else buffer
+        buffer += chunk
+        if b"\n" in chunk or b"\r" in chunk or len(buffer) >= MAX_LINE:
+            return buffer
+
+async def send(writer, data):
+    writer.write(data)
+    await asyncio.wait_for(writer.drain(), WRITE_TIMEOUT)
+    return len(data)
+
+async def handle_client(reader, writer):
+    global active_sessions
+    accepted = time.monotonic()
+    peer = writer.get_extra_info("peername") or ("unknown", 0)
+    ip = peer[0]
+    peer_class = peer_filter.classify(ip) if peer_filter else None
+
+    if active_sessions >= MAX_CONNECTIONS or peer_class == "drop":
+        # Over capacity or blocked: drop the connection instead of queueing it
+        REJECTED.inc(reason="drop" if peer_class == "drop" else "capacity")
+        writer.close()
+        return
+    logged = peer_class != "ignore"
+
+    active_sessions += 1
+    print(f"[+] Connection from {ip} ({active_sessions} active)")
+
+    session_id = uuid.uuid4().hex
+    started = time.monotonic()
+    bytes_in = bytes_out = commands = 0
+    end_reason = "closed"
 
     # Log connection
-    with open("honeypot_logs.txt", "a") as log_file:
-        log_file.write(f"\n--- New Connection ---\n")
-        log_file.write(f"Time: {datetime.now()}\n")
-        log_file.write(f"IP: {client_address[0]}\n")
-
-    client_socket.sendall(b"Welcome to SmartPlug 1.0\r\nLogin: ")
-
-    while True:
-        try:
-            buffer = b""
-            while True:
-                chunk = client_socket.recv(1024)
-                if not chunk:
-                    break
-                buffer += chunk
-                if b"\n" in chunk or b"\r" in chunk:
-                    break
-
-            command = buffer.decode().strip()
-
-            if command == "help":
-                client_socket.sendall(
-                    b"Available commands: help, status, reboot, exit, ls, cat, ping, version\r\n> "
-                )
-            elif command == "status":
-                client_socket.sendall(
-                    b"Device status: ONLINE, Power: ON, Temperature: 36C\r\n> "
-                )
-            elif command == "reboot":
-                client_socket.sendall(b"Rebooting device...\r\n> ")
-            elif command == "exit":
-                client_socket.sendall(b"Logging out...\r\n")
-                client_socket.close()
+    if logged:
+        log_lifecycle("session_start", ip, PORT, session_id)
+        log_session(f"\n--- New Connection ---\nTime: {datetime.now()}\nIP: {ip}\nSession: {session_id}\n")
+
+    session = registry.new_session()
+    try:
+        bytes_out += await send(writer, registry.banner)
+        FIRST_BYTE.observe(time.monotonic() - accepted)
+
+        while True:
+            buffer = await read_command(reader)
+            if buffer is None:
                 break
-            elif command == "ls":
-                client_socket.sendall(b"config.txt  logs/  firmware.bin\r\n> ")
-            elif command == "cat config.txt":
-                client_socket.sendall(
-                    b"username=admin\npassword=admin123\nwifi_ssid=SmartPlugNet\nwifi_pass=12345678\r\n> "
-                    )
-            elif command == "ping":
-                client_socket.sendall(
-                    b"Pinging 8.8.8.8 with 32 bytes of data...\nReply from 8.8.8.8: bytes=32 time=20ms TTL=54\r\n> "
-                )
-            elif command == "version":
-                client_socket.sendall(b"SmartPlug Firmware v1.2.7 - Build 0425\r\n> ")
-            else:
-                client_socket.sendall(b"Command not recognized\r\n> ")
-
-            buffer = b""
+            bytes_in += len(buffer)
+            commands += 1
+            COMMANDS.inc()
 
-            # Log the command attempt
-            log_event(client_address[0], PORT, command, "command received")
+            command = buffer.decode(errors="replace").strip()
+            reply, close = registry.dispatch(command, session)
+            bytes_out += await send(writer, reply)
 
-            with open("honeypot_logs.txt", "a") as log_file:
-                log_file.write(f"{client_address[0]} > {command}\n")
+            # Log the command attempt
+            if logged:
+                attack_type = classify_command(command)
+                log_event(ip, PORT, command, "command received", session_id, attack_type)
+                log_session(f"{ip} > {command}  [{attack_type}]\n")
 
-            #client_socket.sendall(b"Command not recognized\r\n> ")
-        except Exception as e:
-            print(f"Error: {e}")
-            client_socket.close()
-            break
\ No newline at end of file
+            if close:
+                end_reason = "exit"
+                break
+    except asyncio.TimeoutError:
+        end_reason = "timeout"
+        print(f"[-] Session from {ip} timed out")
+    except (ConnectionError, OSError) as e:
+        end_reason = "error"
+        print(f"Error: {e}")
+    finally:
+        active_sessions -= 1
+        writer.close()
+        SESSIONS.inc(reason=end_reason)
+        SESSION_SECONDS.observe(time.monotonic() - started)
+        BYTES.inc(bytes_in, direction="in")
+        BYTES.inc(bytes_out, direction="out")
+        if logged:
+            log_lifecycle("session_end", ip, PORT, session_id, reason=end_reason, commands=commands,
+                          bytes_in=bytes_in, bytes_out=bytes_out,
+                          duration=round(time.monotonic() - started, 3))
+
+async def serve():
+    server = await asyncio.start_server(handle_client, HOST, PORT, backlog=BACKLOG)
+    print(f"🚨 Fake Telnet device ({registry.name}) running on port {PORT}...")
+    if COLLECTOR:
+        print(f"[+] Streaming events to collector {COLLECTOR} as sensor {SENSOR_ID}")
+    if METRICS_ADDRESS:
+        try:
+            serve_metrics(METRICS_ADDRESS)
+            print(f"[+] Metrics on http://{METRICS_ADDRESS}/metrics")
+        except OSError as e:
+            print(f"[!] Metrics listener on {METRICS_ADDRESS} failed: {e}")
+    async with server:
+        await server.serve_forever()
+
+def main():
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("\n🛑 Honeypot stopped manually.")
+    finally:
+        event_writer.close()
+        session_writer.close()
+        stats = event_writer.stats()
+        print(f"[+] Logged {stats['written']} events ({stats['dropped']} dropped)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import json
+import os
+import queue
+import threading
+import time
+
+# fsync policies
+FSYNC_NEVER = "never"        # leave it to the OS page cache
+FSYNC_BATCH = "batch"        # fsync after every flushed batch
+FSYNC_INTERVAL = "interval"  # fsync at most once per fsync_interval seconds
+
+# sink retry backoff (seconds), and how many retries a batch gets before it is dropped
+# (fewer once the writer is closing); about five minutes of outage with the defaults
+RETRY_BASE = 0.25
+RETRY_MAX = 30.0
+MAX_RETRIES = 14
+CLOSE_RETRIES = 3
+
+class BatchLogWriter:
+    """Queue-backed log writer that appends lines to a file in batches.
+
+    Producers call ``write()`` which never blocks: records go onto a bounded
+    queue and a background thread serializes and flushes them when either
+    ``batch_size`` records are pending or ``flush_interval`` seconds passed.
+    When the queue is full the record is dropped and counted instead.
+    Dict records are written as one JSON object per line.
+
+    With a ``sink`` (e.g. a collector client) batches go to
+    ``sink.send(lines)`` instead of the file, retried with backoff until
+    they are acknowledged or MAX_RETRIES is used up (then the batch is
+    dropped with ``sink.discard()``); ``sink.dropped`` is kept up to date
+    so the receiving end can see what the writer had to drop.
+
+    With a ``roller`` (log_segments.SegmentRoller) the file is rolled into a
+    sealed segment between batches once it is big or old enough.
+    """
+
+    def __init__(self, path, max_queue=100000, batch_size=512, flush_interval=0.5,
+                 fsync=FSYNC_INTERVAL, fsync_interval=5.0, sink=None,
+                 roller=None):
+        if fsync not in (FSYNC_NEVER, FSYNC_BATCH, FSYNC_INTERVAL):
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.sink = sink
+        self.roller = roller
+        self._stop = threading.Event()
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.written = 0
+        self.dropped = 0  # bumped by producers and by the writer thread, under _dropped_lock
+        self._dropped_lock = threading.Lock()
+        self.batches = 0
+        self.max_depth = 0
+
+        if sink is None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name=f"log-writer:{os.path.basename(path)}",
+                                        daemon=True)
+        self._thread.start()
+
+    def write(self, record):
+        """Enqueue a record (dict or str); returns False if it was dropped."""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._count_dropped(1)
+            return False
+        depth = self.queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    def _count_dropped(self, n):
+        with self._dropped_lock:
+            self.dropped += n
+
+    def stats(self):
+        return {
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "queue_depth": self.queue.qsize(),
+            "max_queue_depth": self.max_depth,
+        }
+
+    def close(self, timeout=10.0):
+        """Flush everything still queued and stop the writer thread (waits at most ``timeout``)."""
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _format(self, record):
+        if isinstance(record, dict):
+            return json.dumps(record) + "\n"
+        return record if record.endswith("\n") else record + "\n"
+
+    def _batches(self):
+        """Yield batches of queued records until close() is called and the queue is drained."""
+        while True:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    # Once closing, take what is queued without waiting for more
+                    record = self.queue.get(timeout=remaining) if remaining > 0 and not self._stop.is_set() \
+                        else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(record)
+            if batch:
+                yield batch
+            elif self._stop.is_set():
+                return
+
+    def _deliver(self, lines):
+        """Hand one batch to the sink, retrying until it is acknowledged or out of retries."""
+        attempt = 0
+        while True:
+            self.sink.dropped = self.dropped
+            try:
+                # The sink keeps an unacknowledged batch; a retry only has to flush it
+                self.sink.send(lines if attempt == 0 else [])
+            except OSError as e:
+                if attempt == 0:
+                    print(f"[!] Log sink unavailable ({e}); retrying")
+                attempt += 1
+                if attempt > (CLOSE_RETRIES if self._stop.is_set() else MAX_RETRIES):
+                    self.sink.discard()
+                    print(f"[!] Log sink still unavailable after {attempt - 1} retries; dropping {len(lines)} events")
+                    self._count_dropped(len(lines))
+                    return
+                time.sleep(min(RETRY_MAX, RETRY_BASE * 2 ** attempt))
+                continue
+            if attempt:
+                print(f"[+] Log sink back after {attempt} retries")
+            self.written += len(lines)
+            self.batches += 1
+            return
+
+    def _run(self):
+        if self.sink is not None:
+            for batch in self._batches():
+                self._deliver([self._format(r) for r in batch])
+            self.sink.close()
+            return
+
+        last_sync = time.monotonic()
+        if self.roller:
+            self.roller.opened(self.path)
+        f = open(self.path, "a", encoding="utf-8")
+        try:
+            for batch in self._batches():
+                f.write("".join(self._format(r) for r in batch))
+                f.flush()
+                self.written += len(batch)
+                self.batches += 1
+
+                now = time.monotonic()
+                if self.fsync == FSYNC_BATCH or (
+                        self.fsync == FSYNC_INTERVAL and now - last_sync >= self.fsync_interval):
+                    os.fsync(f.fileno())
+                    last_sync = now
+
+                if self.roller and self.roller.due(os.fstat(f.fileno()).st_size):
+                    if self.fsync != FSYNC_NEVER:
+                        os.fsync(f.fileno())
+                    f.close()
+                    self.roller.roll(self.path)
+                    f = open(self.path, "a", encoding="utf-8")
+                    self.roller.opened(self.path)
+
+            if self.fsync != FSYNC_NEVER:
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            f.close()
+            if self.roller:
+                self.roller.close()